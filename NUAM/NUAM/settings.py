@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,11 +42,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'Prototipo.instrumentacion.InstrumentacionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'Prototipo.middleware.RolMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -62,6 +65,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'Prototipo.notificaciones.contexto',
             ],
         },
     },
@@ -84,6 +88,16 @@ DATABASES = {
     }
 }
 
+# Desarrollo local sin PostgreSQL: NUAM_DB=sqlite usa db.sqlite3
+# (la búsqueda de texto usa FTS5 en vez de tsvector/GIN, ver Prototipo/busqueda.py)
+if os.environ.get('NUAM_DB') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -121,6 +135,10 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Archivos subidos (cargas masivas)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -131,4 +149,75 @@ AUTH_USER_MODEL = 'Prototipo.UsuarioFinal'
 
 LOGIN_URL = '/inicioSesion/'
 LOGIN_REDIRECT_URL = '/home/'
-LOGOUT_REDIRECT_URL = '/inicioSesion/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/inicioSesion/'
+
+
+# Cargas masivas en segundo plano (ver Prototipo/tareas.py)
+# Si CARGAS_EN_PROCESO es False, las cargas quedan 'Pendiente' hasta que
+# las tome el comando `python manage.py procesar_cargas`.
+CARGAS_EN_PROCESO = True
+CARGAS_HILOS = 2
+
+# Almacenamiento del vector de factores de cada Calificacion (ver Prototipo/factores.py):
+# 'eav' = una fila Factor por factor, 'columnar' = una fila FactoresCalificacion por calificación.
+# Para cambiarlo con datos existentes: `python manage.py migrar_factores --desde eav --hacia columnar`
+FACTORES_ALMACENAMIENTO = 'eav'
+
+# Cálculo de factores en la carga masiva (ver Prototipo/calculo_factores.py):
+# 'auto' usa NumPy si está instalado, 'numpy' lo exige, 'python' no lo usa.
+FACTORES_MOTOR = 'auto'
+FACTORES_VERIFICAR = False  # True: cada lote se compara además con la referencia Decimal exacta
+
+# Registro de auditoría asíncrono (ver Prototipo/auditoria.py)
+# Las entradas se anotan en un spool local y se graban por lotes en segundo plano.
+AUDITORIA_ASINCRONA = True
+AUDITORIA_SPOOL_DIR = BASE_DIR / 'auditoria_spool'
+AUDITORIA_TAMANO_LOTE = 500
+AUDITORIA_INTERVALO = 1.0  # segundos entre grabaciones
+AUDITORIA_FSYNC = False    # True: fsync por entrada (sobrevive a cortes de energía, más lento)
+
+# Retención del registro de auditoría (ver Prototipo/retencion_logs.py y el comando archivar_logs)
+# Los meses anteriores a los últimos LOGS_RETENCION_MESES se mueven a archivos comprimidos.
+LOGS_ARCHIVO_DIR = BASE_DIR / 'archivo_logs'
+LOGS_RETENCION_MESES = 12
+LOGS_PARTICIONES_ADELANTE = 2  # PostgreSQL: particiones mensuales creadas por adelantado
+
+# Caché de roles por usuario (ver Prototipo/roles.py)
+ROLES_CACHE_SEGUNDOS = 300
+ROLES_CACHE_MAXIMO = 10000
+
+# Consultas SQL y latencia por vista (ver Prototipo/instrumentacion.py)
+INSTRUMENTACION_ACTIVA = DEBUG
+INSTRUMENTACION_ESTRICTA = False  # True: exceder @presupuesto_consultas lanza una excepción (pruebas)
+
+# Caché de fragmentos de los paneles y del detalle de calificaciones (ver Prototipo/cache_vistas.py)
+# Por defecto en memoria del proceso; NUAM_CACHE=archivo la guarda en BASE_DIR / 'cache_vistas',
+# compartida por todos los procesos (necesario con varios workers: cada uno ve las invalidaciones de los demás).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'vistas': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'nuam-vistas',
+        'KEY_PREFIX': 'nuam',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+if os.environ.get('NUAM_CACHE') == 'archivo':
+    CACHES['vistas'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache_vistas',
+        'KEY_PREFIX': 'nuam',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+CACHE_VISTAS_ALIAS = 'vistas'
+CACHE_VISTAS_SEGUNDOS = 600
+CACHE_VISTAS_ACTIVA = True
+
+# Contador de notificaciones no leídas por usuario (ver Prototipo/notificaciones.py).
+# Solo se usa si el backend es compartido entre procesos (NUAM_CACHE=archivo, Memcached,
+# Redis): con memoria local cada proceso tendría su propio contador, y la insignia se
+# cuenta en la base en cada petición con el índice (usuario, leida).
+NOTIFICACIONES_CACHE_ALIAS = 'vistas'
+NOTIFICACIONES_CONTADOR_SEGUNDOS = 300
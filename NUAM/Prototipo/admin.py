@@ -64,7 +64,7 @@ class NotificacionAdmin(admin.ModelAdmin):
 @admin.register(ArchivoCarga)
 class ArchivoCargaAdmin(admin.ModelAdmin):
     # 'id' (PK) y 'cargado_por' (FK)
-    list_display = ('id', 'nombre', 'cargado_por', 'fecha_carga', 'estado') 
+    list_display = ('id', 'nombre', 'cargado_por', 'fecha_carga', 'estado', 'filas_procesadas', 'filas_fallidas') 
     list_filter = ('estado', 'fecha_carga')
     search_fields = ('nombre', 'cargado_por__email')
     # Usa 'cargado_por', no 'id_usuario'
@@ -100,6 +100,16 @@ class LogAdmin(admin.ModelAdmin):
     search_fields = ('accion', 'usuario__email', 'detalle_cambio')
     # No necesita raw_id_fields si no lo usas, pero si lo hicieras sería ('usuario',)
 
+    # Solo lectura: cada entrada está encadenada por hash a la anterior (ver cadena_logs.py)
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
 # ----------------------------------------------------------------------
 # --- 3. REGISTRO FINAL DE USUARIO (Reemplazando el default) ---
@@ -0,0 +1,167 @@
+"""
+API JSON de solo lectura de calificaciones (vista api_calificaciones).
+
+- Filtros exactos: mercado, años, estado, instrumento.
+- `campos`: lista separada por comas de CAMPOS (por omisión, todos). Solo se
+  leen las columnas pedidas, y los factores solo si se piden.
+- Paginación por cursor sobre id (ver paginacion.py): `cursor` y `tamano`
+  (a lo más TAMANO_MAXIMO). Un cursor que no se puede leer es un error (400),
+  no la primera página: el cliente no debe volver a recorrer todo sin saberlo.
+- ETag fuerte calculado de los (id, version) de la página: toda escritura de
+  una calificación incrementa su versión, y altas y bajas cambian los ids.
+  Un sondeo que repite el ETag en If-None-Match recibe 304 tras una sola
+  consulta (ids y versiones, con el índice de la clave primaria), sin leer
+  las filas completas ni serializar.
+- Las filas se leen con values_list y se escriben con formateadores
+  compilados una vez por conjunto de campos (ver serializacion.py).
+- La respuesta va comprimida con gzip si el cliente lo acepta. Cada
+  codificación tiene su propio ETag (sufijo -gz), como exige un ETag fuerte.
+"""
+import functools
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.http import parse_etags
+
+from .factores import leer_factores_lote
+from .models import Calificacion
+from .paginacion import decodificar_cursor, paginar
+from .serializacion import arreglo_json, compilar_objeto, formateadores_json, json_decimal, valor_json
+from .utils import NOMBRES_FACTORES
+
+# Se incrementa si cambia la forma de la respuesta: invalida los ETag ya entregados
+FORMATO = 1
+TAMANO_PAGINA = 100
+TAMANO_MAXIMO = 1000
+FACTORES = 'factores'
+CAMPOS = (
+    'id', 'mercado', 'instrumento', 'años', 'fecha_pago', 'secuencia_evento', 'evento_capital',
+    'descripcion', 'valor_historico', 'estado', 'origen', 'fecha_creacion', 'version',
+    'usuario_creador', 'archivo_carga', FACTORES,
+)
+# Parámetro -> (campo, tipo)
+FILTROS = {
+    'mercado': ('mercado', str),
+    'años': ('años', int),
+    'estado': ('estado', str),
+    'instrumento': ('instrumento', str),
+}
+
+
+class ConsultaInvalida(ValueError):
+    """Un parámetro de la consulta no es válido."""
+
+
+def consulta_desde(datos):
+    """
+    Filtros, campos y tamaño de página a partir de un QueryDict (GET). Valida
+    también el cursor (que Pagina recibe tal cual). Lanza ConsultaInvalida.
+    """
+    filtros = {}
+    for parametro, (campo, tipo) in FILTROS.items():
+        valor = (datos.get(parametro) or '').strip()
+        if valor:
+            try:
+                filtros[campo] = tipo(valor)
+            except ValueError:
+                raise ConsultaInvalida(f'El valor de {parametro} no es válido.')
+
+    campos = CAMPOS
+    if datos.get('campos'):
+        pedidos = [campo.strip() for campo in datos['campos'].split(',') if campo.strip()]
+        desconocidos = [campo for campo in pedidos if campo not in CAMPOS]
+        if desconocidos or not pedidos:
+            raise ConsultaInvalida(f"Campos no válidos: {', '.join(desconocidos) or '(vacío)'}. Use: {', '.join(CAMPOS)}.")
+        # En el orden de CAMPOS: el mismo conjunto da siempre la misma respuesta (y el mismo ETag)
+        campos = tuple(campo for campo in CAMPOS if campo in pedidos)
+
+    try:
+        tamano = int(datos.get('tamano') or TAMANO_PAGINA)
+    except ValueError:
+        raise ConsultaInvalida('El tamaño de página no es válido.')
+    if not 1 <= tamano <= TAMANO_MAXIMO:
+        raise ConsultaInvalida(f'El tamaño de página debe estar entre 1 y {TAMANO_MAXIMO}.')
+
+    # paginar ignora un cursor inválido (los paneles vuelven a la primera página); la API no
+    if datos.get('cursor'):
+        valores = decodificar_cursor(datos['cursor'], 1)
+        if valores is None or type(valores[0]) is not int:
+            raise ConsultaInvalida('El cursor no es válido.')
+    return filtros, campos, tamano
+
+
+def _etag(clave, versiones, hay_siguiente):
+    contenido = json.dumps([FORMATO, clave, versiones, hay_siguiente], cls=DjangoJSONEncoder, separators=(',', ':'))
+    return hashlib.blake2b(contenido.encode(), digest_size=16).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _formateador(campos):
+    """
+    Función (id, version, *columnas, vector) -> objeto JSON con `campos`, en
+    ese orden. Las columnas leídas son las de `campos` salvo id, version y factores.
+    """
+    leidas = ['id', 'version'] + [campo for campo in campos if campo not in ('id', 'version', FACTORES)]
+    sin_factores = [campo for campo in campos if campo != FACTORES]
+    indices = [leidas.index(campo) for campo in sin_factores]
+    formateadores = formateadores_json(Calificacion, sin_factores)
+    if FACTORES in campos:
+        indices.append(len(leidas))
+        formateadores.append(compilar_objeto(NOMBRES_FACTORES, [json_decimal] * len(NOMBRES_FACTORES)))
+    return compilar_objeto(campos, formateadores, indices)
+
+
+class Pagina:
+    """
+    Una página de la API. `etag` se conoce tras `buscar` (una consulta);
+    `cuerpo` lee las filas y serializa solo cuando hace falta.
+    """
+
+    def __init__(self, calificaciones, filtros, campos, tamano, cursor, clave):
+        self.calificaciones = calificaciones.filter(**filtros)
+        self.campos = campos
+        self.tamano = tamano
+        self.cursor = cursor
+        # Todo lo que distingue una respuesta de otra con las mismas filas
+        self.clave = [clave, sorted(filtros.items()), campos, tamano, cursor or '']
+
+    def buscar(self):
+        filas, self.siguiente = paginar(self.calificaciones.only('id', 'version'), ('id',), self.cursor, self.tamano)
+        self.versiones = [(fila.id, fila.version) for fila in filas]
+        self.etag = _etag(self.clave, self.versiones, self.siguiente is not None)
+        return self
+
+    def cuerpo(self, url_siguiente):
+        columnas = [campo for campo in self.campos if campo not in ('id', 'version', FACTORES)]
+        filas = list(
+            self.calificaciones.filter(pk__in=[pk for pk, _ in self.versiones]).order_by('id')
+            .values_list('id', 'version', *columnas)
+        )
+        if FACTORES in self.campos:
+            vectores = leer_factores_lote([fila[0] for fila in filas])
+            filas = [(*fila, vectores[fila[0]]) for fila in filas]
+        # Si una fila cambió entre ambas consultas, el ETag describe lo que se envía
+        self.etag = _etag(self.clave, [fila[:2] for fila in filas], self.siguiente is not None)
+        resultados = arreglo_json(filas, _formateador(self.campos))
+        return f'{{"resultados":{resultados},"siguiente":{valor_json(url_siguiente)}}}'.encode('utf-8')
+
+
+def acepta_gzip(request):
+    return 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+
+
+def etag_http(etag, gzip):
+    return f'"{etag}-gz"' if gzip else f'"{etag}"'
+
+
+def coincide(request, etag):
+    """
+    True si If-None-Match trae el ETag de la página, en cualquiera de sus
+    codificaciones (If-None-Match compara en forma débil: un proxy puede haberlo marcado W/).
+    """
+    pedidos = {
+        pedido[2:] if pedido.startswith('W/') else pedido
+        for pedido in parse_etags(request.headers.get('If-None-Match', ''))
+    }
+    return '*' in pedidos or etag_http(etag, False) in pedidos or etag_http(etag, True) in pedidos
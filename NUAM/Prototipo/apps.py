@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class PrototipoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Prototipo'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .busqueda import al_migrar
+        # SQLite pierde los triggers FTS5 cuando una migración recrea la tabla
+        post_migrate.connect(al_migrar, sender=self)
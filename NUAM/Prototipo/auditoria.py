@@ -0,0 +1,247 @@
+"""
+Registro de auditoría asíncrono y por lotes.
+
+Las vistas llaman a `registrar_log(...)` con los mismos argumentos que
+`Log.objects.create(...)`, pero la entrada no se inserta en la petición:
+
+1. Se agrega a un archivo spool (JSONL, solo anexar) del proceso, para que
+   nada se pierda si el proceso muere antes de grabarla.
+2. Se acumula en memoria y un hilo escritor la graba junto con las demás en
+   un solo bulk_create cada AUDITORIA_INTERVALO segundos (o antes, si se
+   juntan AUDITORIA_TAMANO_LOTE entradas).
+3. Al terminar el proceso (atexit) se graba lo pendiente.
+
+Si la base de datos falla, el lote queda en disco y se reintenta. Los spools
+de procesos que murieron se recuperan cuando arranca el siguiente escritor.
+La entrega es "al menos una vez": tras una caída a mitad de un lote, ese lote
+puede quedar grabado dos veces, nunca cero.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import cache_vistas, cadena_logs
+from .models import Log, UsuarioFinal
+
+logger = logging.getLogger(__name__)
+
+PREFIJO_SPOOL = 'auditoria-'
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _insertar(entradas):
+    """Un bulk_create encadenado para todo el lote. Usuarios borrados mientras tanto quedan en NULL (SET_NULL)."""
+    ids_usuario = {e['usuario_id'] for e in entradas if e['usuario_id'] is not None}
+    existentes = set(UsuarioFinal.objects.filter(pk__in=ids_usuario).values_list('pk', flat=True))
+    # Encadenadas al final de la cadena de hashes de su mes (ver cadena_logs.py)
+    cadena_logs.insertar(
+        Log(
+            usuario_id=e['usuario_id'] if e['usuario_id'] in existentes else None,
+            accion=e['accion'],
+            fecha_hora=parse_datetime(e['fecha_hora']),
+            detalle_cambio=e['detalle_cambio'],
+        )
+        for e in entradas
+    )
+    cache_vistas.invalidar(cache_vistas.LOGS)
+
+
+def _leer_spool(ruta):
+    with open(ruta, encoding='utf-8') as archivo:
+        return [json.loads(linea) for linea in archivo if linea.strip()]
+
+
+class EscritorAuditoria:
+
+    def __init__(self):
+        self._pid = None
+
+    # --- CONFIGURACIÓN Y ESTADO POR PROCESO ---
+
+    def _preparar(self):
+        """Inicializa el estado del proceso actual (también tras un fork)."""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self.directorio = str(getattr(settings, 'AUDITORIA_SPOOL_DIR', settings.BASE_DIR / 'auditoria_spool'))
+        self.tamano_lote = getattr(settings, 'AUDITORIA_TAMANO_LOTE', 500)
+        self.intervalo = getattr(settings, 'AUDITORIA_INTERVALO', 1.0)
+        self.fsync = getattr(settings, 'AUDITORIA_FSYNC', False)
+        self.ruta_spool = os.path.join(self.directorio, f'{PREFIJO_SPOOL}{self._pid}.jsonl')
+        self._candado = threading.Lock()
+        self._hay_datos = threading.Event()
+        self._pendientes = []
+        self._spool = None
+        self._numero_lote = 0
+        self._detenido = False
+        self._hay_fallidos = False
+        self._hilo = None
+        os.makedirs(self.directorio, exist_ok=True)
+
+    def _iniciar_hilo(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name='auditoria', daemon=True)
+            self._hilo.start()
+            atexit.register(self.detener)
+
+    # --- API ---
+
+    def registrar(self, usuario_id, accion, detalle_cambio, fecha_hora=None):
+        self.registrar_varias(usuario_id, accion, [detalle_cambio], fecha_hora)
+
+    def registrar_varias(self, usuario_id, accion, detalles, fecha_hora=None):
+        """Una entrada por detalle, con una sola escritura al spool."""
+        self._preparar()
+        fecha_hora = (fecha_hora or timezone.now()).isoformat()
+        entradas = [
+            {'usuario_id': usuario_id, 'accion': accion, 'fecha_hora': fecha_hora, 'detalle_cambio': detalle}
+            for detalle in detalles
+        ]
+        lineas = ''.join(json.dumps(entrada, ensure_ascii=False) + '\n' for entrada in entradas)
+
+        with self._candado:
+            if self._spool is None:
+                self._spool = open(self.ruta_spool, 'a', encoding='utf-8')
+            self._spool.write(lineas)
+            self._spool.flush()
+            if self.fsync:
+                os.fsync(self._spool.fileno())
+            self._pendientes.extend(entradas)
+            lleno = len(self._pendientes) >= self.tamano_lote
+            self._iniciar_hilo()
+
+        if lleno:
+            self._hay_datos.set()
+
+    def vaciar(self):
+        """Graba en la base de datos todo lo acumulado. Retorna cuántas entradas se grabaron."""
+        self._preparar()
+        with self._candado:
+            if not self._pendientes:
+                return 0
+            pendientes, self._pendientes = self._pendientes, []
+            # Lo ya tomado pasa a un archivo de lote propio hasta que el INSERT confirme
+            self._spool.close()
+            self._spool = None
+            ruta_lote = self._nueva_ruta_lote()
+            os.replace(self.ruta_spool, ruta_lote)
+
+        try:
+            _insertar(pendientes)
+        except Exception:
+            logger.exception('No se pudo grabar un lote de auditoría; queda en %s para reintentar', ruta_lote)
+            self._hay_fallidos = True
+            return 0
+        os.remove(ruta_lote)
+        return len(pendientes)
+
+    def _nueva_ruta_lote(self):
+        self._numero_lote += 1
+        return f'{self.ruta_spool}.{self._numero_lote}'
+
+    def recuperar(self):
+        """Graba los spools huérfanos (procesos muertos) y los lotes propios que fallaron antes."""
+        self._preparar()
+        self._hay_fallidos = False
+        recuperadas = 0
+        for ruta in sorted(glob.glob(os.path.join(self.directorio, f'{PREFIJO_SPOOL}*.jsonl*'))):
+            pid = int(os.path.basename(ruta)[len(PREFIJO_SPOOL):].split('.')[0])
+            if ruta == self.ruta_spool:
+                continue
+            if pid != self._pid:
+                if _proceso_vivo(pid):
+                    continue
+                # Se adopta el archivo con un rename atómico: otro proceso no lo grabará también
+                with self._candado:
+                    propia = self._nueva_ruta_lote()
+                try:
+                    os.rename(ruta, propia)
+                except FileNotFoundError:
+                    continue
+                ruta = propia
+            try:
+                entradas = _leer_spool(ruta)
+                if entradas:
+                    _insertar(entradas)
+                os.remove(ruta)
+                recuperadas += len(entradas)
+            except Exception:
+                logger.exception('No se pudo recuperar el spool de auditoría %s', ruta)
+                self._hay_fallidos = True
+        return recuperadas
+
+    def detener(self):
+        """Gancho de cierre: graba lo pendiente antes de que termine el proceso."""
+        if self._pid != os.getpid():
+            return
+        self._detenido = True
+        self._hay_datos.set()
+        self.vaciar()
+
+    def _bucle(self):
+        self.recuperar()
+        while not self._detenido:
+            self._hay_datos.wait(self.intervalo)
+            self._hay_datos.clear()
+            close_old_connections()
+            self.vaciar()
+            if self._hay_fallidos:
+                self.recuperar()
+
+
+escritor = EscritorAuditoria()
+
+
+def registrar_log(usuario, accion, detalle_cambio):
+    """
+    Reemplazo de Log.objects.create(usuario=..., accion=..., detalle_cambio=...).
+    Dentro de una transacción, la entrada se encola solo si la transacción confirma.
+    Con AUDITORIA_ASINCRONA = False se inserta de inmediato, dentro de la
+    petición: 4 a 5 consultas más por entrada (ver cadena_logs.insertar), que
+    los @presupuesto_consultas no cuentan. Las pruebas usan el modo
+    asíncrono: en un TestCase la transacción no confirma y nada se encola; las
+    de auditoría ejecutan los on_commit y llaman a escritor.vaciar().
+    """
+    if not getattr(settings, 'AUDITORIA_ASINCRONA', True):
+        cadena_logs.insertar([Log(usuario=usuario, accion=accion, detalle_cambio=detalle_cambio)])
+        cache_vistas.invalidar(cache_vistas.LOGS)
+        return
+
+    usuario_id = getattr(usuario, 'pk', usuario)
+    fecha_hora = timezone.now()
+    transaction.on_commit(lambda: escritor.registrar(usuario_id, accion, detalle_cambio, fecha_hora))
+
+
+def registrar_logs(usuario, accion, detalles):
+    """
+    Varias entradas del mismo usuario y acción (operaciones por lote): una por
+    detalle, encoladas juntas; sin AUDITORIA_ASINCRONA, un solo bulk_create.
+    """
+    if not detalles:
+        return
+    if not getattr(settings, 'AUDITORIA_ASINCRONA', True):
+        cadena_logs.insertar(Log(usuario=usuario, accion=accion, detalle_cambio=detalle) for detalle in detalles)
+        cache_vistas.invalidar(cache_vistas.LOGS)
+        return
+
+    usuario_id = getattr(usuario, 'pk', usuario)
+    fecha_hora = timezone.now()
+    detalles = list(detalles)
+    transaction.on_commit(lambda: escritor.registrar_varias(usuario_id, accion, detalles, fecha_hora))
@@ -0,0 +1,177 @@
+"""
+Búsqueda de texto completo sobre calificaciones y logs.
+
+Los índices viven en la propia base de datos (migración 0008), de modo que
+cada INSERT/UPDATE, incluidos los bulk_create de la carga masiva, los
+mantiene al día sin código en las vistas:
+
+- PostgreSQL: columna generada `busqueda` (tsvector, diccionario 'spanish')
+  con índice GIN, y un índice de trigramas (pg_trgm) como respaldo para
+  códigos parciales o mal escritos (nemotécnico, detalle del log).
+- SQLite (desarrollo local): tablas FTS5 de contenido externo sincronizadas
+  por triggers.
+
+Las funciones `buscar_*` filtran el queryset y agregan la anotación `rango`
+(mayor = más relevante), para paginar por cursor con ORDEN_RELEVANCIA.
+
+También encuentran las filas del corredor o usuario cuyo nombre contiene el
+texto. El nombre no está en el índice (es de otra tabla): se agrega como
+`usuario_id IN (SELECT id FROM usuarios WHERE nombre LIKE ...)`, una
+subconsulta sobre la tabla de usuarios, que es chica, resuelta con el
+índice de la clave foránea. Esas filas tienen rango 0 si solo coincide el nombre.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import UsuarioFinal
+
+ORDEN_RELEVANCIA = ('-rango', '-id')
+PATRON_PALABRA = re.compile(r'\w+')
+
+# Columnas indexadas por tabla y su peso en el ranking (mismo orden que la tabla FTS5)
+INDICES = {
+    'Prototipo_calificacion': {
+        'columnas': (('instrumento', 10.0), ('mercado', 5.0), ('evento_capital', 5.0), ('descripcion', 2.0), ('estado', 1.0)),
+        'trigramas': 'instrumento',
+        'usuario': 'usuario_creador',
+    },
+    'Prototipo_log': {
+        'columnas': (('accion', 5.0), ('detalle_cambio', 2.0)),
+        'trigramas': 'detalle_cambio',
+        'usuario': 'usuario',
+    },
+}
+
+
+# --- ÍNDICES FTS5 (SQLITE) ---
+
+def _sql_fts5(tabla):
+    """Sentencias idempotentes que crean la tabla FTS5 de `tabla` y sus triggers."""
+    fts = f'{tabla}_fts'
+    columnas = [columna for columna, _ in INDICES[tabla]['columnas']]
+    lista = ', '.join(columnas)
+    nuevos = ', '.join(f'new.{c}' for c in columnas)
+    viejos = ', '.join(f'old.{c}' for c in columnas)
+    return [
+        f'''CREATE VIRTUAL TABLE IF NOT EXISTS "{fts}" USING fts5(
+            {lista}, content='{tabla}', content_rowid='id', prefix='2 3 4',
+            tokenize='unicode61 remove_diacritics 2')''',
+        f'''CREATE TRIGGER IF NOT EXISTS "{fts}_ai" AFTER INSERT ON "{tabla}" BEGIN
+            INSERT INTO "{fts}"(rowid, {lista}) VALUES (new.id, {nuevos});
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS "{fts}_ad" AFTER DELETE ON "{tabla}" BEGIN
+            INSERT INTO "{fts}"("{fts}", rowid, {lista}) VALUES ('delete', old.id, {viejos});
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS "{fts}_au" AFTER UPDATE ON "{tabla}" BEGIN
+            INSERT INTO "{fts}"("{fts}", rowid, {lista}) VALUES ('delete', old.id, {viejos});
+            INSERT INTO "{fts}"(rowid, {lista}) VALUES (new.id, {nuevos});
+        END''',
+    ]
+
+
+def instalar_fts5(connection):
+    """
+    Crea (si faltan) las tablas FTS5 y sus triggers, y reconstruye el índice
+    cuando algún trigger no existía. Se llama desde la migración y tras cada
+    `migrate`, porque SQLite recrea la tabla al alterarla y pierde los triggers.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for tabla in INDICES:
+            fts = f'{tabla}_fts'
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s AND name LIKE %s",
+                [tabla, f'{fts}_%']
+            )
+            completo = cursor.fetchone()[0] == 3
+            for sentencia in _sql_fts5(tabla):
+                cursor.execute(sentencia)
+            if not completo:
+                cursor.execute(f'''INSERT INTO "{fts}"("{fts}") VALUES ('rebuild')''')
+
+
+def desinstalar_fts5(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for tabla in INDICES:
+            fts = f'{tabla}_fts'
+            for sufijo in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS "{fts}_{sufijo}"')
+            cursor.execute(f'DROP TABLE IF EXISTS "{fts}"')
+
+
+def al_migrar(sender, using='default', **kwargs):
+    """Receptor de post_migrate (ver apps.py)."""
+    tablas = connections[using].introspection.table_names()
+    if all(tabla in tablas for tabla in INDICES):
+        instalar_fts5(connections[using])
+
+
+# --- CONSULTAS ---
+
+def _patron_like(texto):
+    escapado = texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escapado}%'
+
+
+def _buscar(queryset, texto):
+    palabras = PATRON_PALABRA.findall(texto or '')
+    if not palabras:
+        return queryset.none()
+
+    tabla = queryset.model._meta.db_table
+    indice = INDICES[tabla]
+    trigramas = f'"{tabla}"."{indice["trigramas"]}"'
+    vendor = connections[queryset.db].vendor
+    por_nombre = Q(**{f'{indice["usuario"]}__in': UsuarioFinal.objects.filter(nombre__icontains=texto).values('pk')})
+    texto = texto.strip()
+
+    if vendor == 'postgresql':
+        # Prefijos: 'bsan' encuentra 'BSANTANDER'
+        consulta = ' & '.join(f'{palabra}:*' for palabra in palabras)
+        coincide = RawSQL(
+            f'''("{tabla}"."busqueda" @@ to_tsquery('spanish', %s) OR {trigramas} ILIKE %s)''',
+            [consulta, _patron_like(texto)], output_field=BooleanField()
+        )
+        rango = RawSQL(
+            f'''(ts_rank("{tabla}"."busqueda", to_tsquery('spanish', %s)) + similarity({trigramas}, %s))::float8''',
+            [consulta, texto], output_field=FloatField()
+        )
+    elif vendor == 'sqlite':
+        fts = f'{tabla}_fts'
+        consulta = ' '.join(f'"{palabra}"*' for palabra in palabras)
+        pesos = ', '.join(str(peso) for _, peso in indice['columnas'])
+        coincide = RawSQL(
+            f'''("{tabla}"."id" IN (SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH %s) OR {trigramas} LIKE %s ESCAPE '\\')''',
+            [consulta, _patron_like(texto)], output_field=BooleanField()
+        )
+        # bm25 es menor mientras más relevante: se invierte el signo
+        rango = RawSQL(
+            f'''COALESCE((SELECT -bm25("{fts}", {pesos}) FROM "{fts}" WHERE "{fts}" MATCH %s AND rowid = "{tabla}"."id"), 0.0)''',
+            [consulta], output_field=FloatField()
+        )
+    else:
+        condicion = Q()
+        for columna, _ in indice['columnas']:
+            condicion |= Q(**{f'{columna}__icontains': texto})
+        return queryset.filter(condicion | por_nombre).annotate(rango=Value(0.0, output_field=FloatField()))
+
+    return queryset.filter(Q(coincide) | por_nombre).annotate(rango=rango)
+
+
+def buscar_calificaciones(queryset, texto):
+    """
+    Calificaciones que coinciden con `texto` en instrumento, mercado, evento
+    de capital, descripción o estado, o en el nombre del corredor.
+    """
+    return _buscar(queryset, texto)
+
+
+def buscar_logs(queryset, texto):
+    """Logs que coinciden con `texto` en la acción, el detalle del cambio o el nombre del usuario."""
+    return _buscar(queryset, texto)
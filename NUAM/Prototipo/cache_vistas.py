@@ -0,0 +1,142 @@
+"""
+Caché de fragmentos HTML de los paneles y del detalle de calificaciones.
+
+Cada fragmento se guarda bajo una clave que combina:
+
+- el nombre del fragmento, el rol y los parámetros de la vista (filtros,
+  cursores) o la versión de la fila (Calificacion.version),
+- la "generación" actual de cada dato del que depende: 'calificaciones',
+  'logs', 'usuarios' o una calificación puntual ('calificacion:<pk>').
+
+Invalidar un dato es darle una generación nueva: las claves que la usaban
+dejan de pedirse y el backend las descarta al vencer. Así se invalida
+exactamente lo que depende del dato sin borrar por patrón (ningún backend
+de Django lo permite). Las generaciones son marcas de tiempo en
+nanosegundos: si una se pierde (desalojo, reinicio) la nueva nunca repite
+una anterior.
+
+Las invalidaciones se aplican al confirmar la transacción: hasta entonces
+los demás siguen leyendo los datos viejos, que son los que están en caché.
+
+Quién invalida:
+
+- signals.py: save()/delete() de Calificacion, Factor, FactoresCalificacion,
+  Log, UsuarioFinal y Rol.
+- resumen.py: toda operación masiva que mueve los contadores (carga,
+  revisión, datos sintéticos) cambia también los listados.
+- auditoria.py, sinteticos.py y retencion_logs.py: inserciones y borrados
+  masivos de Log.
+- Los caminos masivos de factores (carga, edición) incrementan
+  Calificacion.version, que es parte de la clave del detalle.
+
+El backend es CACHES[CACHE_VISTAS_ALIAS] (ver settings.py). Con memoria
+local cada proceso tiene su propia caché y solo ve sus invalidaciones: con
+varios procesos use el backend de archivos.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+# Dependencias globales; las de una fila se arman con `de_calificacion`
+CALIFICACIONES = 'calificaciones'
+LOGS = 'logs'
+USUARIOS = 'usuarios'
+
+# Los fragmentos se comparten entre usuarios: {% csrf_token %} deja esta marca
+# y `fragmento` la reemplaza por el token de cada petición
+MARCA_CSRF = 'nuam-marca-csrf-8f3c2a'
+
+
+def de_calificacion(pk):
+    return f'calificacion:{pk}'
+
+
+def _cache():
+    return caches[getattr(settings, 'CACHE_VISTAS_ALIAS', 'default')]
+
+
+def activa():
+    return getattr(settings, 'CACHE_VISTAS_ACTIVA', True)
+
+
+# --- GENERACIONES ---
+
+def _clave_generacion(dependencia):
+    return f'generacion:{dependencia}'
+
+
+def generaciones(dependencias):
+    """Generación actual de cada dependencia (crea las que falten)."""
+    cache = _cache()
+    claves = [_clave_generacion(d) for d in dependencias]
+    actuales = cache.get_many(claves)
+    for clave in claves:
+        if clave not in actuales:
+            nueva = time.time_ns()
+            # add: si otro proceso la creó primero, vale la suya
+            actuales[clave] = nueva if cache.add(clave, nueva, None) else cache.get(clave, nueva)
+    return [actuales[clave] for clave in claves]
+
+
+def _renovar(dependencias):
+    nueva = time.time_ns()
+    _cache().set_many({_clave_generacion(d): nueva for d in dependencias}, None)
+
+
+def invalidar(*dependencias):
+    """
+    Da una generación nueva a `dependencias` al confirmar la transacción en
+    curso (de inmediato si no hay una). Las invalidaciones de una misma
+    transacción se juntan en una sola escritura (p. ej. borrados en cascada).
+    """
+    if not dependencias or not activa():
+        return
+    conexion = transaction.get_connection()
+    if conexion.in_atomic_block:
+        # Si la transacción ya tiene una invalidación pendiente se le agregan estas dependencias.
+        # run_on_commit lo mantiene Django: un rollback descarta la función junto con su conjunto.
+        for _, funcion, _ in conexion.run_on_commit:
+            pendientes = getattr(funcion, 'dependencias_cache', None)
+            if pendientes is not None:
+                pendientes.update(dependencias)
+                return
+    pendientes = set(dependencias)
+
+    def renovar():
+        _renovar(pendientes)
+    renovar.dependencias_cache = pendientes
+    transaction.on_commit(renovar)
+
+
+# --- FRAGMENTOS ---
+
+def renderizar(plantilla, contexto):
+    """render_to_string sin request: el fragmento no puede depender del usuario que lo pidió."""
+    return render_to_string(plantilla, dict(contexto, csrf_token=MARCA_CSRF))
+
+
+def fragmento(request, nombre, partes, dependencias, generar):
+    """
+    HTML del fragmento `nombre` para `partes` (tupla con lo que distingue una
+    variante de otra: rol, filtros, versión). `generar()` lo produce con
+    `renderizar` cuando no está en caché.
+    """
+    if activa():
+        cache = _cache()
+        firma = hashlib.blake2b(repr((partes, generaciones(dependencias))).encode(), digest_size=16).hexdigest()
+        clave = f'fragmento:{nombre}:{firma}'
+        html = cache.get(clave)
+        if html is None:
+            html = generar()
+            cache.set(clave, html, getattr(settings, 'CACHE_VISTAS_SEGUNDOS', 600))
+    else:
+        html = generar()
+    if MARCA_CSRF in html:
+        html = html.replace(MARCA_CSRF, get_token(request))
+    return mark_safe(html)
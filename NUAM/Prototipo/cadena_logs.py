@@ -0,0 +1,270 @@
+"""
+Cadena de hashes del registro de auditoría (Log).
+
+Cada entrada guarda en `hash_cadena` el SHA-256 de la entrada anterior de
+su mismo mes (UTC) más su propio contenido (usuario, acción, fecha y
+detalle). Modificar o borrar una entrada rompe el enlace de la siguiente;
+rehacer todos los hashes posteriores se detecta con los puntos de control.
+Hay una cadena por mes para que calce con las particiones y el archivo de
+retención (ver retencion_logs.py): archivar un mes se lleva su cadena
+completa, y los meses se verifican en paralelo.
+
+- `usuario_original` guarda el usuario de la entrada al crearla: el hash lo
+  usa en vez de `usuario`, que pasa a NULL si se borra el usuario (SET_NULL).
+- CadenaLog guarda el último hash, el último id y la cantidad de entradas de
+  cada mes. `insertar` lee esos finales, calcula los hashes del lote en
+  memoria, hace un bulk_create y avanza cada final con un UPDATE
+  condicional; si otro proceso lo avanzó primero, se revierte y se
+  reintenta. Todo el que escribe un Log pasa por aquí (auditoria.py,
+  sinteticos.py); LogAdmin es de solo lectura.
+- `verificar_tramo` recorre un rango de ids de un mes en orden, en
+  streaming, y retorna la primera ruptura. El comando verificar_logs reparte
+  los tramos entre varios procesos y compara con PuntoControlLog: hashes
+  de entradas ya verificadas, guardados cada cierto número de entradas.
+"""
+import datetime
+import hashlib
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Min
+
+from .models import CadenaLog, Log, PuntoControlLog
+
+TAMANO_BLOQUE = 5000
+INTENTOS = 5
+COLUMNAS_HASH = ('usuario_original', 'accion', 'fecha_hora', 'detalle_cambio')
+
+
+class CadenaOcupada(Exception):
+    """Otros procesos avanzaron la cadena en cada intento; el lote no se grabó."""
+
+
+def _bloques(iterable, tamano):
+    iterador = iter(iterable)
+    return iter(lambda: list(islice(iterador, tamano)), [])
+
+
+# --- HASH ---
+
+def etiqueta_mes(fecha):
+    return fecha.astimezone(datetime.timezone.utc).strftime('%Y-%m')
+
+
+def rango_mes(etiqueta):
+    """[inicio, fin) del mes 'AAAA-MM' en UTC."""
+    inicio = datetime.datetime.strptime(etiqueta, '%Y-%m').replace(tzinfo=datetime.timezone.utc)
+    fin = inicio.replace(year=inicio.year + inicio.month // 12, month=inicio.month % 12 + 1)
+    return inicio, fin
+
+
+def genesis(etiqueta):
+    """Hash "anterior" de la primera entrada de cada mes."""
+    return hashlib.sha256(f'nuam-log:{etiqueta}'.encode()).hexdigest()
+
+
+def calcular_hash(anterior, usuario_id, accion, fecha_hora, detalle_cambio):
+    contenido = '\x1f'.join((
+        anterior,
+        '' if usuario_id is None else str(usuario_id),
+        accion,
+        fecha_hora.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f'),
+        detalle_cambio,
+    ))
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+# --- ESCRITURA ---
+
+def _encadenar(por_mes, finales):
+    for etiqueta, grupo in por_mes.items():
+        anterior = finales[etiqueta].hash_cadena if etiqueta in finales else genesis(etiqueta)
+        for log in grupo:
+            log.usuario_original = log.usuario_id
+            log.hash_cadena = anterior = calcular_hash(
+                anterior, log.usuario_original, log.accion, log.fecha_hora, log.detalle_cambio
+            )
+
+
+def _avanzar(por_mes, finales):
+    for etiqueta, grupo in por_mes.items():
+        ultimo = grupo[-1]
+        if etiqueta in finales:
+            avanzado = CadenaLog.objects.filter(mes=etiqueta, hash_cadena=finales[etiqueta].hash_cadena).update(
+                hash_cadena=ultimo.hash_cadena, ultimo_id=ultimo.pk, filas=F('filas') + len(grupo)
+            )
+            if not avanzado:
+                raise CadenaOcupada(etiqueta)
+        else:
+            try:
+                with transaction.atomic():
+                    CadenaLog.objects.create(mes=etiqueta, hash_cadena=ultimo.hash_cadena, ultimo_id=ultimo.pk, filas=len(grupo))
+            except IntegrityError:
+                raise CadenaOcupada(etiqueta)
+
+
+def insertar(logs):
+    """
+    Inserta `logs` (instancias sin guardar) al final de la cadena de su mes,
+    con un bulk_create. Retorna los logs creados; lanza CadenaOcupada si no
+    logra avanzar la cadena en INTENTOS intentos.
+    """
+    logs = list(logs)
+    if not logs:
+        return []
+    por_mes = {}
+    for log in logs:
+        por_mes.setdefault(etiqueta_mes(log.fecha_hora), []).append(log)
+
+    for _ in range(INTENTOS):
+        try:
+            with transaction.atomic():
+                finales = CadenaLog.objects.in_bulk(list(por_mes))
+                _encadenar(por_mes, finales)
+                Log.objects.bulk_create(logs, batch_size=1000)
+                _avanzar(por_mes, finales)
+            return logs
+        except CadenaOcupada:
+            for log in logs:
+                log.pk = None
+                log._state.adding = True
+    raise CadenaOcupada(', '.join(por_mes))
+
+
+def sellar(modelo_log=Log, modelo_cadena=CadenaLog, meses=None, tamano_lote=2000):
+    """
+    Recalcula la cadena completa de `meses` (etiquetas 'AAAA-MM'; por omisión
+    todos los que tienen entradas) y su final, como la migración 0015 con las
+    entradas anteriores a la cadena. Solo para datos de prueba
+    (sinteticos.eliminar_datos): en cualquier otro caso, rehacer una cadena
+    es justo lo que la verificación debe detectar.
+    """
+    if meses is None:
+        extremos = modelo_log.objects.aggregate(primera=Min('fecha_hora'), ultima=Max('fecha_hora'))
+        meses = []
+        if extremos['primera'] is not None:
+            etiqueta = etiqueta_mes(extremos['primera'])
+            while etiqueta <= etiqueta_mes(extremos['ultima']):
+                meses.append(etiqueta)
+                etiqueta = etiqueta_mes(rango_mes(etiqueta)[1])
+
+    for etiqueta in meses:
+        inicio, fin = rango_mes(etiqueta)
+        del_mes = modelo_log.objects.filter(fecha_hora__gte=inicio, fecha_hora__lt=fin).order_by('id')
+        anterior, filas, ultimo_id = genesis(etiqueta), 0, 0
+        while True:
+            # Por tramos de id: no se escribe sobre una consulta abierta
+            bloque = list(del_mes.filter(id__gt=ultimo_id).values_list(
+                'id', 'usuario_id', 'usuario_original', 'accion', 'fecha_hora', 'detalle_cambio'
+            )[:tamano_lote])
+            if not bloque:
+                break
+            objetos = []
+            for id_log, usuario_id, original, accion, fecha_hora, detalle in bloque:
+                original = usuario_id if original is None else original
+                anterior = calcular_hash(anterior, original, accion, fecha_hora, detalle)
+                objetos.append(modelo_log(id=id_log, usuario_original=original, hash_cadena=anterior))
+            modelo_log.objects.bulk_update(objetos, ['usuario_original', 'hash_cadena'])
+            filas += len(bloque)
+            ultimo_id = bloque[-1][0]
+        if filas:
+            modelo_cadena.objects.update_or_create(
+                mes=etiqueta, defaults={'hash_cadena': anterior, 'ultimo_id': ultimo_id, 'filas': filas}
+            )
+        else:
+            modelo_cadena.objects.filter(mes=etiqueta).delete()
+
+
+# --- VERIFICACIÓN ---
+
+def tramos(tamano=200_000):
+    """
+    Rangos disjuntos a verificar, (mes, id_desde, id_hasta), partiendo el
+    rango de ids de cada mes en tramos de a lo más `tamano` ids. Retorna
+    (tramos, rupturas): un mes con entradas pero sin cadena ya es una ruptura.
+    """
+    con_cadena = set(CadenaLog.objects.values_list('mes', flat=True))
+    meses = set(con_cadena)
+    extremos = Log.objects.aggregate(primera=Min('fecha_hora'), ultima=Max('fecha_hora'))
+    if extremos['primera'] is not None:
+        etiqueta = etiqueta_mes(extremos['primera'])
+        while etiqueta <= etiqueta_mes(extremos['ultima']):
+            meses.add(etiqueta)
+            etiqueta = etiqueta_mes(rango_mes(etiqueta)[1])
+
+    resultado, rupturas = [], []
+    for etiqueta in sorted(meses):
+        inicio, fin = rango_mes(etiqueta)
+        ids = Log.objects.filter(fecha_hora__gte=inicio, fecha_hora__lt=fin).aggregate(desde=Min('id'), hasta=Max('id'))
+        if ids['desde'] is None:
+            continue  # Sin entradas o archivado completo
+        if etiqueta not in con_cadena:
+            rupturas.append(_ruptura(etiqueta, ids['desde'], 'hay entradas sin cadena de hashes'))
+            continue
+        for desde in range(ids['desde'], ids['hasta'] + 1, tamano):
+            resultado.append((etiqueta, desde, min(desde + tamano - 1, ids['hasta'])))
+    return resultado, rupturas
+
+
+def _ruptura(etiqueta, id_log, motivo):
+    return {'mes': etiqueta, 'id': id_log, 'motivo': motivo}
+
+
+def verificar_tramo(etiqueta, desde, hasta, intervalo=100_000, enlace_archivado=None, final_id=None):
+    """
+    Verifica en orden de id las entradas del mes `etiqueta` con id en
+    [desde, hasta]. El hash anterior a `desde` se toma de la base, de
+    `enlace_archivado` (hash de la última entrada archivada del mes) o del
+    génesis. `final_id` es el último id de la cadena leído antes de empezar:
+    las entradas posteriores pueden estar llegando mientras se verifica.
+    Retorna {'mes', 'desde', 'hasta', 'filas', 'ruptura' (None o {'mes',
+    'id', 'motivo'}), 'puntos' [(id, hash)] nuevos, 'filas_final' (entradas
+    con id <= final_id), 'hash_final' (hash de final_id, si estaba)}.
+    """
+    inicio, fin = rango_mes(etiqueta)
+    del_mes = Log.objects.filter(fecha_hora__gte=inicio, fecha_hora__lt=fin)
+    anterior = (
+        del_mes.filter(id__lt=desde).order_by('-id').values_list('hash_cadena', flat=True).first()
+        or enlace_archivado or genesis(etiqueta)
+    )
+    controles = dict(
+        PuntoControlLog.objects.filter(mes=etiqueta, log_id__gte=desde, log_id__lte=hasta).values_list('log_id', 'hash_cadena')
+    )
+    resultado = {
+        'mes': etiqueta, 'desde': desde, 'hasta': hasta, 'filas': 0, 'ruptura': None, 'puntos': [],
+        'filas_final': 0, 'hash_final': None,
+    }
+
+    filas = del_mes.filter(id__gte=desde, id__lte=hasta).order_by('id').values_list(
+        'id', 'usuario_id', *COLUMNAS_HASH, 'hash_cadena'
+    ).iterator(chunk_size=TAMANO_BLOQUE)
+    for id_log, usuario_id, original, accion, fecha_hora, detalle, guardado in filas:
+        if calcular_hash(anterior, original, accion, fecha_hora, detalle) != guardado:
+            resultado['ruptura'] = _ruptura(etiqueta, id_log, 'el hash no corresponde: la entrada o la anterior fue modificada o borrada')
+            return resultado
+        if usuario_id is not None and usuario_id != original:
+            resultado['ruptura'] = _ruptura(etiqueta, id_log, 'el usuario no corresponde al registrado')
+            return resultado
+        control = controles.pop(id_log, None)
+        if control is not None and control != guardado:
+            resultado['ruptura'] = _ruptura(etiqueta, id_log, 'no coincide con el punto de control: la cadena fue rehecha')
+            return resultado
+        resultado['filas'] += 1
+        if resultado['filas'] % intervalo == 0 and control is None:
+            resultado['puntos'].append((id_log, guardado))
+        if final_id is None or id_log <= final_id:
+            resultado['filas_final'] += 1
+        if id_log == final_id:
+            resultado['hash_final'] = guardado
+        anterior = guardado
+
+    if controles:
+        resultado['ruptura'] = _ruptura(etiqueta, min(controles), 'falta la entrada de un punto de control')
+    return resultado
+
+
+def guardar_puntos(resultados):
+    PuntoControlLog.objects.bulk_create([
+        PuntoControlLog(mes=r['mes'], log_id=id_log, hash_cadena=hash_cadena)
+        for r in resultados for id_log, hash_cadena in r['puntos']
+    ], ignore_conflicts=True)
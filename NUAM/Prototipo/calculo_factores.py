@@ -0,0 +1,172 @@
+"""
+Motor de cálculo de factores a partir de los montos F*_MONTO / F*_REX.
+
+factor = monto / total de la fila, redondeado (ROUND_HALF_UP) a los 4
+decimales de Factor.valor. El cálculo se hace sobre todo el lote de filas a
+la vez y en aritmética entera (montos en diezmilésimas), así que el
+resultado es exacto y coincide con la referencia Decimal
+(`calcular_factores`):
+
+- 'numpy': una pasada vectorizada sobre la matriz filas x factores (int64).
+  El cociente se estima en punto flotante y se corrige con el resto exacto;
+  los productos que desbordan int64 se calculan módulo 2**64, lo que no
+  altera el resto porque éste siempre cabe en int64.
+- 'python': el mismo algoritmo con enteros de Python, fila por fila. Se usa
+  si NumPy no está instalado, para lotes chicos o con montos negativos.
+
+Con verificar=True (o settings.FACTORES_VERIFICAR) cada lote se recalcula
+además con la referencia Decimal (calcular_factores, fila por fila) y
+cualquier diferencia lanza DiferenciaFactores.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional
+    np = None
+
+DECIMALES = 4
+ESCALA = 10 ** DECIMALES
+CERO = Decimal('0')
+CUANTO_FACTOR = Decimal('0.0001')  # Factor.valor: decimal_places=4
+# Con montos no negativos cada factor está entre 0 y 1: 10001 valores posibles
+_DECIMALES_FACTOR = [(Decimal(i) / ESCALA).quantize(CUANTO_FACTOR) for i in range(ESCALA + 1)]
+MIN_FILAS_NUMPY = 32
+
+
+class DiferenciaFactores(ValueError):
+    """El cálculo vectorizado no coincide con la referencia Decimal."""
+
+    def __init__(self, diferencias):
+        self.diferencias = diferencias
+        fila, indice, esperado, obtenido = diferencias[0]
+        super().__init__(
+            f'{len(diferencias)} factores difieren de la referencia Decimal '
+            f'(primero: fila {fila}, factor {indice}: {esperado} != {obtenido}).'
+        )
+
+
+# --- REFERENCIA DECIMAL ---
+
+def calcular_factores(montos):
+    """Factor = monto / total de la fila, redondeado a los 4 decimales de Factor.valor."""
+    total = sum(montos, CERO)
+    if not total:
+        return [CERO.quantize(CUANTO_FACTOR)] * len(montos)
+    return [(monto / total).quantize(CUANTO_FACTOR, rounding=ROUND_HALF_UP) for monto in montos]
+
+
+# --- CONVERSIÓN ---
+
+def montos_a_enteros(montos):
+    """Decimal -> entero en diezmilésimas. Los montos deben tener a lo más 4 decimales (ver carga.validar_fila)."""
+    enteros = []
+    for monto in montos:
+        # La mayoría de las columnas de un archivo real vienen vacías
+        if not monto:
+            enteros.append(0)
+            continue
+        escalado = Decimal(monto).scaleb(DECIMALES)
+        entero = int(escalado)
+        if entero != escalado:
+            raise ValueError(f'El monto {monto} tiene más de {DECIMALES} decimales.')
+        enteros.append(entero)
+    return enteros
+
+
+def _a_decimales(filas, negativos):
+    if negativos:
+        # Con montos negativos los factores pueden salir de [0, 1]
+        return [[(Decimal(entero) / ESCALA).quantize(CUANTO_FACTOR) for entero in fila] for fila in filas]
+    tabla = _DECIMALES_FACTOR
+    return [[tabla[entero] for entero in fila] for fila in filas]
+
+
+# --- MOTORES ---
+
+def _factor_entero(monto, total):
+    """round_half_up(monto * ESCALA / total) exacto; los empates se alejan del cero, como Decimal."""
+    cociente, resto = divmod(abs(monto) * ESCALA, abs(total))
+    if 2 * resto >= abs(total):
+        cociente += 1
+    return cociente if (monto >= 0) == (total > 0) else -cociente
+
+
+def _calcular_python(filas):
+    resultado = []
+    for fila in filas:
+        total = sum(fila)
+        resultado.append([_factor_entero(monto, total) if monto else 0 for monto in fila] if total else [0] * len(fila))
+    return resultado
+
+
+def _calcular_numpy(filas):
+    """Matriz de factores en diezmilésimas. Requiere montos no negativos (cada monto <= total de su fila)."""
+    montos = np.asarray(filas, dtype=np.int64)
+    totales = montos.sum(axis=1, keepdims=True)
+    divisores = np.where(totales == 0, 1, totales)
+
+    # Estimación en float64 (error menor a 1) y corrección con el resto exacto
+    cocientes = np.floor(montos / divisores * ESCALA).astype(np.int64)
+    with np.errstate(over='ignore'):
+        restos = montos * ESCALA - cocientes * divisores
+    bajo = restos < 0
+    cocientes -= bajo
+    restos += bajo * divisores
+    alto = restos >= divisores
+    cocientes += alto
+    restos -= alto * divisores
+    # ROUND_HALF_UP
+    cocientes += 2 * restos >= divisores
+    cocientes[totales[:, 0] == 0] = 0
+    return cocientes.tolist()
+
+
+def elegir_motor(cantidad_filas, negativos=False, motor=None):
+    motor = motor or getattr(settings, 'FACTORES_MOTOR', 'auto')
+    if motor == 'auto':
+        motor = 'numpy' if np is not None and cantidad_filas >= MIN_FILAS_NUMPY else 'python'
+    if motor == 'numpy':
+        if np is None:
+            raise ImportError("FACTORES_MOTOR = 'numpy' requiere el paquete numpy.")
+        if negativos:
+            return 'python'
+    return motor
+
+
+# --- API ---
+
+def verificar_lote(lote_montos, lote_factores):
+    """Compara factores ya calculados con la referencia Decimal. Retorna [(fila, indice, esperado, obtenido)]."""
+    diferencias = []
+    for numero, (montos, factores) in enumerate(zip(lote_montos, lote_factores)):
+        for indice, (esperado, obtenido) in enumerate(zip(calcular_factores(montos), factores)):
+            if esperado != obtenido:
+                diferencias.append((numero, indice, esperado, obtenido))
+    return diferencias
+
+
+def calcular_factores_lote(lote_montos, motor=None, verificar=None):
+    """
+    Factores de varias filas de una vez. `lote_montos`: lista de vectores de montos
+    (Decimal, a lo más 4 decimales). Retorna una lista de vectores de Decimal.
+    """
+    if not lote_montos:
+        return []
+    filas = [montos_a_enteros(montos) for montos in lote_montos]
+    negativos = any(monto < 0 for fila in filas for monto in fila)
+    if elegir_motor(len(filas), negativos, motor) == 'numpy':
+        enteros = _calcular_numpy(filas)
+    else:
+        enteros = _calcular_python(filas)
+    factores = _a_decimales(enteros, negativos)
+
+    if verificar is None:
+        verificar = getattr(settings, 'FACTORES_VERIFICAR', False)
+    if verificar:
+        diferencias = verificar_lote(lote_montos, factores)
+        if diferencias:
+            raise DiferenciaFactores(diferencias)
+    return factores
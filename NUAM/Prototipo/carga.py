@@ -0,0 +1,723 @@
+"""
+Motor de carga masiva de archivos de calificaciones (ArchivoCarga).
+
+El archivo subido (CSV, .xlsx o .xls) se lee fila por fila (nunca se carga
+completo en memoria, salvo el .xls: ver leer_filas_xls), cada fila se valida
+contra la especificación de formato_archivo.html y las filas válidas se
+graban en lotes, cada uno en su propia transacción.
+
+La escritura es idempotente: cada fila se identifica por su clave natural
+(Calificacion.CLAVE_NATURAL) y lleva un hash de su contenido. Volver a subir
+un archivo corregido inserta las filas nuevas, actualiza las que cambiaron
+(vuelven a 'Pendiente') y no toca las que traen el mismo contenido. Cada
+inserción o actualización queda en el historial de versiones (versiones.py).
+
+`validar_archivo` recorre el archivo con las mismas reglas pero sin tocar la
+base de datos (modo de prueba): sirve para revisar un archivo grande y
+recibir un informe de errores compacto antes de grabarlo.
+"""
+import codecs
+import csv
+import datetime
+import hashlib
+import os
+import re
+import time
+import zipfile
+from collections import Counter
+from functools import lru_cache
+from decimal import Decimal, InvalidOperation
+
+from django.db import connections, transaction
+
+try:
+    import openpyxl  # Opcional: lectura de .xlsx
+except ImportError:
+    openpyxl = None
+
+try:
+    import xlrd  # Opcional: lectura de .xls (formato binario antiguo)
+except ImportError:
+    xlrd = None
+
+from . import resumen, versiones
+from .calculo_factores import calcular_factores_lote
+from .factores import crear_factores_lote, leer_factores_lote, reemplazar_factores_lote
+from .models import Calificacion
+from .utils import NOMBRES_FACTORES
+
+
+# --- ESPECIFICACIÓN DEL ARCHIVO (ver formato_archivo.html) ---
+# (campo, tipo, largo máximo, obligatorio)
+COLUMNAS_BASE = [
+    ('EJERCICIO', 'NUMBER', 4, True),
+    ('MERCADO', 'STRING', 3, True),
+    ('NEMOTECNICO', 'STRING', 40, True),
+    ('FEC_PAGO', 'STRING', 10, True),
+    ('SEC_EVE', 'NUMBER', 10, False),
+    ('DESCRIPCION', 'STRING', 50, False),
+]
+# La plantilla publicada usa 'NEMO', el JS de carga usa 'NEMOTECNICO'
+ALIAS_COLUMNAS = {'NEMO': 'NEMOTECNICO'}
+
+EXTENSIONES = ('.csv', '.xlsx', '.xls')
+MERCADOS_VALIDOS = ('AC', 'RF', 'DER')
+FORMATOS_FECHA = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y')
+
+# Columnas de montos: F8_MONTO, F12_REX, "F20- Acum desde..." -> índice en NOMBRES_FACTORES
+PATRON_COLUMNA_FACTOR = re.compile(r'^F(\d+)(?:[_\-].*)?$')
+PRIMER_FACTOR = 8
+LARGO_MONTO = 16
+DECIMALES_MONTO = 4
+
+CERO = Decimal('0')
+CUANTO_FACTOR = Decimal('0.0001')      # Montos: a lo más 4 decimales
+CUANTO_HISTORICO = Decimal('0.00000001')  # Calificacion.valor_historico: decimal_places=8
+MAX_VALOR_HISTORICO = Decimal(10) ** 10   # Calificacion.valor_historico: max_digits=18
+
+ORIGEN_CARGA = 'Carga Masiva'
+TAMANO_LOTE = 500
+MAX_ERRORES_REPORTADOS = 200
+MAX_ERRORES_VALIDACION = 1000
+MUESTRA_VALIDACION = 50
+
+MENSAJES_ERROR = {
+    'OBLIGATORIO': 'Campo obligatorio vacío',
+    'TIPO': 'Valor no numérico',
+    'LARGO': 'Largo máximo excedido',
+    'DECIMALES': 'Demasiados decimales',
+    'FECHA': 'Fecha inválida',
+    'MERCADO': 'Mercado inválido',
+    'NEGATIVO': 'Monto negativo',
+    'SIN_MONTOS': 'La fila no tiene montos: sus factores no pueden sumar 1',
+    'SUMA_LARGO': 'La suma de los montos excede el valor histórico máximo',
+    'SUMA_FACTORES': 'Los factores calculados no suman 1',
+}
+
+
+class ErrorFormatoArchivo(ValueError):
+    """El archivo no se puede procesar (encabezados faltantes, codificación, etc.)."""
+
+
+class ResultadoCarga:
+    """Contadores y primeros errores de una carga. Memoria acotada por MAX_ERRORES_REPORTADOS."""
+
+    def __init__(self):
+        self.filas_procesadas = 0
+        self.filas_fallidas = 0
+        self.filas_insertadas = 0
+        self.filas_actualizadas = 0
+        self.filas_sin_cambios = 0
+        self.errores = []
+
+    def registrar_errores(self, numero_fila, errores):
+        self.filas_fallidas += 1
+        for columna, codigo in errores:
+            if len(self.errores) >= MAX_ERRORES_REPORTADOS:
+                return
+            self.errores.append({
+                'fila': numero_fila,
+                'columna': columna,
+                'codigo': codigo,
+                'mensaje': MENSAJES_ERROR.get(codigo, codigo),
+            })
+
+    def como_dict(self):
+        return {
+            'filas_procesadas': self.filas_procesadas,
+            'filas_fallidas': self.filas_fallidas,
+            'filas_insertadas': self.filas_insertadas,
+            'filas_actualizadas': self.filas_actualizadas,
+            'filas_sin_cambios': self.filas_sin_cambios,
+            'errores': self.errores,
+        }
+
+
+class ResultadoValidacion:
+    """
+    Informe de `validar_archivo`: errores compactos [fila, columna, codigo]
+    (a lo más `max_errores`) y un resumen con los totales de todo el archivo.
+    """
+
+    def __init__(self, max_errores=MAX_ERRORES_VALIDACION):
+        self.max_errores = max_errores
+        self.filas = 0
+        self.filas_validas = 0
+        self.filas_con_errores = 0
+        self.errores = []
+        self.por_codigo = Counter()
+        self.por_columna = Counter()
+        self.ejercicios = set()
+        self.mercados = set()
+        self.total_montos = CERO
+        self.duracion = 0.0
+        self.muestra = []
+
+    def registrar_errores(self, numero_fila, errores):
+        self.filas_con_errores += 1
+        for columna, codigo in errores:
+            self.por_codigo[codigo] += 1
+            self.por_columna[columna] += 1
+            if len(self.errores) < self.max_errores:
+                self.errores.append([numero_fila, columna, codigo])
+
+    def registrar_valida(self, datos):
+        self.filas_validas += 1
+        self.ejercicios.add(datos['años'])
+        self.mercados.add(datos['mercado'])
+        self.total_montos += sum(datos['montos'], CERO)
+
+    @property
+    def valido(self):
+        return self.filas > 0 and not self.filas_con_errores
+
+    def como_dict(self):
+        return {
+            'valido': self.valido,
+            'resumen': {
+                'filas': self.filas,
+                'filas_validas': self.filas_validas,
+                'filas_con_errores': self.filas_con_errores,
+                'errores': sum(self.por_codigo.values()),
+                'errores_omitidos': max(0, sum(self.por_codigo.values()) - len(self.errores)),
+                'por_codigo': dict(self.por_codigo.most_common()),
+                'por_columna': dict(self.por_columna.most_common()),
+                'ejercicios': sorted(self.ejercicios),
+                'mercados': sorted(self.mercados),
+                'total_montos': str(self.total_montos),
+                'duracion_ms': round(self.duracion * 1000, 1),
+            },
+            # Una entrada por error: [fila, columna, codigo]; los textos van una sola vez en 'codigos'
+            'errores': sorted(self.errores),
+            'codigos': {codigo: MENSAJES_ERROR.get(codigo, codigo) for codigo in self.por_codigo},
+            # Primeras filas tal como se leyeron, para la vista previa de los .xlsx/.xls
+            'muestra': self.muestra,
+        }
+
+
+# --- LECTURA EN STREAMING ---
+
+def normalizar_encabezado(encabezado):
+    nombre = encabezado.strip().upper().replace(' ', '_')
+    return ALIAS_COLUMNAS.get(nombre, nombre)
+
+
+def _lineas_texto(archivo, encoding):
+    """Decodifica el archivo binario línea por línea (utf-8-sig elimina el BOM de Excel)."""
+    decodificador = codecs.getincrementaldecoder(encoding)()
+    try:
+        for linea in archivo:
+            yield decodificador.decode(linea)
+        yield decodificador.decode(b'', final=True)
+    except UnicodeDecodeError:
+        raise ErrorFormatoArchivo('El archivo no está codificado en UTF-8.')
+
+
+def _filas_con_encabezado(encabezados, filas_numeradas):
+    encabezados = [normalizar_encabezado(h) for h in encabezados]
+    validar_encabezados(encabezados)
+    for numero, valores in filas_numeradas:
+        if not any(v.strip() for v in valores):
+            continue
+        yield numero, dict(zip(encabezados, valores))
+
+
+def leer_filas_csv(archivo, encoding='utf-8-sig'):
+    """
+    Genera tuplas (numero_fila, fila) con fila = {COLUMNA: valor}.
+    `archivo` es cualquier objeto binario iterable por líneas (UploadedFile, File, open(..., 'rb')).
+    """
+    lineas = _lineas_texto(archivo, encoding)
+    primera = next(lineas, '')
+    if not primera.strip():
+        raise ErrorFormatoArchivo('El archivo está vacío.')
+
+    delimitador = ';' if primera.count(';') > primera.count(',') else ','
+    encabezados = next(csv.reader([primera], delimiter=delimitador))
+    yield from _filas_con_encabezado(
+        encabezados, enumerate(csv.reader(lineas, delimiter=delimitador), start=2)
+    )
+
+
+def _texto_celda(valor):
+    """Valor de una celda Excel -> el texto que tendría en el CSV equivalente."""
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime.datetime):
+        return valor.date().isoformat()
+    if isinstance(valor, datetime.date):
+        return valor.isoformat()
+    if isinstance(valor, float):
+        # Excel guarda todo número como float: 2024.0 -> '2024'
+        return str(int(valor)) if valor.is_integer() else repr(valor)
+    return str(valor)
+
+
+def leer_filas_xlsx(archivo):
+    """
+    Como leer_filas_csv, para la primera hoja de un .xlsx. openpyxl en modo
+    read_only recorre el XML de la hoja a medida que se itera, sin construir
+    el libro completo en memoria. `archivo` debe admitir seek (UploadedFile, File).
+    """
+    if openpyxl is None:
+        raise ErrorFormatoArchivo('El servidor no admite archivos .xlsx (falta el paquete openpyxl). Use CSV.')
+    try:
+        libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, OSError, ValueError):
+        raise ErrorFormatoArchivo('El archivo no es un libro Excel (.xlsx) válido.')
+    try:
+        filas = (
+            (numero, [_texto_celda(valor) for valor in valores])
+            for numero, valores in enumerate(libro.worksheets[0].iter_rows(values_only=True), start=1)
+        )
+        numero, encabezados = next(filas, (None, None))
+        if not encabezados or not any(encabezados):
+            raise ErrorFormatoArchivo('El archivo está vacío.')
+        yield from _filas_con_encabezado(encabezados, filas)
+    finally:
+        libro.close()
+
+
+def leer_filas_xls(archivo):
+    """
+    Como leer_filas_csv, para la primera hoja de un .xls. El formato binario
+    antiguo no se puede leer en streaming: xlrd necesita el archivo completo
+    (acotado por el límite de subida), pero con on_demand=True sólo decodifica
+    la hoja usada y las filas se convierten a medida que se iteran.
+    """
+    if xlrd is None:
+        raise ErrorFormatoArchivo('El servidor no admite archivos .xls (falta el paquete xlrd). Use CSV.')
+    try:
+        libro = xlrd.open_workbook(file_contents=archivo.read(), on_demand=True)
+        hoja = libro.sheet_by_index(0)
+    except xlrd.XLRDError:
+        raise ErrorFormatoArchivo('El archivo no es un libro Excel (.xls) válido.')
+
+    def valores(indice):
+        resultado = []
+        for celda in hoja.row(indice):
+            if celda.ctype == xlrd.XL_CELL_DATE:
+                resultado.append(_texto_celda(xlrd.xldate_as_datetime(celda.value, libro.datemode)))
+            elif celda.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+                resultado.append('')
+            else:
+                resultado.append(_texto_celda(celda.value))
+        return resultado
+
+    try:
+        if not hoja.nrows:
+            raise ErrorFormatoArchivo('El archivo está vacío.')
+        yield from _filas_con_encabezado(
+            valores(0), ((indice + 1, valores(indice)) for indice in range(1, hoja.nrows))
+        )
+    finally:
+        libro.release_resources()
+
+
+LECTORES = {'.csv': leer_filas_csv, '.xlsx': leer_filas_xlsx, '.xls': leer_filas_xls}
+
+
+def extension_archivo(nombre):
+    return os.path.splitext(nombre or '')[1].lower()
+
+
+def leer_filas(archivo, nombre=None):
+    """
+    Elige el lector según la extensión de `nombre` (por defecto archivo.name);
+    sin extensión conocida se lee como CSV.
+    """
+    extension = extension_archivo(nombre or getattr(archivo, 'name', ''))
+    return LECTORES.get(extension, leer_filas_csv)(archivo)
+
+
+def validar_encabezados(encabezados):
+    faltantes = [campo for campo, _, _, obligatorio in COLUMNAS_BASE if obligatorio and campo not in encabezados]
+    if faltantes:
+        raise ErrorFormatoArchivo(f"Columnas faltantes en el archivo: {', '.join(faltantes)}")
+
+
+# --- VALIDACIÓN Y CONVERSIÓN ---
+
+@lru_cache(maxsize=256)  # Se consulta por cada celda; los encabezados distintos son pocos
+def indice_factor(columna):
+    """Retorna la posición en NOMBRES_FACTORES de una columna de monto, o None."""
+    coincidencia = PATRON_COLUMNA_FACTOR.match(columna)
+    if not coincidencia:
+        return None
+    indice = int(coincidencia.group(1)) - PRIMER_FACTOR
+    return indice if 0 <= indice < len(NOMBRES_FACTORES) else None
+
+
+def _convertir_fecha(valor):
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.datetime.strptime(valor, formato).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _convertir_monto(valor):
+    """Retorna (Decimal, codigo_error)."""
+    try:
+        monto = Decimal(valor)
+    except InvalidOperation:
+        return None, 'TIPO'
+    if not monto.is_finite():
+        return None, 'TIPO'
+    normalizado = monto.normalize()
+    if -normalizado.as_tuple().exponent > DECIMALES_MONTO:
+        return None, 'DECIMALES'
+    if len(normalizado.quantize(CUANTO_FACTOR).as_tuple().digits) > LARGO_MONTO:
+        return None, 'LARGO'
+    if monto < 0:
+        return None, 'NEGATIVO'
+    return monto, None
+
+
+def validar_fila(fila):
+    """
+    Valida y convierte una fila del archivo.
+    Retorna (datos, errores): `datos` listo para grabar o None, `errores` lista de (columna, codigo).
+    """
+    errores = []
+    valores = {campo: (fila.get(campo) or '').strip() for campo, _, _, _ in COLUMNAS_BASE}
+
+    for campo, tipo, largo, obligatorio in COLUMNAS_BASE:
+        valor = valores[campo]
+        if not valor:
+            if obligatorio:
+                errores.append((campo, 'OBLIGATORIO'))
+            continue
+        if len(valor) > largo:
+            errores.append((campo, 'LARGO'))
+        elif tipo == 'NUMBER' and not valor.isdigit():
+            errores.append((campo, 'TIPO'))
+
+    if valores['MERCADO'] and valores['MERCADO'] not in MERCADOS_VALIDOS:
+        errores.append(('MERCADO', 'MERCADO'))
+
+    fecha_pago = None
+    if valores['FEC_PAGO']:
+        fecha_pago = _convertir_fecha(valores['FEC_PAGO'])
+        if fecha_pago is None:
+            errores.append(('FEC_PAGO', 'FECHA'))
+
+    montos = [CERO] * len(NOMBRES_FACTORES)
+    for columna, valor in fila.items():
+        indice = indice_factor(columna)
+        if indice is None:
+            continue
+        valor = (valor or '').strip()
+        if not valor:
+            continue
+        monto, codigo = _convertir_monto(valor)
+        if codigo:
+            errores.append((columna, codigo))
+        else:
+            montos[indice] = monto
+
+    # Reglas de suma: los factores son monto / total, así que el total debe ser
+    # positivo (los factores suman 1) y caber en Calificacion.valor_historico
+    if not errores:
+        total = sum(montos, CERO)
+        if not total:
+            errores.append(('MONTOS', 'SIN_MONTOS'))
+        elif total >= MAX_VALOR_HISTORICO:
+            errores.append(('MONTOS', 'SUMA_LARGO'))
+
+    if errores:
+        return None, errores
+
+    return {
+        'años': int(valores['EJERCICIO']),
+        'mercado': valores['MERCADO'],
+        'instrumento': valores['NEMOTECNICO'],
+        'fecha_pago': fecha_pago,
+        'secuencia_evento': int(valores['SEC_EVE'] or 0),
+        'descripcion': valores['DESCRIPCION'],
+        'montos': montos,
+    }, []
+
+
+def validar_factores_lote(lote):
+    """
+    Calcula los factores de un lote de filas válidas (como _grabar_lote) y
+    retorna las posiciones cuyos factores no suman 1 dentro de la tolerancia
+    del redondeo (medio CUANTO_FACTOR por factor distinto de cero).
+    """
+    fallidas = []
+    for posicion, (datos, factores) in enumerate(zip(lote, calcular_factores_lote([d['montos'] for d in lote]))):
+        tolerancia = CUANTO_FACTOR / 2 * sum(1 for monto in datos['montos'] if monto)
+        if abs(sum(factores, CERO) - 1) > tolerancia:
+            fallidas.append(posicion)
+    return fallidas
+
+
+def validar_archivo(archivo, tamano_lote=TAMANO_LOTE, max_errores=MAX_ERRORES_VALIDACION):
+    """
+    Modo de prueba: lee y valida el archivo completo en streaming, con las
+    mismas reglas que procesar_archivo y el cálculo de factores por lote,
+    sin escribir en la base de datos. Retorna un ResultadoValidacion.
+    Lanza ErrorFormatoArchivo si el archivo no se puede leer.
+    """
+    inicio = time.perf_counter()
+    resultado = ResultadoValidacion(max_errores)
+    lote = []
+
+    def revisar_lote():
+        fallidas = set(validar_factores_lote([datos for _, datos in lote]))
+        for posicion, (numero_fila, datos) in enumerate(lote):
+            if posicion in fallidas:
+                resultado.registrar_errores(numero_fila, [('MONTOS', 'SUMA_FACTORES')])
+            else:
+                resultado.registrar_valida(datos)
+        lote.clear()
+
+    for numero_fila, fila in leer_filas(archivo):
+        resultado.filas += 1
+        datos, errores = validar_fila(fila)
+        if errores:
+            resultado.registrar_errores(numero_fila, errores)
+            continue
+        if len(resultado.muestra) < MUESTRA_VALIDACION:
+            resultado.muestra.append(fila)
+        lote.append((numero_fila, datos))
+        if len(lote) >= tamano_lote:
+            revisar_lote()
+
+    if lote:
+        revisar_lote()
+
+    resultado.duracion = time.perf_counter() - inicio
+    return resultado
+
+
+# --- ESCRITURA POR LOTES ---
+
+def hash_contenido(descripcion, montos):
+    """Hash de lo que el archivo define de una calificación (la clave natural queda fuera)."""
+    texto = '|'.join([descripcion or ''] + [format(monto.quantize(CUANTO_FACTOR), 'f') for monto in montos])
+    return hashlib.blake2b(texto.encode('utf-8'), digest_size=16).hexdigest()
+
+
+# Clave natural sin el corredor, que es el mismo en toda la carga
+CAMPOS_CLAVE = Calificacion.CLAVE_NATURAL[1:]
+
+
+def _clave(datos):
+    return tuple(datos[campo] for campo in CAMPOS_CLAVE)
+
+
+def _clave_calificacion(calificacion):
+    return tuple(getattr(calificacion, campo) for campo in CAMPOS_CLAVE)
+
+
+def _nueva_calificacion(datos, archivo_carga, usuario):
+    return Calificacion(
+        años=datos['años'],
+        mercado=datos['mercado'],
+        instrumento=datos['instrumento'],
+        fecha_pago=datos['fecha_pago'],
+        secuencia_evento=datos['secuencia_evento'],
+        descripcion=datos['descripcion'],
+        valor_historico=sum(datos['montos'], CERO).quantize(CUANTO_HISTORICO),
+        estado='Pendiente',
+        origen=ORIGEN_CARGA,
+        usuario_creador=usuario,
+        archivo_carga=archivo_carga,
+        hash_contenido=datos['hash'],
+    )
+
+
+# Columnas que una nueva carga reemplaza cuando el contenido cambió
+CAMPOS_ACTUALIZADOS = ('descripcion', 'valor_historico', 'estado', 'origen', 'archivo_carga', 'hash_contenido')
+
+
+def _upsert_postgresql(connection, calificaciones):
+    """
+    INSERT ... ON CONFLICT (clave natural) DO UPDATE, sólo si el hash cambió.
+    Las filas sin cambios no se escriben ni se retornan. Retorna {clave: (pk, insertada)}.
+    """
+    opciones = Calificacion._meta
+    campos = [campo for campo in opciones.concrete_fields if not campo.primary_key]
+    columnas = [connection.ops.quote_name(campo.column) for campo in campos]
+    tabla = connection.ops.quote_name(opciones.db_table)
+    conflicto = ', '.join(connection.ops.quote_name(opciones.get_field(nombre).column) for nombre in Calificacion.CLAVE_NATURAL)
+    actualizar = ', '.join(
+        f'{columna} = EXCLUDED.{columna}'
+        for columna in (connection.ops.quote_name(opciones.get_field(nombre).column) for nombre in CAMPOS_ACTUALIZADOS)
+    )
+    # Las columnas de la clave permiten asociar cada fila retornada con la del lote
+    retorno = ', '.join(connection.ops.quote_name(opciones.get_field(nombre).column) for nombre in CAMPOS_CLAVE)
+
+    resultado = {}
+    por_sentencia = max(1, 65535 // len(campos))  # Límite de parámetros de PostgreSQL
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(calificaciones), por_sentencia):
+            parte = calificaciones[inicio:inicio + por_sentencia]
+            valores = ', '.join([f"({', '.join(['%s'] * len(campos))})"] * len(parte))
+            parametros = [
+                campo.get_db_prep_save(campo.pre_save(calificacion, True), connection)
+                for calificacion in parte for campo in campos
+            ]
+            cursor.execute(
+                f'INSERT INTO {tabla} ({", ".join(columnas)}) VALUES {valores} '
+                f'ON CONFLICT ({conflicto}) DO UPDATE SET {actualizar}, "version" = {tabla}."version" + 1 '
+                f'WHERE {tabla}."hash_contenido" IS DISTINCT FROM EXCLUDED."hash_contenido" '
+                # xmax = 0 sólo en las filas recién insertadas
+                f'RETURNING "id", (xmax = 0), {retorno}',
+                parametros
+            )
+            for pk, insertada, *clave in cursor.fetchall():
+                resultado[tuple(clave)] = (pk, insertada)
+    return resultado
+
+
+def _existentes(calificaciones, usuario):
+    """
+    Filas ya grabadas con las claves del lote, bloqueadas hasta el fin de la
+    transacción: {clave: (pk, version, hash_contenido, estado, origen, campos)},
+    con `campos` los valores de versiones.CAMPOS (para el historial).
+    """
+    filas = Calificacion.objects.select_for_update().filter(
+        usuario_creador=usuario,
+        instrumento__in={c.instrumento for c in calificaciones},
+        fecha_pago__in={c.fecha_pago for c in calificaciones},
+    ).values_list('pk', 'version', 'hash_contenido', *versiones.CAMPOS, *CAMPOS_CLAVE)
+    existentes = {}
+    for pk, version, hash_actual, *resto in filas:
+        campos = dict(zip(versiones.CAMPOS, resto))
+        existentes[tuple(resto[len(versiones.CAMPOS):])] = (pk, version, hash_actual, campos['estado'], campos['origen'], campos)
+    return existentes
+
+
+def _upsert_orm(calificaciones, existentes):
+    """Lo mismo que _upsert_postgresql con el ORM (SQLite y otros motores): un INSERT y un UPDATE masivos."""
+    por_clave = {_clave_calificacion(c): c for c in calificaciones}
+    resultado, modificadas = {}, []
+    for clave, (pk, version, hash_actual, *_) in existentes.items():
+        calificacion = por_clave.pop(clave, None)
+        if calificacion is None or calificacion.hash_contenido == hash_actual:
+            continue
+        calificacion.pk, calificacion.version = pk, version + 1
+        modificadas.append(calificacion)
+        resultado[clave] = (pk, False)
+
+    if modificadas:
+        Calificacion.objects.bulk_update(modificadas, CAMPOS_ACTUALIZADOS + ('version',))
+    for calificacion in Calificacion.objects.bulk_create(list(por_clave.values())):
+        resultado[_clave_calificacion(calificacion)] = (calificacion.pk, True)
+    return resultado
+
+
+def _grabar_lote(lote, archivo_carga, usuario):
+    """
+    Graba un lote de filas válidas en una sola transacción. Retorna
+    (insertadas, actualizadas, sin_cambios); las filas sin cambios no se
+    escriben y sus factores ni siquiera se calculan.
+    """
+    # Una clave repetida dentro del lote: gana la última fila, como si se aplicaran en orden
+    ultimas = {}
+    for datos in lote:
+        datos['hash'] = hash_contenido(datos['descripcion'], datos['montos'])
+        ultimas[_clave(datos)] = datos
+    repetidas_iguales = sum(1 for datos in lote if ultimas[_clave(datos)]['hash'] == datos['hash']) - len(ultimas)
+    repetidas_distintas = len(lote) - len(ultimas) - repetidas_iguales
+
+    calificaciones = [_nueva_calificacion(datos, archivo_carga, usuario) for datos in ultimas.values()]
+    por_clave = {_clave_calificacion(c): c for c in calificaciones}
+    connection = connections[Calificacion.objects.db]
+    with transaction.atomic():
+        existentes = _existentes(calificaciones, usuario)
+        if connection.vendor == 'postgresql':
+            escritas = _upsert_postgresql(connection, calificaciones)
+        else:
+            escritas = _upsert_orm(calificaciones, existentes)
+
+        nuevas, modificadas = [], []
+        delta = resumen.Delta()
+        for clave, (pk, insertada) in escritas.items():
+            (nuevas if insertada else modificadas).append((pk, ultimas[clave]['montos'], clave))
+            mercado, años = clave[3], clave[4]
+            if not insertada:
+                _, _, _, estado, origen, _ = existentes[clave]
+                delta.agregar((estado, mercado, años, origen, usuario.pk), -1)
+            delta.agregar(('Pendiente', mercado, años, ORIGEN_CARGA, usuario.pk))
+        # bulk_create y ON CONFLICT no emiten señales: el resumen se actualiza aquí
+        resumen.aplicar(delta)
+
+        # Todos los factores del lote en una sola pasada (ver calculo_factores.py)
+        cambios = []
+        if nuevas:
+            vectores = calcular_factores_lote([m for _, m, _ in nuevas])
+            crear_factores_lote(list(zip([pk for pk, _, _ in nuevas], vectores)))
+            cambios += [
+                versiones.Cambio(pk, 0, versiones.campos_de(por_clave[clave]), vector)
+                for (pk, _, clave), vector in zip(nuevas, vectores)
+            ]
+        if modificadas:
+            vectores = calcular_factores_lote([m for _, m, _ in modificadas])
+            # Los vectores previos dejan en el historial solo los factores que cambiaron
+            anteriores = leer_factores_lote([pk for pk, _, _ in modificadas])
+            reemplazar_factores_lote(list(zip([pk for pk, _, _ in modificadas], vectores)))
+            cambios += [
+                versiones.Cambio(
+                    pk, existentes[clave][1] + 1,
+                    {
+                        campo: valor for campo, valor in versiones.campos_de(por_clave[clave]).items()
+                        if valor != existentes[clave][5][campo]
+                    },
+                    vector, anteriores[pk],
+                )
+                for (pk, _, clave), vector in zip(modificadas, vectores)
+            ]
+        versiones.registrar(cambios, usuario, 'Carga Masiva')
+
+    sin_cambios = len(ultimas) - len(escritas) + repetidas_iguales
+    return len(nuevas), len(modificadas) + repetidas_distintas, sin_cambios
+
+
+def procesar_archivo(archivo_carga, archivo, usuario, tamano_lote=TAMANO_LOTE, al_avanzar=None):
+    """
+    Procesa un archivo completo enlazando todo a `archivo_carga`.
+    Cada lote se confirma por separado: la memoria usada depende de `tamano_lote`,
+    no del tamaño del archivo. `al_avanzar(resultado)` se llama tras cada lote grabado.
+    """
+    resultado = ResultadoCarga()
+    lote = []
+
+    def vaciar_lote():
+        insertadas, actualizadas, sin_cambios = _grabar_lote(lote, archivo_carga, usuario)
+        resultado.filas_insertadas += insertadas
+        resultado.filas_actualizadas += actualizadas
+        resultado.filas_sin_cambios += sin_cambios
+        resultado.filas_procesadas += len(lote)
+        lote.clear()
+        if al_avanzar:
+            al_avanzar(resultado)
+
+    for numero_fila, fila in leer_filas(archivo):
+        datos, errores = validar_fila(fila)
+        if errores:
+            resultado.registrar_errores(numero_fila, errores)
+            continue
+        lote.append(datos)
+        if len(lote) >= tamano_lote:
+            vaciar_lote()
+
+    if lote:
+        vaciar_lote()
+
+    archivo_carga.estado = 'Con Errores' if resultado.filas_fallidas else 'Procesado'
+    archivo_carga.filas_procesadas = resultado.filas_procesadas
+    archivo_carga.filas_fallidas = resultado.filas_fallidas
+    archivo_carga.filas_insertadas = resultado.filas_insertadas
+    archivo_carga.filas_actualizadas = resultado.filas_actualizadas
+    archivo_carga.filas_sin_cambios = resultado.filas_sin_cambios
+    archivo_carga.errores = resultado.errores
+    archivo_carga.save(update_fields=[
+        'estado', 'filas_procesadas', 'filas_fallidas',
+        'filas_insertadas', 'filas_actualizadas', 'filas_sin_cambios', 'errores',
+    ])
+    return resultado
@@ -3,6 +3,8 @@ from django.shortcuts import redirect
 from functools import wraps
 from django.conf import settings
 
+from .roles import resolver_rol
+
 def role_required(allowed_roles=None):
     if allowed_roles is None:
         allowed_roles = []
@@ -15,13 +17,12 @@ def role_required(allowed_roles=None):
                 # Si no está logueado, redirigir a la página de login
                 return redirect(settings.LOGIN_URL + f"?next={request.path}") 
 
-            # 2. Verificar el Rol (Usando request.user, que ahora funciona gracias al fix de login)
-            try:
-                # Usamos el campo 'rol' (corregido)
-                user_role_name = request.user.rol.nombre
-            except AttributeError:
+            # 2. Verificar el Rol (resuelto por RolMiddleware, o desde la caché de roles)
+            rol = getattr(request, 'rol', None) or resolver_rol(request.user)
+            if rol is None:
                 # El usuario no tiene rol asignado (solo debería pasar si el rol es null o no existe)
                 return HttpResponseForbidden("Acceso denegado. Su cuenta no tiene un rol válido.")
+            user_role_name = rol.nombre
 
             # 3. Comparar el Rol
             if user_role_name in allowed_roles:
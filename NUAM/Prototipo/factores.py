@@ -0,0 +1,250 @@
+"""
+Acceso al vector de factores de una Calificacion.
+
+Las vistas, formularios y la carga masiva leen y escriben los factores solo a
+través de este módulo, que delega en el almacenamiento configurado en
+settings.FACTORES_ALMACENAMIENTO:
+
+- 'eav' (por defecto): una fila Factor por factor (29 filas por calificación).
+- 'columnar': una sola fila FactoresCalificacion con el vector empaquetado.
+
+Los vectores siempre son listas de Decimal en el orden de NOMBRES_FACTORES.
+Para pasar los datos existentes de un almacenamiento al otro se usa el
+comando `python manage.py migrar_factores`.
+
+Al aprobar una calificación se guarda además una copia del vector
+(AprobacionCalificacion), para comparar revisiones posteriores con la última
+versión aprobada.
+"""
+import struct
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import AprobacionCalificacion, Calificacion, Factor, FactoresCalificacion
+from .utils import NOMBRES_FACTORES
+
+# Factor.valor tiene 4 decimales: se guardan como enteros de diezmilésimas
+DECIMALES = 4
+CERO = Decimal('0').scaleb(-DECIMALES)
+_FORMATO = struct.Struct(f'<{len(NOMBRES_FACTORES)}q')
+_POSICION = {nombre: i for i, nombre in enumerate(NOMBRES_FACTORES)}
+
+
+class ConflictoVersion(Exception):
+    """La calificación fue modificada por otra edición después de abrir el formulario."""
+
+    def __init__(self, calificacion_id, version):
+        super().__init__(f'La calificación {calificacion_id} ya no está en la versión {version}.')
+        self.calificacion_id = calificacion_id
+        self.version = version
+
+
+def vector_vacio():
+    return [CERO] * len(NOMBRES_FACTORES)
+
+
+def empaquetar(valores):
+    """Vector de Decimal -> bytes (8 bytes por factor, punto fijo con 4 decimales)."""
+    return _FORMATO.pack(*(int(Decimal(v).scaleb(DECIMALES).to_integral_value()) for v in valores))
+
+
+def desempaquetar(datos):
+    return [Decimal(entero).scaleb(-DECIMALES) for entero in _FORMATO.unpack(bytes(datos))]
+
+
+# --- ALMACENAMIENTO EAV (tabla Factor) ---
+
+class AlmacenEAV:
+    nombre = 'eav'
+
+    def leer_lote(self, ids_calificacion):
+        vectores = {pk: vector_vacio() for pk in ids_calificacion}
+        filas = Factor.objects.filter(calificacion_id__in=vectores).values_list('calificacion_id', 'nombre', 'valor')
+        for calificacion_id, nombre, valor in filas:
+            if nombre in _POSICION:
+                vectores[calificacion_id][_POSICION[nombre]] = valor
+        return vectores
+
+    def crear_lote(self, pares):
+        Factor.objects.bulk_create([
+            Factor(calificacion_id=calificacion_id, nombre=nombre, valor=valor)
+            for calificacion_id, valores in pares
+            for nombre, valor in zip(NOMBRES_FACTORES, valores)
+        ], batch_size=2000)
+
+    def eliminar_lote(self, ids_calificacion):
+        Factor.objects.filter(calificacion_id__in=ids_calificacion).delete()
+
+    def guardar(self, calificacion_id, valores):
+        """Compara con lo grabado y escribe solo los factores distintos: un UPDATE y, si faltan filas, un INSERT."""
+        filas = {
+            nombre: (pk, valor)
+            for pk, nombre, valor in Factor.objects.filter(calificacion_id=calificacion_id).values_list('pk', 'nombre', 'valor')
+        }
+        modificados, nuevos = [], []
+        for nombre, valor in zip(NOMBRES_FACTORES, valores):
+            if nombre not in filas:
+                nuevos.append(Factor(calificacion_id=calificacion_id, nombre=nombre, valor=valor))
+            elif filas[nombre][1] != valor:
+                modificados.append(Factor(pk=filas[nombre][0], valor=valor))
+        if modificados:
+            Factor.objects.bulk_update(modificados, ['valor'], batch_size=len(NOMBRES_FACTORES))
+        if nuevos:
+            Factor.objects.bulk_create(nuevos)
+        return len(modificados) + len(nuevos)
+
+
+# --- ALMACENAMIENTO COLUMNAR (tabla FactoresCalificacion) ---
+
+class AlmacenColumnar:
+    nombre = 'columnar'
+
+    def leer_lote(self, ids_calificacion):
+        vectores = {pk: vector_vacio() for pk in ids_calificacion}
+        filas = FactoresCalificacion.objects.filter(calificacion_id__in=vectores).values_list('calificacion_id', 'valores')
+        for calificacion_id, datos in filas:
+            vectores[calificacion_id] = desempaquetar(datos)
+        return vectores
+
+    def crear_lote(self, pares):
+        FactoresCalificacion.objects.bulk_create([
+            FactoresCalificacion(calificacion_id=calificacion_id, valores=empaquetar(valores))
+            for calificacion_id, valores in pares
+        ], batch_size=2000)
+
+    def eliminar_lote(self, ids_calificacion):
+        FactoresCalificacion.objects.filter(calificacion_id__in=ids_calificacion).delete()
+
+    def guardar(self, calificacion_id, valores):
+        """Reescribe la fila solo si el vector cambió. Retorna cuántos factores cambiaron."""
+        grabados = FactoresCalificacion.objects.filter(calificacion_id=calificacion_id).values_list('valores', flat=True).first()
+        anteriores = vector_vacio() if grabados is None else desempaquetar(grabados)
+        cambiados = sum(1 for valor, anterior in zip(valores, anteriores) if valor != anterior)
+        if grabados is None:
+            FactoresCalificacion.objects.create(calificacion_id=calificacion_id, valores=empaquetar(valores))
+        elif cambiados:
+            FactoresCalificacion.objects.filter(calificacion_id=calificacion_id).update(valores=empaquetar(valores))
+        return cambiados
+
+
+ALMACENES = {
+    AlmacenEAV.nombre: AlmacenEAV(),
+    AlmacenColumnar.nombre: AlmacenColumnar(),
+}
+
+
+def almacen(nombre=None):
+    """Retorna el almacenamiento `nombre` o el configurado en settings."""
+    return ALMACENES[nombre or getattr(settings, 'FACTORES_ALMACENAMIENTO', 'eav')]
+
+
+# --- API PÚBLICA ---
+
+def _pk(calificacion):
+    return getattr(calificacion, 'pk', calificacion)
+
+
+def leer_factores(calificacion):
+    """Vector de la calificación (instancia o pk)."""
+    pk = _pk(calificacion)
+    return almacen().leer_lote([pk])[pk]
+
+
+def leer_factores_lote(calificaciones):
+    """{pk: vector} para varias calificaciones en una sola consulta."""
+    return almacen().leer_lote([_pk(c) for c in calificaciones])
+
+
+def crear_factores_lote(pares):
+    """Graba los vectores de calificaciones recién creadas. `pares`: [(calificacion o pk, vector)]."""
+    almacen().crear_lote([(_pk(c), valores) for c, valores in pares])
+
+
+def reemplazar_factores_lote(pares):
+    """Reemplaza los vectores de varias calificaciones existentes: un DELETE y un INSERT masivo."""
+    pares = [(_pk(c), valores) for c, valores in pares]
+    if not pares:
+        return
+    almacen().eliminar_lote([pk for pk, _ in pares])
+    almacen().crear_lote(pares)
+
+
+def guardar_factores(calificacion, valores, version=None):
+    """
+    Reemplaza el vector de una calificación existente escribiendo solo lo que cambió.
+
+    Con `version` (la que tenía la calificación cuando se abrió el formulario)
+    el guardado es optimista: si otra edición ya incrementó Calificacion.version
+    se lanza ConflictoVersion y no se escribe nada. Retorna la nueva versión,
+    o la misma si ningún factor cambió (entonces no se escribe nada).
+    """
+    pk = _pk(calificacion)
+    with transaction.atomic():
+        # SELECT ... FOR UPDATE: dos guardados de la misma calificación se serializan
+        filtro = Calificacion.objects.select_for_update().filter(pk=pk)
+        if version is not None:
+            filtro = filtro.filter(version=version)
+        nueva_version = filtro.values_list('version', flat=True).first()
+        if nueva_version is None:
+            raise ConflictoVersion(pk, version)
+        if almacen().guardar(pk, list(valores)):
+            # Tras una edición manual el vector ya no corresponde al hash de la carga masiva
+            Calificacion.objects.filter(pk=pk).update(version=F('version') + 1, hash_contenido='')
+            nueva_version += 1
+
+    if isinstance(calificacion, Calificacion):
+        calificacion.version = nueva_version
+    return nueva_version
+
+
+def factores_con_nombre(valores):
+    """[(nombre, valor)] listo para mostrar o para el `initial` de un formset."""
+    return list(zip(NOMBRES_FACTORES, valores))
+
+
+# --- APROBACIONES ---
+
+def registrar_aprobacion(calificacion, version, auditor):
+    """Copia el vector actual como el aprobado en `version`. Se llama dentro de la transacción que aprueba."""
+    pk = _pk(calificacion)
+    return AprobacionCalificacion.objects.create(
+        calificacion_id=pk, version=version, valores=empaquetar(leer_factores(pk)), auditor=auditor
+    )
+
+
+def registrar_aprobaciones_lote(pares, auditor, tamano_lote=2000):
+    """Como registrar_aprobacion para muchas calificaciones. `pares`: [(calificacion o pk, version aprobada)]."""
+    pares = [(_pk(c), version) for c, version in pares]
+    for inicio in range(0, len(pares), tamano_lote):
+        lote = pares[inicio:inicio + tamano_lote]
+        vectores = almacen().leer_lote([pk for pk, _ in lote])
+        AprobacionCalificacion.objects.bulk_create([
+            AprobacionCalificacion(calificacion_id=pk, version=version, valores=empaquetar(vectores[pk]), auditor=auditor)
+            for pk, version in lote
+        ])
+
+
+def aprobacion_anterior(calificacion, version):
+    """
+    Última aprobación anterior a `version`, en una consulta:
+    {'version', 'fecha', 'auditor' (nombre o None), 'valores' (vector)}, o None si nunca se aprobó.
+    """
+    fila = (
+        AprobacionCalificacion.objects.filter(calificacion_id=_pk(calificacion), version__lt=version)
+        .order_by('-version').values_list('version', 'fecha', 'auditor__nombre', 'valores').first()
+    )
+    if fila is None:
+        return None
+    version, fecha, auditor, valores = fila
+    return {'version': version, 'fecha': fecha, 'auditor': auditor, 'valores': desempaquetar(valores)}
+
+
+def comparar_factores(actuales, anteriores):
+    """[(nombre, actual, anterior, diferencia)]; `diferencia` es None para los factores que no cambiaron."""
+    return [
+        (nombre, actual, anterior, actual - anterior if actual != anterior else None)
+        for nombre, actual, anterior in zip(NOMBRES_FACTORES, actuales, anteriores)
+    ]
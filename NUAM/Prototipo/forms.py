@@ -1,8 +1,9 @@
 from django import forms
 from .models import Rol, Log, Calificacion, Factor
 from Prototipo.models import UsuarioFinal , Calificacion, Factor
-from django.forms import modelformset_factory
+from django.forms import formset_factory
 from .utils import NOMBRES_FACTORES
+from .factores import vector_vacio
 
 
 
@@ -119,44 +120,42 @@ class CalificacionForm(forms.ModelForm):
             'origen': forms.HiddenInput(),
         }
 
-class FactorForm(forms.ModelForm):
-    class Meta:
-        model = Factor
-        fields = ['nombre', 'valor'] 
-        widgets = {
-            'nombre': forms.TextInput(attrs={'class': 'form-control-plaintext', 'readonly': 'readonly'}),
-            'valor': forms.NumberInput(attrs={'class': 'form-control factor-input', 'step': '0.00000001'}),
-        }
+class FactorForm(forms.Form):
+    # El nombre solo se muestra: el orden de los formularios define a qué factor corresponde cada valor
+    nombre = forms.CharField(
+        max_length=100, required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control-plaintext', 'readonly': 'readonly'})
+    )
+    valor = forms.DecimalField(
+        max_digits=8, decimal_places=4,
+        widget=forms.NumberInput(attrs={'class': 'form-control factor-input', 'step': '0.00000001'})
+    )
 
 # --- Formset para manejar los 29 Factores ---
-# Establecemos extra=0 porque no queremos añadir nuevos factores, sino editar los 29 existentes.
-FactorFormSet = modelformset_factory(
-    Factor,
-    form=FactorForm,
-    fields=['nombre', 'valor'],
+# No está ligado al modelo Factor: el vector se lee y se escribe con factores.py,
+# así funciona igual con el almacenamiento EAV o con el columnar.
+FactorFormSet = formset_factory(
+    FactorForm,
     extra=0, # No se pueden añadir nuevos en este formulario
+    min_num=len(NOMBRES_FACTORES),
+    max_num=len(NOMBRES_FACTORES),
+    validate_min=True,
+    validate_max=True,
     can_delete=False
 )
 
+def get_factores_formset(valores, data=None):
+    """Formset precargado con el vector `valores` (en el orden de NOMBRES_FACTORES)."""
+    initial_data = [{'nombre': nombre, 'valor': valor} for nombre, valor in zip(NOMBRES_FACTORES, valores)]
+    return FactorFormSet(data=data, initial=initial_data)
+
+def valores_formset(formset):
+    """Vector de valores de un formset ya validado."""
+    return [form.cleaned_data['valor'] for form in formset]
+
 def get_calificacion_creation_formset(data=None):
     """
     Genera un FormSet con 29 factores listos para ser llenados, 
     usado para la pantalla de creación inicial.
     """
-    
-    # 1. Preparar los datos iniciales (nombre y valor inicial=0)
-    initial_data = [{'nombre': name, 'valor': 0.00000000} for name in NOMBRES_FACTORES]
-
-    # 2. Crear el formset
-    CreationFactorFormSet = modelformset_factory(
-        Factor,
-        form=FactorForm, # Reutiliza el FactorForm que solo muestra nombre y valor.
-        extra=0, # No queremos campos extra, solo los 29 iniciales
-        can_delete=False
-    )
-    
-    # 3. Instanciar el FormSet
-    # Nota: Usamos queryset=Factor.objects.none() para que sepa que son objetos nuevos,
-    # y 'initial' para precargar los nombres de los factores.
-    return CreationFactorFormSet(data=data, queryset=Factor.objects.none(), initial=initial_data)
-    
\ No newline at end of file
+    return get_factores_formset(vector_vacio(), data=data)
@@ -0,0 +1,229 @@
+"""
+Instrumentación de consultas SQL y latencia por vista.
+
+InstrumentacionMiddleware registra, para cada petición:
+
+- número de consultas, consultas duplicadas (mismo SQL y parámetros) y
+  consultas repetidas con distinto parámetro (síntoma típico de un N+1),
+- tiempo en la base de datos y tiempo total de la vista.
+
+Los datos se devuelven en cabeceras X-Consultas-* / Server-Timing, se
+acumulan por nombre de vista (ver la vista `metricas`) y se comparan con el
+presupuesto declarado con @presupuesto_consultas(n). Con
+INSTRUMENTACION_ESTRICTA = True, exceder el presupuesto lanza
+PresupuestoExcedido, lo que hace fallar las pruebas que usan el cliente de
+Django; PresupuestoConsultasMixin hace lo mismo de forma explícita.
+
+Las consultas hechas mientras se envía una StreamingHttpResponse (reportes
+CSV) ocurren después de la vista y no se cuentan.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class PresupuestoExcedido(AssertionError):
+    """Una vista hizo más consultas que las declaradas en su presupuesto."""
+
+
+def presupuesto_consultas(maximo):
+    """Declara el máximo de consultas SQL que puede hacer la vista decorada."""
+    def decorador(vista):
+        vista.presupuesto_consultas = maximo
+        return vista
+    return decorador
+
+
+# --- REGISTRO DE CONSULTAS ---
+
+class RegistroConsultas:
+    """execute_wrapper que cuenta consultas y tiempo de BD."""
+
+    def __init__(self):
+        self.sentencias = Counter()
+        self.textos = Counter()
+        self.tiempo_bd = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tiempo_bd += time.perf_counter() - inicio
+            self.textos[sql] += 1
+            try:
+                self.sentencias[(sql, repr(params))] += 1
+            except Exception:
+                self.sentencias[(sql, id(params))] += 1
+
+    @property
+    def consultas(self):
+        return sum(self.textos.values())
+
+    @property
+    def duplicadas(self):
+        return self.consultas - len(self.sentencias)
+
+    @property
+    def similares(self):
+        return self.consultas - len(self.textos)
+
+    def mas_repetidas(self, cantidad=3):
+        return [(sql, veces) for sql, veces in self.textos.most_common(cantidad) if veces > 1]
+
+
+@contextmanager
+def registrar_consultas():
+    """Registra las consultas de todas las conexiones del hilo actual dentro del bloque."""
+    registro = RegistroConsultas()
+    with ExitStack() as pila:
+        for alias in connections:
+            pila.enter_context(connections[alias].execute_wrapper(registro))
+        yield registro
+
+
+# --- MÉTRICAS ACUMULADAS POR VISTA ---
+
+class MetricasVistas:
+
+    def __init__(self):
+        self._datos = {}
+        self._candado = threading.Lock()
+
+    def agregar(self, vista, medicion):
+        with self._candado:
+            datos = self._datos.setdefault(vista, {
+                'peticiones': 0, 'consultas': 0, 'consultas_max': 0, 'duplicadas': 0,
+                'tiempo_bd_ms': 0.0, 'tiempo_total_ms': 0.0, 'tiempo_total_max_ms': 0.0,
+                'excedidas': 0, 'presupuesto': None,
+            })
+            datos['peticiones'] += 1
+            datos['consultas'] += medicion['consultas']
+            datos['consultas_max'] = max(datos['consultas_max'], medicion['consultas'])
+            datos['duplicadas'] += medicion['duplicadas']
+            datos['tiempo_bd_ms'] += medicion['tiempo_bd_ms']
+            datos['tiempo_total_ms'] += medicion['tiempo_total_ms']
+            datos['tiempo_total_max_ms'] = max(datos['tiempo_total_max_ms'], medicion['tiempo_total_ms'])
+            datos['excedidas'] += medicion['excedida']
+            datos['presupuesto'] = medicion['presupuesto']
+
+    def resumen(self):
+        with self._candado:
+            return {
+                vista: dict(
+                    datos,
+                    consultas_promedio=round(datos['consultas'] / datos['peticiones'], 2),
+                    tiempo_bd_promedio_ms=round(datos['tiempo_bd_ms'] / datos['peticiones'], 2),
+                    tiempo_total_promedio_ms=round(datos['tiempo_total_ms'] / datos['peticiones'], 2),
+                )
+                for vista, datos in sorted(self._datos.items())
+            }
+
+    def reiniciar(self):
+        with self._candado:
+            self._datos.clear()
+
+
+metricas_vistas = MetricasVistas()
+
+
+def _nombre_vista(request):
+    coincidencia = getattr(request, 'resolver_match', None)
+    if coincidencia is None:
+        return None
+    return coincidencia.view_name or coincidencia._func_path
+
+
+def _presupuesto(request):
+    coincidencia = getattr(request, 'resolver_match', None)
+    return getattr(coincidencia.func, 'presupuesto_consultas', None) if coincidencia else None
+
+
+# --- MIDDLEWARE ---
+
+class InstrumentacionMiddleware:
+    """
+    Mide cada petición (ver el docstring del módulo). Se activa con
+    INSTRUMENTACION_ACTIVA (por defecto igual a DEBUG).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'INSTRUMENTACION_ACTIVA', settings.DEBUG):
+            return self.get_response(request)
+
+        inicio = time.perf_counter()
+        with registrar_consultas() as registro:
+            response = self.get_response(request)
+        tiempo_total = time.perf_counter() - inicio
+
+        vista = _nombre_vista(request)
+        presupuesto = _presupuesto(request)
+        medicion = {
+            'vista': vista,
+            'consultas': registro.consultas,
+            'duplicadas': registro.duplicadas,
+            'similares': registro.similares,
+            'tiempo_bd_ms': round(registro.tiempo_bd * 1000, 2),
+            'tiempo_total_ms': round(tiempo_total * 1000, 2),
+            'presupuesto': presupuesto,
+            'excedida': presupuesto is not None and registro.consultas > presupuesto,
+        }
+        response.instrumentacion = medicion
+
+        response['X-Consultas'] = str(medicion['consultas'])
+        response['X-Consultas-Duplicadas'] = str(medicion['duplicadas'])
+        response['Server-Timing'] = f"bd;dur={medicion['tiempo_bd_ms']}, total;dur={medicion['tiempo_total_ms']}"
+        if presupuesto is not None:
+            response['X-Consultas-Presupuesto'] = str(presupuesto)
+
+        if vista is not None:
+            metricas_vistas.agregar(vista, medicion)
+
+        if medicion['excedida']:
+            mensaje = (f"La vista {vista} hizo {registro.consultas} consultas (presupuesto {presupuesto}). "
+                       f"Más repetidas: {registro.mas_repetidas()}")
+            if getattr(settings, 'INSTRUMENTACION_ESTRICTA', False):
+                raise PresupuestoExcedido(mensaje)
+            logger.warning(mensaje)
+
+        return response
+
+
+# --- AYUDA PARA PRUEBAS ---
+
+class PresupuestoConsultasMixin:
+    """
+    Mixin para django.test.TestCase:
+
+        class PanelesTest(PresupuestoConsultasMixin, TestCase):
+            def test_panel_auditor(self):
+                self.assertDentroDePresupuesto(self.client.get(reverse('PanelAuditor')))
+    """
+
+    def assertDentroDePresupuesto(self, response, maximo=None):
+        medicion = getattr(response, 'instrumentacion', None)
+        if medicion is None:
+            self.fail('La respuesta no tiene instrumentación: active INSTRUMENTACION_ACTIVA.')
+        maximo = maximo if maximo is not None else medicion['presupuesto']
+        if maximo is None:
+            self.fail(f"La vista {medicion['vista']} no declara @presupuesto_consultas.")
+        if medicion['consultas'] > maximo:
+            self.fail(f"La vista {medicion['vista']} hizo {medicion['consultas']} consultas "
+                      f"({medicion['duplicadas']} duplicadas); presupuesto: {maximo}.")
+
+    def assertSinConsultasDuplicadas(self, response):
+        medicion = getattr(response, 'instrumentacion', None)
+        if medicion is None:
+            self.fail('La respuesta no tiene instrumentación: active INSTRUMENTACION_ACTIVA.')
+        if medicion['duplicadas']:
+            self.fail(f"La vista {medicion['vista']} repitió {medicion['duplicadas']} consultas idénticas.")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from Prototipo.retencion_logs import archivar, asegurar_particiones, directorio_archivo
+
+
+class Command(BaseCommand):
+    help = (
+        "Archiva en LOGS_ARCHIVO_DIR (JSON Lines + gzip, con manifiesto) los logs anteriores a los "
+        "últimos LOGS_RETENCION_MESES meses y los saca de la base. En PostgreSQL además crea las "
+        "particiones mensuales de los próximos meses. Pensado para ejecutarse a diario (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meses', type=int, help='Meses completos que quedan en la base (por omisión, LOGS_RETENCION_MESES).')
+        parser.add_argument('--solo-particiones', action='store_true', help='Solo crear las particiones que falten.')
+
+    def handle(self, *args, **options):
+        if options['solo_particiones']:
+            creadas = asegurar_particiones()
+            self.stdout.write(self.style.SUCCESS(f'Particiones creadas: {", ".join(creadas) or "ninguna"}'))
+            return
+
+        partes = archivar(meses=options['meses'])
+        for parte in partes:
+            self.stdout.write(f"{parte['archivo']}: {parte['filas']} logs, {parte['bytes'] / 1024:.0f} KiB")
+        self.stdout.write(self.style.SUCCESS(f'Partes archivadas: {len(partes)} (en {directorio_archivo()})'))
@@ -0,0 +1,243 @@
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+
+from Prototipo import sinteticos
+from Prototipo.carga import procesar_archivo
+from Prototipo.instrumentacion import registrar_consultas
+from Prototipo.models import ArchivoCarga, Calificacion, Factor, FactoresCalificacion, Log, UsuarioFinal
+from Prototipo.utils import NOMBRES_FACTORES
+
+
+def _host():
+    hosts = [h for h in settings.ALLOWED_HOSTS if h != '*' and not h.startswith('.')]
+    return hosts[0] if hosts else 'localhost'
+
+
+def _datos_formset(rnd):
+    datos = {
+        'form-TOTAL_FORMS': str(len(NOMBRES_FACTORES)),
+        'form-INITIAL_FORMS': str(len(NOMBRES_FACTORES)),
+        'form-MIN_NUM_FORMS': str(len(NOMBRES_FACTORES)),
+        'form-MAX_NUM_FORMS': str(len(NOMBRES_FACTORES)),
+    }
+    for i, nombre in enumerate(NOMBRES_FACTORES):
+        datos[f'form-{i}-nombre'] = nombre
+        datos[f'form-{i}-valor'] = f'{rnd.randint(0, 10000) / 10000:.4f}'
+    return datos
+
+
+def _consumir(response):
+    """Lee la respuesta completa (las StreamingHttpResponse se generan al iterarlas)."""
+    if response.streaming:
+        return sum(len(bloque) for bloque in response.streaming_content)
+    return len(response.content)
+
+
+class Escenarios:
+    """
+    Caminos medidos. Cada escenario es un método que ejecuta una iteración y
+    retorna la respuesta (o None). Todos corren dentro de una transacción que
+    se revierte, así los datos quedan iguales entre iteraciones y corridas.
+    """
+
+    def __init__(self, rnd, filas_carga):
+        self.rnd = rnd
+        self.filas_carga = filas_carga
+        self.corredor = UsuarioFinal.objects.filter(
+            email__endswith=f'@{sinteticos.DOMINIO}', rol__nombre='Corredor',
+            calificacion__isnull=False
+        ).distinct().order_by('pk').first()
+        self.auditor = UsuarioFinal.objects.filter(
+            email__endswith=f'@{sinteticos.DOMINIO}', rol__nombre='Auditor'
+        ).order_by('pk').first()
+        if self.corredor is None or self.auditor is None:
+            raise CommandError('No hay datos sintéticos: ejecute primero generar_datos_sinteticos.')
+
+        self.ids_corredor = list(
+            Calificacion.objects.filter(usuario_creador=self.corredor).order_by('pk').values_list('pk', flat=True)[:1000]
+        )
+        self.cliente_corredor = Client(HTTP_HOST=_host())
+        self.cliente_corredor.force_login(self.corredor)
+        self.cliente_auditor = Client(HTTP_HOST=_host())
+        self.cliente_auditor.force_login(self.auditor)
+        self.archivo = sinteticos.archivo_carga_csv(filas_carga, random.Random(0))
+
+    def login(self):
+        return Client(HTTP_HOST=_host()).post(reverse('InicioSesion'), {
+            'email': self.corredor.email, 'password': sinteticos.CONTRASENA,
+        })
+
+    def panel_auditor(self):
+        return self.cliente_auditor.get(reverse('PanelAuditor'))
+
+    def panel_auditor_busqueda(self):
+        return self.cliente_auditor.get(reverse('PanelAuditor'), {'q': self.rnd.choice(sinteticos.NEMOTECNICOS)})
+
+    def calificacion_crear(self):
+        datos = _datos_formset(self.rnd)
+        datos.update({
+            'mercado': 'AC', 'instrumento': self.rnd.choice(sinteticos.NEMOTECNICOS), 'valor_historico': '1000.5',
+            'fecha_pago': '2025-05-15', 'evento_capital': 'Dividendo', 'descripcion': 'Benchmark',
+            'secuencia_evento': '1', 'años': '2025', 'estado': 'Pendiente', 'origen': 'Manual',
+        })
+        return self.cliente_corredor.post(reverse('IngresoCalificacionesTributarias'), datos)
+
+    def calificacion_factores_editar(self):
+        pk = self.rnd.choice(self.ids_corredor)
+        return self.cliente_corredor.post(reverse('CalificacionFactoresEditar', args=[pk]), _datos_formset(self.rnd))
+
+    def reporte_calificaciones_csv(self):
+        return self.cliente_auditor.get(reverse('ReporteCalificacionesCSV'))
+
+    def reporte_calificaciones_factores_csv(self):
+        return self.cliente_auditor.get(reverse('ReporteCalificacionesCSV'), {'factores': '1'})
+
+    def reporte_logs_csv(self):
+        return self.cliente_auditor.get(reverse('ReporteLogsCSV'))
+
+    def carga_masiva(self):
+        archivo_carga = ArchivoCarga.objects.create(nombre='benchmark.csv', cargado_por=self.corredor, estado='Procesando')
+        procesar_archivo(archivo_carga, io.BytesIO(self.archivo), self.corredor)
+        return None
+
+    NOMBRES = (
+        'login', 'panel_auditor', 'panel_auditor_busqueda', 'calificacion_crear', 'calificacion_factores_editar',
+        'reporte_calificaciones_csv', 'reporte_calificaciones_factores_csv', 'reporte_logs_csv', 'carga_masiva',
+    )
+
+
+def _percentil(valores, porcentaje):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(porcentaje / 100 * (len(ordenados) - 1)))]
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide los caminos principales (login, paneles, creación y edición de calificaciones, reportes CSV y '
+        'carga masiva) contra la base de datos configurada y emite los resultados en JSON. '
+        'Requiere datos de generar_datos_sinteticos; los cambios de cada iteración se revierten.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=10)
+        parser.add_argument('--calentamiento', type=int, default=1, help='Iteraciones previas que no se miden.')
+        parser.add_argument('--escenarios', nargs='+', choices=Escenarios.NOMBRES, help='Por defecto, todos.')
+        parser.add_argument('--filas-carga', type=int, default=2000, help='Filas del archivo de carga masiva.')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--salida', help='Archivo JSON de resultados (por defecto, la salida estándar).')
+        parser.add_argument('--comparar', help='JSON de una corrida anterior para mostrar la variación de la mediana.')
+        parser.add_argument(
+            '--umbral', type=float,
+            help='Con --comparar: termina con error si algún escenario empeora más que este porcentaje.'
+        )
+
+    def _medir(self, escenario, repeticiones, calentamiento):
+        tiempos, consultas, estado = [], [], None
+        for iteracion in range(calentamiento + repeticiones):
+            with transaction.atomic():
+                with registrar_consultas() as registro:
+                    inicio = time.perf_counter()
+                    response = escenario()
+                    if response is not None:
+                        _consumir(response)
+                    transcurrido = time.perf_counter() - inicio
+                transaction.set_rollback(True)
+            if iteracion >= calentamiento:
+                tiempos.append(transcurrido * 1000)
+                consultas.append(registro.consultas)
+                estado = response.status_code if response is not None else None
+        return {
+            'repeticiones': repeticiones,
+            'min_ms': round(min(tiempos), 3),
+            'mediana_ms': round(statistics.median(tiempos), 3),
+            'promedio_ms': round(statistics.fmean(tiempos), 3),
+            'p95_ms': round(_percentil(tiempos, 95), 3),
+            'max_ms': round(max(tiempos), 3),
+            'consultas': statistics.median(consultas),
+            'estado_http': estado,
+        }
+
+    def handle(self, *args, **options):
+        if options['repeticiones'] < 1:
+            raise CommandError('--repeticiones debe ser al menos 1.')
+
+        escenarios = Escenarios(random.Random(options['semilla']), options['filas_carga'])
+        resultados = {
+            'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': _commit_actual(),
+            'base_de_datos': connection.vendor,
+            'motor': connection.settings_dict['ENGINE'],
+            'factores_almacenamiento': getattr(settings, 'FACTORES_ALMACENAMIENTO', 'eav'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'volumen': {
+                'usuarios': UsuarioFinal.objects.count(),
+                'calificaciones': Calificacion.objects.count(),
+                'factores': Factor.objects.count(),
+                'vectores_columnares': FactoresCalificacion.objects.count(),
+                'logs': Log.objects.count(),
+                'filas_carga': options['filas_carga'],
+            },
+            'escenarios': {},
+        }
+
+        for nombre in options['escenarios'] or Escenarios.NOMBRES:
+            self.stderr.write(f'Midiendo {nombre}...')
+            resultados['escenarios'][nombre] = self._medir(
+                getattr(escenarios, nombre), options['repeticiones'], options['calentamiento']
+            )
+
+        texto = json.dumps(resultados, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(texto + '\n')
+        else:
+            self.stdout.write(texto)
+
+        if options['comparar']:
+            self._comparar(resultados, options['comparar'], options['umbral'])
+
+    def _comparar(self, resultados, ruta, umbral):
+        with open(ruta, encoding='utf-8') as archivo:
+            anterior_completo = json.load(archivo)
+        anteriores = anterior_completo['escenarios']
+        for clave in ('base_de_datos', 'factores_almacenamiento', 'volumen'):
+            if anterior_completo.get(clave) != resultados[clave]:
+                self.stderr.write(self.style.WARNING(f'Atención: {clave} distinto al de la corrida anterior.'))
+
+        peores = []
+        for nombre, actual in resultados['escenarios'].items():
+            anterior = anteriores.get(nombre)
+            if not anterior:
+                continue
+            variacion = (actual['mediana_ms'] - anterior['mediana_ms']) / anterior['mediana_ms'] * 100
+            self.stderr.write(
+                f"{nombre:40} {anterior['mediana_ms']:>10.2f} ms -> {actual['mediana_ms']:>10.2f} ms "
+                f"({variacion:+.1f}%)  consultas {anterior['consultas']} -> {actual['consultas']}"
+            )
+            if umbral is not None and variacion > umbral:
+                peores.append(nombre)
+
+        if peores:
+            raise CommandError(f"Escenarios más lentos que el umbral ({umbral}%): {', '.join(peores)}")
@@ -0,0 +1,172 @@
+import csv
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from Prototipo import api
+from Prototipo.factores import leer_factores_lote
+from Prototipo.models import Calificacion, Log
+from Prototipo.serializacion import EscritorCSV, arreglo_json, fecha_hora, nulo, una_linea
+from Prototipo.utils import NOMBRES_FACTORES
+
+TAMANO_BLOQUE = 2000
+COLUMNAS_REPORTE = (
+    'pk', 'instrumento', 'mercado', 'valor_historico', 'años', 'estado',
+    'fecha_creacion', 'usuario_creador__nombre', 'usuario_creador__email',
+)
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def _bloques(consulta, filas):
+    """Bloques de TAMANO_BLOQUE elementos de las primeras `filas` de la consulta (por id)."""
+    elementos = consulta.order_by('id')[:filas].iterator(chunk_size=TAMANO_BLOQUE)
+    bloque = []
+    for elemento in elementos:
+        bloque.append(elemento)
+        if len(bloque) == TAMANO_BLOQUE:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+# Cada variante retorna el texto completo; las de un mismo formato deben coincidir.
+# "instancias" es el camino anterior: un objeto del modelo por fila y el formato decidido fila a fila.
+
+def csv_calificaciones_instancias(filas, con_factores):
+    writer = csv.writer(Echo())
+    partes = []
+    for bloque in _bloques(Calificacion.objects.select_related('usuario_creador'), filas):
+        vectores = leer_factores_lote([c.pk for c in bloque]) if con_factores else None
+        for c in bloque:
+            fila = [
+                c.pk, c.instrumento, c.mercado, c.valor_historico, c.años, c.estado,
+                c.fecha_creacion.strftime('%Y-%m-%d'), c.usuario_creador.nombre, c.usuario_creador.email,
+            ]
+            if con_factores:
+                fila += vectores[c.pk]
+            partes.append(writer.writerow(fila))
+    return ''.join(partes)
+
+
+def csv_calificaciones_tuplas(filas, con_factores):
+    escritor = EscritorCSV([None] * (len(COLUMNAS_REPORTE) + (len(NOMBRES_FACTORES) if con_factores else 0)))
+    partes = []
+    for bloque in _bloques(Calificacion.objects.values_list(*COLUMNAS_REPORTE), filas):
+        if con_factores:
+            vectores = leer_factores_lote([fila[0] for fila in bloque])
+            bloque = [(*fila, *vectores[fila[0]]) for fila in bloque]
+        partes.append(escritor.bloque(bloque))
+    return ''.join(partes)
+
+
+def json_calificaciones_instancias(filas, con_factores):
+    campos = api.CAMPOS if con_factores else api.CAMPOS[:-1]
+    partes = []
+    for bloque in _bloques(Calificacion.objects.all(), filas):
+        vectores = leer_factores_lote([c.pk for c in bloque]) if con_factores else None
+        resultados = []
+        for c in bloque:
+            resultado = {campo: getattr(c, Calificacion._meta.get_field(campo).attname) for campo in campos if campo != api.FACTORES}
+            if con_factores:
+                resultado[api.FACTORES] = dict(zip(NOMBRES_FACTORES, vectores[c.pk]))
+            resultados.append(resultado)
+        partes.append(json.dumps(resultados, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')))
+    return ''.join(partes)
+
+
+def json_calificaciones_tuplas(filas, con_factores):
+    campos = api.CAMPOS if con_factores else api.CAMPOS[:-1]
+    formatear = api._formateador(campos)
+    columnas = [campo for campo in campos if campo not in ('id', 'version', api.FACTORES)]
+    partes = []
+    for bloque in _bloques(Calificacion.objects.values_list('id', 'version', *columnas), filas):
+        if con_factores:
+            vectores = leer_factores_lote([fila[0] for fila in bloque])
+            bloque = [(*fila, vectores[fila[0]]) for fila in bloque]
+        partes.append(arreglo_json(bloque, formatear))
+    return ''.join(partes)
+
+
+def csv_logs_instancias(filas, con_factores):
+    writer = csv.writer(Echo())
+    partes = []
+    for bloque in _bloques(Log.objects.select_related('usuario'), filas):
+        for log in bloque:
+            partes.append(writer.writerow([
+                log.pk, log.fecha_hora.strftime('%Y-%m-%d %H:%M:%S'), log.accion,
+                log.usuario_id if log.usuario_id is not None else 'N/A',
+                (log.usuario.email if log.usuario else None) or 'Sistema',
+                log.detalle_cambio.replace('\n', ' ').replace('\r', ' '),
+            ]))
+    return ''.join(partes)
+
+
+def csv_logs_tuplas(filas, con_factores):
+    escritor = EscritorCSV([None, fecha_hora, None, nulo(str, 'N/A'), lambda email: email or 'Sistema', una_linea])
+    consulta = Log.objects.values_list('id', 'fecha_hora', 'accion', 'usuario_id', 'usuario__email', 'detalle_cambio')
+    return ''.join(escritor.bloque(bloque) for bloque in _bloques(consulta, filas))
+
+
+CASOS = {
+    'csv_calificaciones': (csv_calificaciones_instancias, csv_calificaciones_tuplas),
+    'json_calificaciones': (json_calificaciones_instancias, json_calificaciones_tuplas),
+    'csv_logs': (csv_logs_instancias, csv_logs_tuplas),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara la serialización por volumen (serializacion.py: tuplas de values_list y formato compilado) '
+        'con el camino por instancias del modelo, sobre las mismas filas. Verifica que ambas salidas sean '
+        'idénticas y emite los resultados en JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=20000, help='Filas de cada tabla (las primeras por id).')
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--casos', nargs='+', choices=list(CASOS), help='Por defecto, todos.')
+        parser.add_argument('--sin-factores', action='store_true', help='Calificaciones sin sus factores.')
+        parser.add_argument('--salida', help='Archivo JSON de resultados (por defecto, la salida estándar).')
+
+    def _medir(self, variante, filas, con_factores, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones + 1):  # La primera calienta cachés y no se mide
+            inicio = time.perf_counter()
+            texto = variante(filas, con_factores)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return texto, statistics.median(tiempos[1:])
+
+    def handle(self, *args, **options):
+        if options['repeticiones'] < 1 or options['filas'] < 1:
+            raise CommandError('--filas y --repeticiones deben ser al menos 1.')
+        con_factores = not options['sin_factores']
+
+        resultados = {'filas': options['filas'], 'factores': con_factores, 'casos': {}}
+        for nombre in options['casos'] or CASOS:
+            self.stderr.write(f'Midiendo {nombre}...')
+            instancias, tuplas = CASOS[nombre]
+            texto_instancias, ms_instancias = self._medir(instancias, options['filas'], con_factores, options['repeticiones'])
+            texto_tuplas, ms_tuplas = self._medir(tuplas, options['filas'], con_factores, options['repeticiones'])
+            if texto_instancias != texto_tuplas:
+                raise CommandError(f'{nombre}: las salidas de ambos caminos no coinciden.')
+            resultados['casos'][nombre] = {
+                'bytes': len(texto_tuplas.encode('utf-8')),
+                'instancias_ms': round(ms_instancias, 3),
+                'tuplas_ms': round(ms_tuplas, 3),
+                'aceleracion': round(ms_instancias / ms_tuplas, 2),
+            }
+
+        texto = json.dumps(resultados, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(texto + '\n')
+        else:
+            self.stdout.write(texto)
@@ -0,0 +1,46 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from Prototipo import sinteticos
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera datos sintéticos reproducibles: N usuarios por rol, M calificaciones '
+        '(cada una con su vector de factores) y K logs. '
+        f'Los usuarios quedan con la contraseña "{sinteticos.CONTRASENA}".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios-por-rol', type=int, default=10)
+        parser.add_argument('--calificaciones', type=int, default=10000)
+        parser.add_argument('--logs', type=int, default=50000)
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--lote', type=int, default=1000, help='Calificaciones por transacción.')
+        parser.add_argument('--limpiar', action='store_true', help='Borra los datos sintéticos existentes antes de generar.')
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['semilla'])
+
+        if options['limpiar']:
+            usuarios, logs = sinteticos.eliminar_datos()
+            self.stdout.write(f'Eliminados: {usuarios} filas de usuarios (con sus calificaciones) y {logs} logs.')
+
+        usuarios = sinteticos.crear_usuarios(options['usuarios_por_rol'])
+        todos = [usuario for lista in usuarios.values() for usuario in lista]
+        self.stdout.write(f'Usuarios sintéticos: {len(todos)}')
+
+        if options['calificaciones'] and not usuarios['Corredor']:
+            self.stderr.write('Se necesita al menos un Corredor para crear calificaciones.')
+            return
+
+        def avance(etiqueta, total):
+            return lambda hechas: self.stdout.write(f'  {etiqueta}: {hechas}/{total}')
+
+        sinteticos.crear_calificaciones(
+            options['calificaciones'], usuarios['Corredor'], rnd, options['lote'],
+            al_avanzar=avance('Calificaciones', options['calificaciones'])
+        )
+        sinteticos.crear_logs(options['logs'], todos, rnd, al_avanzar=avance('Logs', options['logs']))
+        self.stdout.write(self.style.SUCCESS('Datos sintéticos generados.'))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from Prototipo.factores import ALMACENES, almacen
+from Prototipo.models import Calificacion
+
+
+class Command(BaseCommand):
+    help = (
+        "Copia los vectores de factores de un almacenamiento a otro ('eav' o 'columnar'). "
+        "Se procesa por lotes de calificaciones y puede re-ejecutarse sin duplicar datos. "
+        "Luego ajuste FACTORES_ALMACENAMIENTO en settings.py."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', default='eav', choices=sorted(ALMACENES))
+        parser.add_argument('--hacia', default='columnar', choices=sorted(ALMACENES))
+        parser.add_argument('--lote', type=int, default=1000, help='Calificaciones por transacción.')
+        parser.add_argument('--eliminar-origen', action='store_true', help='Borra los datos del origen ya copiados.')
+
+    def handle(self, *args, **options):
+        if options['desde'] == options['hacia']:
+            raise CommandError('El origen y el destino deben ser distintos.')
+
+        origen = almacen(options['desde'])
+        destino = almacen(options['hacia'])
+        ultimo_pk = 0
+        total = 0
+
+        while True:
+            ids = list(
+                Calificacion.objects.filter(pk__gt=ultimo_pk).order_by('pk').values_list('pk', flat=True)[:options['lote']]
+            )
+            if not ids:
+                break
+
+            vectores = origen.leer_lote(ids)
+            with transaction.atomic():
+                destino.eliminar_lote(ids)
+                destino.crear_lote(vectores.items())
+                if options['eliminar_origen']:
+                    origen.eliminar_lote(ids)
+
+            ultimo_pk = ids[-1]
+            total += len(ids)
+            self.stdout.write(f'{total} calificaciones migradas...')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Migración {options['desde']} -> {options['hacia']} completa: {total} calificaciones."
+        ))
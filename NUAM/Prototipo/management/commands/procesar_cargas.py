@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from Prototipo.tareas import contexto_fork, trabajar_cola, reencolar_huerfanas
+
+
+def _proceso_trabajador(continuo, intervalo):
+    trabajar_cola(continuo=continuo, intervalo=intervalo)
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa las cargas masivas en estado 'Pendiente'. "
+        "Con --procesos N se lanzan N procesos trabajadores que reclaman cargas en paralelo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=1, help='Número de procesos trabajadores.')
+        parser.add_argument('--continuo', action='store_true', help='No terminar cuando la cola quede vacía.')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos entre consultas a la cola vacía.')
+        parser.add_argument(
+            '--reencolar-huerfanas', type=int, metavar='MINUTOS',
+            help="Antes de empezar, vuelve a 'Pendiente' las cargas 'Procesando' hace más de MINUTOS."
+        )
+
+    def handle(self, *args, **options):
+        if options['reencolar_huerfanas'] is not None:
+            total = reencolar_huerfanas(options['reencolar_huerfanas'])
+            self.stdout.write(f'Cargas reencoladas: {total}')
+
+        contexto = contexto_fork() if options['procesos'] > 1 else None
+        if options['procesos'] > 1 and contexto is None:
+            self.stderr.write(self.style.WARNING('Esta plataforma no permite fork: se usa un solo proceso trabajador.'))
+        if contexto is None:
+            procesadas = trabajar_cola(continuo=options['continuo'], intervalo=options['intervalo'])
+            self.stdout.write(self.style.SUCCESS(f'Cargas procesadas: {procesadas}'))
+            return
+
+        # Las conexiones no se pueden compartir entre procesos: cada hijo abre la suya
+        connections.close_all()
+        procesos = [
+            contexto.Process(target=_proceso_trabajador, args=(options['continuo'], options['intervalo']))
+            for _ in range(options['procesos'])
+        ]
+        for proceso in procesos:
+            proceso.start()
+        for proceso in procesos:
+            proceso.join()
+        self.stdout.write(self.style.SUCCESS(f"{options['procesos']} trabajadores finalizados."))
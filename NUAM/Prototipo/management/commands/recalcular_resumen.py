@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Prototipo import resumen
+from Prototipo.models import Calificacion, PendientesCorredor, ResumenCalificacion
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye el resumen de calificaciones de los paneles (ResumenCalificacion y PendientesCorredor) '
+        'con un GROUP BY sobre Calificacion. Con --verificar solo compara y reporta las diferencias.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verificar', action='store_true', help='No escribe: termina con error si hay diferencias.')
+
+    def handle(self, *args, **options):
+        if not options['verificar']:
+            combinaciones, corredores = resumen.recalcular()
+            self.stdout.write(self.style.SUCCESS(
+                f'Resumen reconstruido: {combinaciones} combinaciones, {corredores} corredores con pendientes.'
+            ))
+            return
+
+        esperado = resumen.delta_consulta(Calificacion.objects.all())
+        cubo = {
+            tuple(clave): cantidad
+            for *clave, cantidad in ResumenCalificacion.objects.values_list(*resumen.DIMENSIONES, 'cantidad')
+        }
+        pendientes = dict(PendientesCorredor.objects.values_list('usuario_id', 'cantidad'))
+
+        diferencias = 0
+        for nombre, actual, correcto in (('combinación', cubo, esperado.cubo), ('corredor', pendientes, esperado.pendientes)):
+            for clave in set(actual) | set(correcto):
+                if actual.get(clave, 0) != correcto.get(clave, 0):
+                    diferencias += 1
+                    self.stdout.write(f'{nombre} {clave}: resumen {actual.get(clave, 0)}, real {correcto.get(clave, 0)}')
+
+        if diferencias:
+            raise CommandError(f'{diferencias} contadores difieren: ejecute recalcular_resumen sin --verificar.')
+        self.stdout.write(self.style.SUCCESS('El resumen coincide con las calificaciones.'))
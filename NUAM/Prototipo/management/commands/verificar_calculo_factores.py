@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Prototipo.calculo_factores import calcular_factores, calcular_factores_lote, elegir_motor, verificar_lote
+from Prototipo.carga import ErrorFormatoArchivo, leer_filas, validar_fila, TAMANO_LOTE
+
+
+class Command(BaseCommand):
+    help = (
+        'Modo de verificación para auditoría: calcula los factores de un archivo de carga con el motor '
+        'vectorizado y con la referencia Decimal exacta, y reporta cualquier diferencia.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Archivo CSV, .xlsx o .xls con el formato de carga masiva.')
+        parser.add_argument('--motor', choices=('auto', 'numpy', 'python'), default='auto')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE)
+        parser.add_argument('--max-diferencias', type=int, default=20, help='Diferencias a mostrar.')
+
+    def handle(self, *args, **options):
+        filas = diferencias = invalidas = 0
+        tiempo_motor = tiempo_decimal = 0.0
+        motor_usado = elegir_motor(options['lote'], motor=options['motor'])
+
+        def verificar(numeros, lote):
+            nonlocal diferencias, tiempo_motor, tiempo_decimal
+            inicio = time.perf_counter()
+            factores = calcular_factores_lote(lote, motor=options['motor'], verificar=False)
+            tiempo_motor += time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            for montos in lote:
+                calcular_factores(montos)
+            tiempo_decimal += time.perf_counter() - inicio
+
+            for posicion, indice, esperado, obtenido in verificar_lote(lote, factores):
+                diferencias += 1
+                if diferencias <= options['max_diferencias']:
+                    self.stdout.write(
+                        f'Fila {numeros[posicion]}, factor {indice}: Decimal {esperado} != motor {obtenido}'
+                    )
+
+        numeros, lote = [], []
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                for numero, fila in leer_filas(archivo):
+                    datos, errores = validar_fila(fila)
+                    if errores:
+                        invalidas += 1
+                        continue
+                    numeros.append(numero)
+                    lote.append(datos['montos'])
+                    filas += 1
+                    if len(lote) >= options['lote']:
+                        verificar(numeros, lote)
+                        numeros, lote = [], []
+                if lote:
+                    verificar(numeros, lote)
+        except (OSError, ErrorFormatoArchivo) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f'Filas verificadas: {filas} (omitidas por errores de formato: {invalidas}). '
+            f'Motor {motor_usado}: {tiempo_motor * 1000:.1f} ms; referencia Decimal: {tiempo_decimal * 1000:.1f} ms.'
+        )
+        if diferencias:
+            raise CommandError(f'{diferencias} factores difieren de la referencia Decimal.')
+        self.stdout.write(self.style.SUCCESS('Todos los factores coinciden con la referencia Decimal.'))
@@ -0,0 +1,109 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from Prototipo import cadena_logs
+from Prototipo.models import CadenaLog
+from Prototipo.retencion_logs import leer_manifiesto, verificar_archivo
+from Prototipo.tareas import contexto_fork
+
+
+def _enlace_archivado(partes, mes, desde):
+    """Hash de la última entrada archivada del mes anterior a `desde` (o None)."""
+    anteriores = [p for p in partes if p['mes'] == mes and p['id_max'] < desde]
+    return max(anteriores, key=lambda p: p['id_max'])['hash_id_max'] if anteriores else None
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifica la cadena de hashes del registro de auditoría (ver Prototipo/cadena_logs.py): "
+        "reparte los meses en tramos de ids entre varios procesos, compara con los puntos de control "
+        "y con el final de cada cadena, e informa la primera ruptura. Pensado para ejecutarse cada noche."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=multiprocessing.cpu_count(), help='Procesos verificadores.')
+        parser.add_argument('--tamano-tramo', type=int, default=200_000, help='Ids por tramo (unidad de trabajo).')
+        parser.add_argument('--intervalo', type=int, default=100_000, help='Entradas entre puntos de control nuevos.')
+        parser.add_argument('--archivo', action='store_true', help='Verificar además el sha256 de los meses archivados.')
+        parser.add_argument('--sin-puntos', action='store_true', help='No guardar puntos de control nuevos.')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        # Los finales se leen antes que los tramos: todo lo anterior a ellos debe estar
+        finales = {cadena.mes: cadena for cadena in CadenaLog.objects.all()}
+        partes = leer_manifiesto()['partes']
+        lista, rupturas = cadena_logs.tramos(options['tamano_tramo'])
+        tareas = [
+            (mes, desde, hasta, options['intervalo'], _enlace_archivado(partes, mes, desde),
+             finales[mes].ultimo_id if mes in finales else None)
+            for mes, desde, hasta in lista
+        ]
+
+        contexto = contexto_fork() if options['procesos'] > 1 and len(tareas) > 1 else None
+        if options['procesos'] > 1 and len(tareas) > 1 and contexto is None:
+            self.stderr.write(self.style.WARNING('Esta plataforma no permite fork: se verifica en un solo proceso.'))
+        if contexto is None:
+            resultados = [cadena_logs.verificar_tramo(*tarea) for tarea in tareas]
+        else:
+            # Las conexiones no se pueden compartir entre procesos: cada hijo abre la suya
+            connections.close_all()
+            with contexto.Pool(min(options['procesos'], len(tareas))) as pool:
+                resultados = pool.starmap(cadena_logs.verificar_tramo, tareas, chunksize=1)
+
+        rupturas += [r['ruptura'] for r in resultados if r['ruptura']]
+        rupturas += self._comparar_finales(finales, resultados, partes)
+        if options['archivo']:
+            rupturas += [
+                {'mes': parte['mes'], 'id': parte['id_min'], 'motivo': f"{parte['archivo']}: {motivo}"}
+                for parte, motivo in verificar_archivo()
+            ]
+
+        entradas = sum(r['filas'] for r in resultados)
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(
+            f'{entradas} entradas en {len(tareas)} tramos, {segundos:.1f} s '
+            f'({entradas / segundos if segundos else 0:,.0f} entradas/s).'
+        )
+        if not options['sin_puntos']:
+            rotos = {r['mes'] for r in rupturas}
+            cadena_logs.guardar_puntos([r for r in resultados if r['mes'] not in rotos])
+
+        if rupturas:
+            rupturas.sort(key=lambda r: (r['mes'], r['id']))
+            for ruptura in rupturas[:20]:
+                self.stderr.write(f"{ruptura['mes']} / entrada {ruptura['id']}: {ruptura['motivo']}")
+            primera = rupturas[0]
+            raise CommandError(f"Cadena rota: mes {primera['mes']}, entrada {primera['id']} ({len(rupturas)} rupturas).")
+        self.stdout.write(self.style.SUCCESS('La cadena de logs está íntegra.'))
+
+    def _comparar_finales(self, finales, resultados, partes):
+        """
+        Cada mes debe llegar hasta el final de su cadena leído al empezar, con
+        ese mismo hash y esa cantidad de entradas: detecta entradas borradas al
+        final, que no rompen ningún enlace.
+        """
+        rupturas = []
+        por_mes = {}
+        for resultado in resultados:
+            por_mes.setdefault(resultado['mes'], []).append(resultado)
+        for mes, cadena in sorted(finales.items()):
+            tramos = por_mes.get(mes, [])
+            if any(r['ruptura'] for r in tramos):
+                continue
+            archivadas = [p for p in partes if p['mes'] == mes]
+            filas = sum(p['filas'] for p in archivadas) + sum(r['filas_final'] for r in tramos)
+            hash_final = next((r['hash_final'] for r in tramos if r['hash_final']), None)
+            if hash_final is None and archivadas:
+                ultima = max(archivadas, key=lambda p: p['id_max'])
+                if ultima['id_max'] == cadena.ultimo_id:
+                    hash_final = ultima['hash_id_max']
+            if hash_final is None:
+                rupturas.append({'mes': mes, 'id': cadena.ultimo_id, 'motivo': 'falta la última entrada de la cadena'})
+            elif hash_final != cadena.hash_cadena:
+                rupturas.append({'mes': mes, 'id': cadena.ultimo_id, 'motivo': 'el hash de la última entrada no coincide con el final de la cadena'})
+            elif filas != cadena.filas:
+                rupturas.append({'mes': mes, 'id': cadena.ultimo_id, 'motivo': f'hay {filas} entradas y la cadena registra {cadena.filas}'})
+        return rupturas
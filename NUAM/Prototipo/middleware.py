@@ -0,0 +1,15 @@
+from .roles import resolver_rol
+
+
+class RolMiddleware:
+    """
+    Deja en `request.rol` el Rol del usuario (None si es anónimo o no tiene rol).
+    Va después de AuthenticationMiddleware en settings.MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.rol = resolver_rol(request.user)
+        return self.get_response(request)
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prototipo', '0004_remove_calificacion_comentarios_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivocarga',
+            name='archivo',
+            field=models.FileField(blank=True, null=True, upload_to='cargas/%Y/%m/'),
+        ),
+        migrations.AddField(
+            model_name='archivocarga',
+            name='errores',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='archivocarga',
+            name='fecha_fin',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivocarga',
+            name='fecha_inicio',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivocarga',
+            name='filas_fallidas',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='archivocarga',
+            name='filas_procesadas',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='archivocarga',
+            name='estado',
+            field=models.CharField(default='Pendiente', max_length=20),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prototipo', '0005_archivocarga_progreso'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FactoresCalificacion',
+            fields=[
+                ('calificacion', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='vector_factores', serialize=False, to='Prototipo.calificacion')),
+                ('valores', models.BinaryField()),
+            ],
+            options={
+                'verbose_name': 'Vector de Factores',
+                'verbose_name_plural': 'Vectores de Factores',
+            },
+        ),
+    ]
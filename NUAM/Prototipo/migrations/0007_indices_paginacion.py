@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prototipo', '0006_factorescalificacion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='calificacion',
+            index=models.Index(fields=['-fecha_creacion', '-id'], name='calif_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='calificacion',
+            index=models.Index(fields=['usuario_creador', '-fecha_creacion', '-id'], name='calif_usuario_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['-fecha_hora', '-id'], name='log_fecha_id_idx'),
+        ),
+    ]
@@ -0,0 +1,108 @@
+"""
+Índices de búsqueda de texto completo (ver busqueda.py).
+
+PostgreSQL: columnas generadas tsvector + GIN, e índices de trigramas (pg_trgm).
+SQLite: tablas FTS5 de contenido externo sincronizadas por triggers.
+
+El SQL está copiado aquí, no importado de busqueda.py: la migración no debe
+cambiar si el módulo cambia. busqueda.al_migrar reinstala los triggers
+después de cada `migrate` con el código vigente.
+"""
+from django.db import migrations
+
+POSTGRES_CREAR = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    '''ALTER TABLE "Prototipo_calificacion" ADD COLUMN busqueda tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('spanish', coalesce(instrumento, '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(mercado, '')), 'B') ||
+        setweight(to_tsvector('spanish', coalesce(evento_capital, '')), 'B') ||
+        setweight(to_tsvector('spanish', coalesce(descripcion, '')), 'C') ||
+        setweight(to_tsvector('spanish', coalesce(estado, '')), 'D')
+    ) STORED''',
+    'CREATE INDEX calif_busqueda_gin ON "Prototipo_calificacion" USING gin (busqueda)',
+    'CREATE INDEX calif_instrumento_trgm ON "Prototipo_calificacion" USING gin (instrumento gin_trgm_ops)',
+    '''ALTER TABLE "Prototipo_log" ADD COLUMN busqueda tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('spanish', coalesce(accion, '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(detalle_cambio, '')), 'B')
+    ) STORED''',
+    'CREATE INDEX log_busqueda_gin ON "Prototipo_log" USING gin (busqueda)',
+    'CREATE INDEX log_detalle_trgm ON "Prototipo_log" USING gin (detalle_cambio gin_trgm_ops)',
+]
+
+POSTGRES_ELIMINAR = [
+    'DROP INDEX IF EXISTS log_detalle_trgm',
+    'DROP INDEX IF EXISTS log_busqueda_gin',
+    'ALTER TABLE "Prototipo_log" DROP COLUMN IF EXISTS busqueda',
+    'DROP INDEX IF EXISTS calif_instrumento_trgm',
+    'DROP INDEX IF EXISTS calif_busqueda_gin',
+    'ALTER TABLE "Prototipo_calificacion" DROP COLUMN IF EXISTS busqueda',
+]
+
+
+# Columnas de cada tabla FTS5, en el orden de los pesos de busqueda.INDICES
+SQLITE_COLUMNAS = {
+    'Prototipo_calificacion': ('instrumento', 'mercado', 'evento_capital', 'descripcion', 'estado'),
+    'Prototipo_log': ('accion', 'detalle_cambio'),
+}
+
+
+def _sql_fts5(tabla, columnas):
+    fts = f'{tabla}_fts'
+    lista = ', '.join(columnas)
+    nuevos = ', '.join(f'new.{c}' for c in columnas)
+    viejos = ', '.join(f'old.{c}' for c in columnas)
+    return [
+        f'''CREATE VIRTUAL TABLE IF NOT EXISTS "{fts}" USING fts5(
+            {lista}, content='{tabla}', content_rowid='id', prefix='2 3 4',
+            tokenize='unicode61 remove_diacritics 2')''',
+        f'''CREATE TRIGGER IF NOT EXISTS "{fts}_ai" AFTER INSERT ON "{tabla}" BEGIN
+            INSERT INTO "{fts}"(rowid, {lista}) VALUES (new.id, {nuevos});
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS "{fts}_ad" AFTER DELETE ON "{tabla}" BEGIN
+            INSERT INTO "{fts}"("{fts}", rowid, {lista}) VALUES ('delete', old.id, {viejos});
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS "{fts}_au" AFTER UPDATE ON "{tabla}" BEGIN
+            INSERT INTO "{fts}"("{fts}", rowid, {lista}) VALUES ('delete', old.id, {viejos});
+            INSERT INTO "{fts}"(rowid, {lista}) VALUES (new.id, {nuevos});
+        END''',
+        f'''INSERT INTO "{fts}"("{fts}") VALUES ('rebuild')''',
+    ]
+
+
+def _sqlite_eliminar(tabla):
+    fts = f'{tabla}_fts'
+    return [f'DROP TRIGGER IF EXISTS "{fts}_{sufijo}"' for sufijo in ('ai', 'ad', 'au')] + [f'DROP TABLE IF EXISTS "{fts}"']
+
+
+def _ejecutar(schema_editor, sentencias):
+    for sentencia in sentencias:
+        schema_editor.execute(sentencia)
+
+
+def crear_indices(apps, schema_editor):
+    conexion = schema_editor.connection
+    if conexion.vendor == 'postgresql':
+        _ejecutar(schema_editor, POSTGRES_CREAR)
+    elif conexion.vendor == 'sqlite':
+        for tabla, columnas in SQLITE_COLUMNAS.items():
+            _ejecutar(schema_editor, _sql_fts5(tabla, columnas))
+
+
+def eliminar_indices(apps, schema_editor):
+    conexion = schema_editor.connection
+    if conexion.vendor == 'postgresql':
+        _ejecutar(schema_editor, POSTGRES_ELIMINAR)
+    elif conexion.vendor == 'sqlite':
+        for tabla in SQLITE_COLUMNAS:
+            _ejecutar(schema_editor, _sqlite_eliminar(tabla))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prototipo', '0007_indices_paginacion'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, eliminar_indices),
+    ]
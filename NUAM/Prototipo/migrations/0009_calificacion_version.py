@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prototipo', '0008_busqueda_texto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calificacion',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
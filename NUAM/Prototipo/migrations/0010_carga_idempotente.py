@@ -0,0 +1,57 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def verificar_duplicados(apps, schema_editor):
+    """La restricción única no se puede crear si ya hay duplicados: se informan en vez de borrarlos."""
+    Calificacion = apps.get_model('Prototipo', 'Calificacion')
+    clave = ('usuario_creador', 'instrumento', 'fecha_pago', 'secuencia_evento', 'mercado', 'años')
+    duplicados = (
+        Calificacion.objects.using(schema_editor.connection.alias)
+        .values(*clave).annotate(cantidad=Count('id')).filter(cantidad__gt=1)
+    )
+    if duplicados.exists():
+        ejemplos = ', '.join(
+            f"{d['instrumento']} {d['fecha_pago']} sec. {d['secuencia_evento']} (corredor {d['usuario_creador']})"
+            for d in duplicados[:5]
+        )
+        raise RuntimeError(
+            f'Hay {duplicados.count()} grupos de calificaciones con la misma clave natural '
+            f'(corredor, instrumento, fecha de pago, secuencia, mercado, ejercicio), por ejemplo: {ejemplos}. '
+            'Elimine o corrija los duplicados antes de aplicar esta migración.'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prototipo', '0009_calificacion_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivocarga',
+            name='filas_actualizadas',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='archivocarga',
+            name='filas_insertadas',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='archivocarga',
+            name='filas_sin_cambios',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='calificacion',
+            name='hash_contenido',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.RunPython(verificar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='calificacion',
+            constraint=models.UniqueConstraint(fields=('usuario_creador', 'instrumento', 'fecha_pago', 'secuencia_evento', 'mercado', 'años'), name='calif_clave_natural_uniq'),
+        ),
+    ]
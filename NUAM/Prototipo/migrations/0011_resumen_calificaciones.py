@@ -0,0 +1,60 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def poblar_resumen(apps, schema_editor):
+    """Carga inicial del resumen con un GROUP BY; desde aquí lo mantiene resumen.py."""
+    alias = schema_editor.connection.alias
+    Calificacion = apps.get_model('Prototipo', 'Calificacion')
+    ResumenCalificacion = apps.get_model('Prototipo', 'ResumenCalificacion')
+    PendientesCorredor = apps.get_model('Prototipo', 'PendientesCorredor')
+
+    grupos = Calificacion.objects.using(alias).values('estado', 'mercado', 'años', 'origen').annotate(cantidad=Count('id'))
+    ResumenCalificacion.objects.using(alias).bulk_create([ResumenCalificacion(**grupo) for grupo in grupos])
+    pendientes = (
+        Calificacion.objects.using(alias).filter(estado='Pendiente')
+        .values('usuario_creador').annotate(cantidad=Count('id'))
+    )
+    PendientesCorredor.objects.using(alias).bulk_create([
+        PendientesCorredor(usuario_id=grupo['usuario_creador'], cantidad=grupo['cantidad']) for grupo in pendientes
+    ])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prototipo', '0010_carga_idempotente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendientesCorredor',
+            fields=[
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pendientes', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('cantidad', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Pendientes por Corredor',
+                'verbose_name_plural': 'Pendientes por Corredor',
+                'indexes': [models.Index(fields=['-cantidad'], name='pendientes_cantidad_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenCalificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(max_length=50)),
+                ('mercado', models.CharField(max_length=50)),
+                ('años', models.IntegerField()),
+                ('origen', models.CharField(max_length=20)),
+                ('cantidad', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Resumen de Calificaciones',
+                'verbose_name_plural': 'Resumen de Calificaciones',
+                'constraints': [models.UniqueConstraint(fields=('estado', 'mercado', 'años', 'origen'), name='resumen_calif_uniq')],
+            },
+        ),
+        migrations.RunPython(poblar_resumen, migrations.RunPython.noop),
+    ]
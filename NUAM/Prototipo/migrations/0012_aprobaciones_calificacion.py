@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:14
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prototipo', '0011_resumen_calificaciones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AprobacionCalificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('valores', models.BinaryField()),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('auditor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='aprobaciones', to=settings.AUTH_USER_MODEL)),
+                ('calificacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aprobaciones', to='Prototipo.calificacion')),
+            ],
+            options={
+                'verbose_name': 'Aprobación de Calificación',
+                'verbose_name_plural': 'Aprobaciones de Calificaciones',
+                'constraints': [models.UniqueConstraint(fields=('calificacion', 'version'), name='aprob_calif_version_uniq')],
+            },
+        ),
+    ]
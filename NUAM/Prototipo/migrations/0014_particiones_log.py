@@ -0,0 +1,106 @@
+"""
+Particiona por mes la tabla de Log en PostgreSQL (ver retencion_logs.py).
+
+La tabla se recrea como tabla particionada por rango de fecha_hora, con una
+partición por cada mes que tiene datos (y los próximos), más una DEFAULT.
+La clave primaria pasa a ser (id, fecha_hora), porque PostgreSQL exige que
+incluya la columna de partición; id sigue siendo único (secuencia propia) y
+Django lo sigue usando como clave. Los índices de la tabla anterior
+(paginación, búsqueda de texto, usuario) se recrean con el mismo nombre.
+
+En SQLite no hace nada: ahí la retención borra rangos de la tabla.
+
+Los cálculos de meses y el SQL de cada partición están copiados aquí, no
+importados de retencion_logs.py: la migración no debe cambiar si el módulo
+cambia.
+"""
+import datetime
+
+from django.db import migrations
+from django.utils import timezone
+
+PARTICIONES_ADELANTE = 2
+
+
+def mes_de(fecha):
+    """Primer instante (UTC) del mes de `fecha`."""
+    fecha = fecha.astimezone(datetime.timezone.utc)
+    return datetime.datetime(fecha.year, fecha.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def mes_siguiente(mes, meses=1):
+    indice = mes.year * 12 + mes.month - 1 + meses
+    return mes.replace(year=indice // 12, month=indice % 12 + 1)
+
+
+def sql_crear_particion(mes, tabla):
+    return (
+        f'CREATE TABLE "{tabla}_p{mes:%Y_%m}" PARTITION OF "{tabla}" '
+        f"FOR VALUES FROM ('{mes.isoformat()}') TO ('{mes_siguiente(mes).isoformat()}')"
+    )
+
+
+def particionar(apps, schema_editor):
+    conexion = schema_editor.connection
+    if conexion.vendor != 'postgresql':
+        return
+    Log = apps.get_model('Prototipo', 'Log')
+    UsuarioFinal = apps.get_model('Prototipo', 'UsuarioFinal')
+    tabla = Log._meta.db_table
+    antigua = f'{tabla}_sin_particion'
+    secuencia = f'{tabla}_particionada_id_seq'
+    columnas = ', '.join(f'"{campo.column}"' for campo in Log._meta.concrete_fields)
+
+    with conexion.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [f'"{tabla}"'])
+        if cursor.fetchone()[0] == 'p':
+            return
+        cursor.execute(f'ALTER TABLE "{tabla}" RENAME TO "{antigua}"')
+        # Índices de la tabla anterior, salvo los de sus restricciones (clave primaria)
+        cursor.execute(
+            '''SELECT indexdef FROM pg_indexes
+               WHERE schemaname = current_schema() AND tablename = %s
+                 AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)''',
+            [antigua, f'"{antigua}"']
+        )
+        indices = [definicion for definicion, in cursor.fetchall()]
+        cursor.execute(f'SELECT min(fecha_hora) FROM "{antigua}"')
+        primera = cursor.fetchone()[0]
+
+        for sentencia in (
+            f'CREATE SEQUENCE "{secuencia}"',
+            # INCLUDING GENERATED conserva la columna `busqueda` (migración 0008)
+            f'CREATE TABLE "{tabla}" (LIKE "{antigua}" INCLUDING DEFAULTS INCLUDING GENERATED) '
+            f'PARTITION BY RANGE (fecha_hora)',
+            f'''ALTER TABLE "{tabla}" ALTER COLUMN id SET DEFAULT nextval('"{secuencia}"')''',
+            f'ALTER SEQUENCE "{secuencia}" OWNED BY "{tabla}".id',
+            f'ALTER TABLE "{tabla}" ADD PRIMARY KEY (id, fecha_hora)',
+            f'ALTER TABLE "{tabla}" ADD FOREIGN KEY (usuario_id) '
+            f'REFERENCES "{UsuarioFinal._meta.db_table}" (id) DEFERRABLE INITIALLY DEFERRED',
+            f'CREATE TABLE "{tabla}_default" PARTITION OF "{tabla}" DEFAULT',
+        ):
+            cursor.execute(sentencia)
+
+        mes = mes_de(primera or timezone.now())
+        ultimo = mes_siguiente(mes_de(timezone.now()), PARTICIONES_ADELANTE)
+        while mes <= ultimo:
+            cursor.execute(sql_crear_particion(mes, tabla))
+            mes = mes_siguiente(mes)
+
+        cursor.execute(f'INSERT INTO "{tabla}" ({columnas}) SELECT {columnas} FROM "{antigua}"')
+        cursor.execute(f'''SELECT setval('"{secuencia}"', coalesce((SELECT max(id) FROM "{tabla}"), 0) + 1, false)''')
+        cursor.execute(f'DROP TABLE "{antigua}"')
+        for definicion in indices:
+            cursor.execute(definicion.replace(f'"{antigua}"', f'"{tabla}"'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prototipo', '0013_notificaciones_indices'),
+    ]
+
+    operations = [
+        # Al revertir la tabla queda particionada: sigue sirviendo igual al modelo
+        migrations.RunPython(particionar, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,125 @@
+"""
+Cadena de hashes del registro de auditoría (ver cadena_logs.py): agrega
+hash_cadena y usuario_original a Log, CadenaLog y PuntoControlLog, y
+encadena las entradas que ya existían.
+
+El hash y el recorrido por mes están copiados aquí, no importados de
+cadena_logs.py: la migración no debe cambiar si el módulo cambia.
+"""
+import datetime
+import hashlib
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+TAMANO_LOTE = 2000
+
+
+def etiqueta_mes(fecha):
+    return fecha.astimezone(datetime.timezone.utc).strftime('%Y-%m')
+
+
+def rango_mes(etiqueta):
+    """[inicio, fin) del mes 'AAAA-MM' en UTC."""
+    inicio = datetime.datetime.strptime(etiqueta, '%Y-%m').replace(tzinfo=datetime.timezone.utc)
+    fin = inicio.replace(year=inicio.year + inicio.month // 12, month=inicio.month % 12 + 1)
+    return inicio, fin
+
+
+def genesis(etiqueta):
+    """Hash "anterior" de la primera entrada de cada mes."""
+    return hashlib.sha256(f'nuam-log:{etiqueta}'.encode()).hexdigest()
+
+
+def calcular_hash(anterior, usuario_id, accion, fecha_hora, detalle_cambio):
+    contenido = '\x1f'.join((
+        anterior,
+        '' if usuario_id is None else str(usuario_id),
+        accion,
+        fecha_hora.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f'),
+        detalle_cambio,
+    ))
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def sellar_existentes(apps, schema_editor):
+    # Las entradas anteriores a la cadena se encadenan en su orden de id, mes por mes
+    Log = apps.get_model('Prototipo', 'Log')
+    CadenaLog = apps.get_model('Prototipo', 'CadenaLog')
+    extremos = Log.objects.aggregate(primera=Min('fecha_hora'), ultima=Max('fecha_hora'))
+    if extremos['primera'] is None:
+        return
+    etiqueta = etiqueta_mes(extremos['primera'])
+    while etiqueta <= etiqueta_mes(extremos['ultima']):
+        inicio, fin = rango_mes(etiqueta)
+        del_mes = Log.objects.filter(fecha_hora__gte=inicio, fecha_hora__lt=fin).order_by('id')
+        anterior, filas, ultimo_id = genesis(etiqueta), 0, 0
+        while True:
+            # Por tramos de id: no se escribe sobre una consulta abierta
+            bloque = list(del_mes.filter(id__gt=ultimo_id).values_list(
+                'id', 'usuario_id', 'accion', 'fecha_hora', 'detalle_cambio'
+            )[:TAMANO_LOTE])
+            if not bloque:
+                break
+            objetos = []
+            for id_log, usuario_id, accion, fecha_hora, detalle in bloque:
+                anterior = calcular_hash(anterior, usuario_id, accion, fecha_hora, detalle)
+                objetos.append(Log(id=id_log, usuario_original=usuario_id, hash_cadena=anterior))
+            Log.objects.bulk_update(objetos, ['usuario_original', 'hash_cadena'])
+            filas += len(bloque)
+            ultimo_id = bloque[-1][0]
+        if filas:
+            CadenaLog.objects.update_or_create(
+                mes=etiqueta, defaults={'hash_cadena': anterior, 'ultimo_id': ultimo_id, 'filas': filas}
+            )
+        etiqueta = etiqueta_mes(fin)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prototipo', '0014_particiones_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CadenaLog',
+            fields=[
+                ('mes', models.CharField(max_length=7, primary_key=True, serialize=False)),
+                ('hash_cadena', models.CharField(max_length=64)),
+                ('ultimo_id', models.BigIntegerField(blank=True, null=True)),
+                ('filas', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Cadena de Logs',
+                'verbose_name_plural': 'Cadenas de Logs',
+            },
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='hash_cadena',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='usuario_original',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='PuntoControlLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.CharField(max_length=7)),
+                ('log_id', models.BigIntegerField()),
+                ('hash_cadena', models.CharField(max_length=64)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Punto de Control de Logs',
+                'verbose_name_plural': 'Puntos de Control de Logs',
+                'constraints': [models.UniqueConstraint(fields=('mes', 'log_id'), name='punto_control_log_uniq')],
+            },
+        ),
+        migrations.RunPython(sellar_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prototipo', '0015_cadena_logs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionCalificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('base', models.BooleanField(default=False)),
+                ('campos', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('factores', models.BinaryField()),
+                ('accion', models.CharField(blank=True, default='', max_length=50)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('calificacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versiones', to='Prototipo.calificacion')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Versión de Calificación',
+                'verbose_name_plural': 'Versiones de Calificaciones',
+                'constraints': [models.UniqueConstraint(fields=('calificacion', 'version'), name='version_calif_uniq')],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
 import datetime
@@ -95,7 +96,19 @@ class ArchivoCarga(models.Model):
 
     nombre = models.CharField(max_length=100)
     fecha_carga = models.DateField(default=timezone.now)
-    estado = models.CharField(max_length=20)
+    estado = models.CharField(max_length=20, default='Pendiente')
+
+    # --- PROCESAMIENTO EN SEGUNDO PLANO (ver tareas.py) ---
+    archivo = models.FileField(upload_to='cargas/%Y/%m/', null=True, blank=True)
+    filas_procesadas = models.IntegerField(default=0)
+    filas_fallidas = models.IntegerField(default=0)
+    # Resultado del upsert por clave natural (ver carga.py): filas_procesadas = suma de los tres
+    filas_insertadas = models.IntegerField(default=0)
+    filas_actualizadas = models.IntegerField(default=0)
+    filas_sin_cambios = models.IntegerField(default=0)
+    errores = models.JSONField(default=list, blank=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"Archivo: {self.nombre} ({self.estado})"
@@ -119,6 +132,29 @@ class Calificacion(models.Model):
     usuario_creador = models.ForeignKey('UsuarioFinal', on_delete=models.CASCADE)
     archivo_carga = models.ForeignKey('ArchivoCarga', on_delete=models.SET_NULL, null=True, blank=True)
 
+    # Control de concurrencia optimista: se incrementa en cada modificación (ver factores.guardar_factores)
+    version = models.PositiveIntegerField(default=0)
+    # Hash de lo que trae el archivo de carga (descripción y montos): si una nueva
+    # carga trae el mismo contenido la fila no se reescribe. Vacío si se editó a mano.
+    hash_contenido = models.CharField(max_length=32, blank=True, default='')
+
+    # Clave natural de la carga masiva: un corredor no puede tener dos calificaciones
+    # del mismo evento, así que volver a subir un archivo actualiza en vez de duplicar
+    CLAVE_NATURAL = ('usuario_creador', 'instrumento', 'fecha_pago', 'secuencia_evento', 'mercado', 'años')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['usuario_creador', 'instrumento', 'fecha_pago', 'secuencia_evento', 'mercado', 'años'],
+                name='calif_clave_natural_uniq',
+            ),
+        ]
+        indexes = [
+            # Paginación por cursor de los paneles (ver paginacion.py)
+            models.Index(fields=['-fecha_creacion', '-id'], name='calif_fecha_id_idx'),
+            models.Index(fields=['usuario_creador', '-fecha_creacion', '-id'], name='calif_usuario_fecha_id_idx'),
+        ]
+
     def __str__(self):
         return f"Calificación {self.pk}: {self.instrumento} ({self.años})"
 
@@ -133,6 +169,114 @@ class Factor(models.Model):
         return f"Factor: {self.nombre} ({self.valor})"
 
 
+class FactoresCalificacion(models.Model):
+    """
+    Almacenamiento columnar de los factores: el vector completo de una Calificacion
+    en una sola fila, empaquetado en el orden de NOMBRES_FACTORES (ver factores.py).
+    """
+    calificacion = models.OneToOneField(Calificacion, on_delete=models.CASCADE, primary_key=True, related_name='vector_factores')
+    valores = models.BinaryField()
+
+    class Meta:
+        verbose_name = "Vector de Factores"
+        verbose_name_plural = "Vectores de Factores"
+
+    def __str__(self):
+        return f"Factores de la calificación {self.calificacion_id}"
+
+
+class AprobacionCalificacion(models.Model):
+    """
+    Vector de factores de una Calificacion tal como lo aprobó el auditor (en la
+    `version` que quedó tras aprobarla), empaquetado igual que en
+    FactoresCalificacion. La revisión lo usa para comparar contra la última
+    versión aprobada (ver factores.aprobacion_anterior).
+    """
+    calificacion = models.ForeignKey(Calificacion, on_delete=models.CASCADE, related_name='aprobaciones')
+    version = models.PositiveIntegerField()
+    valores = models.BinaryField()
+    auditor = models.ForeignKey(UsuarioFinal, on_delete=models.SET_NULL, null=True, blank=True, related_name='aprobaciones')
+    fecha = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Aprobación de Calificación"
+        verbose_name_plural = "Aprobaciones de Calificaciones"
+        constraints = [
+            # También es el índice para buscar la última aprobación de una calificación
+            models.UniqueConstraint(fields=['calificacion', 'version'], name='aprob_calif_version_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Aprobación v{self.version} de la calificación {self.calificacion_id}"
+
+
+class VersionCalificacion(models.Model):
+    """
+    Historial de una Calificacion: una fila por cada `version`. Una fila base
+    guarda el estado completo; las demás, solo lo que cambió respecto de la
+    versión anterior: los campos en `campos` y los factores en `factores`
+    (máscara de factores cambiados y sus valores, ver versiones.py).
+    """
+    calificacion = models.ForeignKey(Calificacion, on_delete=models.CASCADE, related_name='versiones')
+    version = models.PositiveIntegerField()
+    base = models.BooleanField(default=False)
+    campos = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    factores = models.BinaryField()
+    usuario = models.ForeignKey(UsuarioFinal, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    accion = models.CharField(max_length=50, blank=True, default='')
+    fecha = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Versión de Calificación"
+        verbose_name_plural = "Versiones de Calificaciones"
+        constraints = [
+            # También es el índice para leer el historial y la última versión
+            models.UniqueConstraint(fields=['calificacion', 'version'], name='version_calif_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Versión {self.version} de la calificación {self.calificacion_id}"
+
+
+class ResumenCalificacion(models.Model):
+    """
+    Cantidad de calificaciones por combinación de estado, mercado, ejercicio y
+    origen. Se mantiene incrementalmente (ver resumen.py) para que los paneles
+    no agrupen la tabla Calificacion completa en cada visita.
+    """
+    estado = models.CharField(max_length=50)
+    mercado = models.CharField(max_length=50)
+    años = models.IntegerField()
+    origen = models.CharField(max_length=20)
+    cantidad = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Resumen de Calificaciones"
+        verbose_name_plural = "Resumen de Calificaciones"
+        constraints = [
+            models.UniqueConstraint(fields=['estado', 'mercado', 'años', 'origen'], name='resumen_calif_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.estado} / {self.mercado} / {self.años} / {self.origen}: {self.cantidad}"
+
+
+class PendientesCorredor(models.Model):
+    """Calificaciones en estado 'Pendiente' de cada corredor (ver resumen.py)."""
+    usuario = models.OneToOneField(UsuarioFinal, on_delete=models.CASCADE, primary_key=True, related_name='pendientes')
+    cantidad = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Pendientes por Corredor"
+        verbose_name_plural = "Pendientes por Corredor"
+        indexes = [
+            models.Index(fields=['-cantidad'], name='pendientes_cantidad_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pendientes de {self.usuario_id}: {self.cantidad}"
+
+
 class Notificacion(models.Model):
     usuario = models.ForeignKey(UsuarioFinal, on_delete=models.CASCADE)
 
@@ -141,6 +285,13 @@ class Notificacion(models.Model):
     fecha_envio = models.DateField(default=timezone.now)
     leida = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Conteo de no leídas (ver notificaciones.py) y listado de cada usuario
+            models.Index(fields=['usuario', 'leida'], name='notif_usuario_leida_idx'),
+            models.Index(fields=['usuario', '-id'], name='notif_usuario_id_idx'),
+        ]
+
     def __str__(self):
         return f"Notificación para {self.usuario.email} ({self.tipo})"
 
@@ -151,9 +302,17 @@ class Log(models.Model):
     fecha_hora = models.DateTimeField(default=timezone.now)
     detalle_cambio = models.TextField(verbose_name="Detalle del Cambio/Resultado")
 
+    # Cadena de hashes (ver cadena_logs.py). El usuario se copia al crear la entrada:
+    # `usuario` puede pasar a NULL al borrar el usuario y el hash no debe cambiar por eso
+    usuario_original = models.BigIntegerField(null=True, blank=True, editable=False)
+    hash_cadena = models.CharField(max_length=64, blank=True, default='', editable=False)
+
     class Meta:
         verbose_name = "Registro de Actividad"
         verbose_name_plural = "Logs de Actividad"
+        indexes = [
+            models.Index(fields=['-fecha_hora', '-id'], name='log_fecha_id_idx'),
+        ]
 
     def __str__(self):
         return f"Log: {self.accion} por {self.usuario.email if self.usuario else 'N/A'}"
@@ -165,4 +324,37 @@ class Log(models.Model):
         respetar el diagrama (aunque no tiene un campo 'leído' en la tabla Log).
         """
         # Aquí iría la lógica si se necesitara marcar logs como 'revisados' por el Auditor
-        pass
\ No newline at end of file
+        pass
+
+
+class CadenaLog(models.Model):
+    """Final de la cadena de hashes de Log de un mes 'AAAA-MM' (ver cadena_logs.py)."""
+    mes = models.CharField(max_length=7, primary_key=True)
+    hash_cadena = models.CharField(max_length=64)
+    ultimo_id = models.BigIntegerField(null=True, blank=True)
+    filas = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Cadena de Logs"
+        verbose_name_plural = "Cadenas de Logs"
+
+    def __str__(self):
+        return f"Cadena {self.mes}: {self.filas} entradas"
+
+
+class PuntoControlLog(models.Model):
+    """Hash de una entrada de Log ya verificada; las verificaciones siguientes lo comparan (ver cadena_logs.py)."""
+    mes = models.CharField(max_length=7)
+    log_id = models.BigIntegerField()
+    hash_cadena = models.CharField(max_length=64)
+    fecha = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Punto de Control de Logs"
+        verbose_name_plural = "Puntos de Control de Logs"
+        constraints = [
+            models.UniqueConstraint(fields=['mes', 'log_id'], name='punto_control_log_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Punto de control {self.mes} / {self.log_id}"
\ No newline at end of file
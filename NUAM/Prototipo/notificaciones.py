@@ -0,0 +1,125 @@
+"""
+Notificaciones a los usuarios (hoy, a los corredores: revisiones de sus
+calificaciones y término de sus cargas masivas).
+
+- `notificar` crea todas las notificaciones de un evento con un solo
+  bulk_create, sin importar a cuántos usuarios llegue.
+- El contador de no leídas de cada usuario se guarda en la caché
+  CACHES[NOTIFICACIONES_CACHE_ALIAS]: la insignia de la barra de navegación
+  no hace un COUNT en cada petición. Se incrementa al confirmar la
+  transacción que notifica; si no está en caché, la siguiente lectura lo
+  cuenta una vez con el índice (usuario, leida).
+- `marcar_todas_leidas` es un solo UPDATE.
+
+Un incremento que se cruza con el primer conteo puede perderse: la entrada
+vence a los NOTIFICACIONES_CONTADOR_SEGUNDOS y se vuelve a contar.
+
+El contador solo sirve si todos los procesos ven la misma entrada. Con un
+backend de memoria local (el de la caché de vistas por omisión, ver
+settings.py) cada proceso tendría el suyo, y un incremento o el borrado de
+`marcar_todas_leidas` solo llegaría al que atendió la petición: en ese caso
+no se usa la caché y cada lectura cuenta con el índice. En un backend como
+Memcached o Redis incr es además atómico (en el de archivos no, y un
+incremento concurrente puede perderse hasta el vencimiento).
+"""
+import functools
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from .models import Notificacion
+
+TIPO_REVISION = 'Revisión'
+TIPO_CARGA = 'Carga de Archivo'
+
+
+def _cache():
+    """Caché del contador, o None si es local al proceso (ver el docstring del módulo)."""
+    cache = caches[getattr(settings, 'NOTIFICACIONES_CACHE_ALIAS', 'default')]
+    return None if isinstance(cache, LocMemCache) else cache
+
+
+def _segundos():
+    return getattr(settings, 'NOTIFICACIONES_CONTADOR_SEGUNDOS', 300)
+
+
+def _clave(usuario_id):
+    return f'notificaciones:no_leidas:{usuario_id}'
+
+
+def _pk(usuario):
+    return getattr(usuario, 'pk', usuario)
+
+
+# --- CONTADOR DE NO LEÍDAS ---
+
+def _sumar(por_usuario):
+    cache = _cache()
+    if cache is None:
+        return
+    for usuario_id, cantidad in por_usuario.items():
+        try:
+            cache.incr(_clave(usuario_id), cantidad)
+        except ValueError:
+            pass  # No está en caché: la próxima lectura lo cuenta
+
+
+def no_leidas(usuario):
+    """Cantidad de notificaciones no leídas de `usuario` (consulta la base solo si no está en caché)."""
+    usuario_id = _pk(usuario)
+    cache = _cache()
+    cantidad = None if cache is None else cache.get(_clave(usuario_id))
+    if cantidad is None:
+        cantidad = Notificacion.objects.filter(usuario_id=usuario_id, leida=False).count()
+        if cache is None:
+            return cantidad
+        # add: si otro proceso ya la dejó (o la incrementó), vale la suya
+        cache.add(_clave(usuario_id), cantidad, _segundos())
+    return cantidad
+
+
+def contexto(request):
+    """
+    Procesador de contexto: `notificaciones_no_leidas` para la insignia de la
+    barra de navegación. Se evalúa (una vez) solo si la plantilla lo usa.
+    """
+    usuario = getattr(request, 'user', None)
+    if usuario is None or not usuario.is_authenticated:
+        return {}
+    return {'notificaciones_no_leidas': functools.cache(lambda: no_leidas(usuario))}
+
+
+# --- ENVÍO ---
+
+def notificar(avisos, tipo):
+    """
+    Crea una notificación por cada (usuario o pk, mensaje) de `avisos` en un
+    solo bulk_create. Los contadores se ajustan al confirmar la transacción.
+    """
+    notificaciones = [
+        Notificacion(usuario_id=_pk(usuario), tipo=tipo, mensaje=mensaje)
+        for usuario, mensaje in avisos
+    ]
+    if not notificaciones:
+        return []
+    Notificacion.objects.bulk_create(notificaciones, batch_size=1000)
+    por_usuario = Counter(n.usuario_id for n in notificaciones)
+    transaction.on_commit(lambda: _sumar(por_usuario))
+    return notificaciones
+
+
+# --- LECTURA ---
+
+def marcar_todas_leidas(usuario):
+    """Marca como leídas todas las notificaciones de `usuario` con un UPDATE. Retorna cuántas cambiaron."""
+    usuario_id = _pk(usuario)
+    cantidad = Notificacion.objects.filter(usuario_id=usuario_id, leida=False).update(leida=True)
+    # Se borra en vez de dejar 0: una notificación confirmada entre el UPDATE y
+    # este punto quedaría fuera del contador hasta que venciera
+    cache = _cache()
+    if cache is not None:
+        transaction.on_commit(lambda: cache.delete(_clave(usuario_id)))
+    return cantidad
@@ -0,0 +1,128 @@
+"""
+Paginación por cursor (keyset) para los listados de los paneles.
+
+En vez de OFFSET, cada página se pide "después de" los valores de orden del
+último elemento de la página anterior (por ejemplo fecha_creacion e id). Con
+un índice compuesto sobre esas columnas, la página N cuesta lo mismo que la
+página 1 aunque la tabla tenga millones de filas.
+
+Un cursor que no se puede leer, o cuyos valores no son del tipo de los
+campos de orden, se ignora: se muestra la primera página.
+"""
+import base64
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+TAMANO_PAGINA = 50
+
+
+# --- CODIFICACIÓN DEL CURSOR ---
+
+def _a_json(valor):
+    if isinstance(valor, datetime.datetime):
+        return ['dt', valor.isoformat()]
+    if isinstance(valor, datetime.date):
+        return ['d', valor.isoformat()]
+    return ['v', valor]
+
+
+def _desde_json(par):
+    tipo, valor = par
+    if tipo == 'dt':
+        return datetime.datetime.fromisoformat(valor)
+    if tipo == 'd':
+        return datetime.date.fromisoformat(valor)
+    return valor
+
+
+def codificar_cursor(valores):
+    texto = json.dumps([_a_json(v) for v in valores], separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, cantidad):
+    """Retorna la tupla de valores del cursor, o None si el cursor no es válido."""
+    try:
+        texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        valores = [_desde_json(par) for par in json.loads(texto)]
+    except (ValueError, TypeError):
+        return None
+    return valores if len(valores) == cantidad else None
+
+
+def _campo_orden(queryset, nombre):
+    """Campo del modelo, o de la anotación (p. ej. `rango` de busqueda.py), por el que se ordena."""
+    anotacion = queryset.query.annotations.get(nombre)
+    return anotacion.output_field if anotacion is not None else queryset.model._meta.get_field(nombre)
+
+
+def valores_cursor(queryset, campos, cursor):
+    """
+    Valores del cursor convertidos al tipo de cada campo de orden, o None si
+    el cursor no es válido para `queryset`: un valor de otro tipo haría
+    fallar la consulta.
+    """
+    valores = decodificar_cursor(cursor, len(campos))
+    if valores is None:
+        return None
+    try:
+        valores = [_campo_orden(queryset, campo.lstrip('-')).to_python(valor) for campo, valor in zip(campos, valores)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+    # Los campos de orden no son nulos: None no se puede comparar
+    return None if None in valores else valores
+
+
+# --- CONSULTA ---
+
+def _condicion_despues_de(campos, valores):
+    """
+    Q equivalente a (campo1, campo2, ...) "después de" (valor1, valor2, ...) según el orden.
+    Se agrega además la cota no estricta del primer campo para que el índice la use directamente.
+    """
+    nombres = [campo.lstrip('-') for campo in campos]
+    operadores = ['lt' if campo.startswith('-') else 'gt' for campo in campos]
+
+    condicion = Q()
+    for i in range(len(campos)):
+        termino = Q(**{f'{nombres[j]}': valores[j] for j in range(i)})
+        termino &= Q(**{f'{nombres[i]}__{operadores[i]}': valores[i]})
+        condicion |= termino
+
+    cota = Q(**{f"{nombres[0]}__{operadores[0]}e": valores[0]})
+    return cota & condicion
+
+
+def paginar(queryset, campos, cursor=None, tamano=TAMANO_PAGINA):
+    """
+    Retorna (elementos, cursor_siguiente) para `queryset` ordenado por `campos`
+    (p. ej. ('-fecha_creacion', '-id'); el último campo debe ser único).
+    `cursor_siguiente` es None en la última página.
+    """
+    queryset = queryset.order_by(*campos)
+    if cursor:
+        valores = valores_cursor(queryset, campos, cursor)
+        if valores is not None:
+            queryset = queryset.filter(_condicion_despues_de(campos, valores))
+
+    elementos = list(queryset[:tamano + 1])
+    if len(elementos) <= tamano:
+        return elementos, None
+
+    elementos = elementos[:tamano]
+    ultimo = elementos[-1]
+    return elementos, codificar_cursor([getattr(ultimo, campo.lstrip('-')) for campo in campos])
+
+
+def url_pagina(request, **parametros):
+    """Query string de la página actual con `parametros` reemplazados (None los quita)."""
+    consulta = request.GET.copy()
+    for nombre, valor in parametros.items():
+        if valor is None:
+            consulta.pop(nombre, None)
+        else:
+            consulta[nombre] = valor
+    return '?' + consulta.urlencode()
@@ -0,0 +1,188 @@
+"""
+Resumen materializado de calificaciones para los paneles de auditor y administrador.
+
+En vez de agrupar la tabla Calificacion completa en cada visita, los paneles
+leen dos tablas pequeñas que se mantienen al día con cada cambio:
+
+- ResumenCalificacion: cantidad por (estado, mercado, años, origen). Tiene a
+  lo más unos cientos de filas, así que los totales por cualquier dimensión
+  salen de una sola consulta, sin importar cuántas calificaciones existan.
+- PendientesCorredor: calificaciones 'Pendiente' de cada corredor.
+
+Cada cambio se traduce en un Delta (+1 a la combinación nueva, -1 a la
+anterior) que se aplica con UPDATE ... SET cantidad = cantidad + n dentro de
+la misma transacción que el cambio:
+
+- save()/delete() de una Calificacion: señales en signals.py.
+- Carga masiva (bulk_create / ON CONFLICT): carga._grabar_lote.
+- QuerySet.update() (no emite señales): quien lo llama usa
+  `registrar_cambio` o `delta_consulta`.
+
+`en_lote()` acumula los deltas de las señales y los aplica una vez al salir
+(borrados en cascada, generación de datos). `recalcular()` reconstruye ambas
+tablas desde cero (comando `recalcular_resumen`).
+"""
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from . import cache_vistas
+from .models import Calificacion, PendientesCorredor, ResumenCalificacion
+
+DIMENSIONES = ('estado', 'mercado', 'años', 'origen')
+# Valores que determinan en qué contadores cuenta una calificación
+CAMPOS = DIMENSIONES + ('usuario_creador_id',)
+ESTADO_PENDIENTE = 'Pendiente'
+
+_local = threading.local()
+
+
+def valores(calificacion):
+    """Tupla con los CAMPOS de una calificación."""
+    return tuple(getattr(calificacion, campo) for campo in CAMPOS)
+
+
+class Delta:
+    """Cambios pendientes de aplicar a los contadores."""
+
+    def __init__(self):
+        self.cubo = Counter()
+        self.pendientes = Counter()
+
+    def agregar(self, valores, signo=1):
+        """`valores`: tupla en el orden de CAMPOS; `signo`: +n o -n."""
+        *clave, usuario_id = valores
+        self.cubo[tuple(clave)] += signo
+        if clave[0] == ESTADO_PENDIENTE:
+            self.pendientes[usuario_id] += signo
+
+    def mover(self, antes, despues):
+        if antes != despues:
+            self.agregar(antes, -1)
+            self.agregar(despues, 1)
+
+    def update(self, otro):
+        self.cubo.update(otro.cubo)
+        self.pendientes.update(otro.pendientes)
+
+    def __bool__(self):
+        return any(self.cubo.values()) or any(self.pendientes.values())
+
+
+# --- ESCRITURA ---
+
+def _incrementar(modelo, filtro, cantidad):
+    if modelo.objects.filter(**filtro).update(cantidad=F('cantidad') + cantidad) or cantidad < 0:
+        return
+    try:
+        with transaction.atomic():
+            modelo.objects.create(cantidad=cantidad, **filtro)
+    except IntegrityError:
+        # Otra transacción creó la fila entre el UPDATE y el INSERT
+        modelo.objects.filter(**filtro).update(cantidad=F('cantidad') + cantidad)
+
+
+def _escribir(delta):
+    # Orden fijo: dos transacciones concurrentes bloquean las filas en el mismo orden.
+    # Sin savepoint: dentro de otra transacción basta con ser parte de ella.
+    with transaction.atomic(savepoint=False):
+        for clave, cantidad in sorted(delta.cubo.items()):
+            if cantidad:
+                _incrementar(ResumenCalificacion, dict(zip(DIMENSIONES, clave)), cantidad)
+        for usuario_id, cantidad in sorted(delta.pendientes.items()):
+            if cantidad:
+                _incrementar(PendientesCorredor, {'usuario_id': usuario_id}, cantidad)
+    # Lo que mueve un contador cambia también los listados de los paneles
+    cache_vistas.invalidar(cache_vistas.CALIFICACIONES)
+
+
+def aplicar(delta):
+    """Aplica `delta` a los contadores (o lo acumula si hay un en_lote() activo)."""
+    acumulado = getattr(_local, 'acumulado', None)
+    if acumulado is not None:
+        acumulado.update(delta)
+    elif delta:
+        _escribir(delta)
+
+
+@contextmanager
+def en_lote():
+    """Acumula los deltas del bloque y los aplica al final, con un UPDATE por combinación."""
+    if getattr(_local, 'acumulado', None) is not None:
+        yield
+        return
+    _local.acumulado = Delta()
+    try:
+        yield
+        delta = _local.acumulado
+    finally:
+        _local.acumulado = None
+    if delta:
+        _escribir(delta)
+
+
+def registrar_cambio(calificacion, **cambios):
+    """Para un UPDATE hecho con QuerySet.update(): `calificacion` con los valores anteriores y los campos cambiados."""
+    delta = Delta()
+    antes = valores(calificacion)
+    delta.mover(antes, tuple(cambios.get(campo, valor) for campo, valor in zip(CAMPOS, antes)))
+    aplicar(delta)
+
+
+def delta_consulta(queryset, signo=1):
+    """Delta de todas las calificaciones de `queryset` (un GROUP BY), para operaciones masivas."""
+    delta = Delta()
+    grupos = queryset.order_by().values(*CAMPOS).annotate(cantidad=Count('id')).values_list(*CAMPOS, 'cantidad')
+    for *clave, cantidad in grupos:
+        delta.agregar(tuple(clave), signo * cantidad)
+    return delta
+
+
+def recalcular():
+    """Reconstruye ambas tablas desde Calificacion. Retorna (combinaciones, corredores con pendientes)."""
+    delta = delta_consulta(Calificacion.objects.all())
+    with transaction.atomic():
+        ResumenCalificacion.objects.all().delete()
+        PendientesCorredor.objects.all().delete()
+        ResumenCalificacion.objects.bulk_create([
+            ResumenCalificacion(cantidad=cantidad, **dict(zip(DIMENSIONES, clave)))
+            for clave, cantidad in delta.cubo.items() if cantidad
+        ])
+        PendientesCorredor.objects.bulk_create([
+            PendientesCorredor(usuario_id=usuario_id, cantidad=cantidad)
+            for usuario_id, cantidad in delta.pendientes.items() if cantidad
+        ])
+        cache_vistas.invalidar(cache_vistas.CALIFICACIONES)
+    return len(delta.cubo), len(delta.pendientes)
+
+
+# --- LECTURA ---
+
+def obtener_resumen():
+    """
+    Totales por estado, mercado, ejercicio y origen en una consulta:
+    {'total': n, 'por_estado': [(valor, n)], 'por_mercado': ..., 'por_ejercicio': ..., 'por_origen': ...}
+    """
+    totales = {dimension: Counter() for dimension in DIMENSIONES}
+    total = 0
+    for *clave, cantidad in ResumenCalificacion.objects.filter(cantidad__gt=0).values_list(*DIMENSIONES, 'cantidad'):
+        total += cantidad
+        for dimension, valor in zip(DIMENSIONES, clave):
+            totales[dimension][valor] += cantidad
+    return {
+        'total': total,
+        'por_estado': totales['estado'].most_common(),
+        'por_mercado': totales['mercado'].most_common(),
+        'por_ejercicio': sorted(totales['años'].items(), reverse=True),
+        'por_origen': totales['origen'].most_common(),
+    }
+
+
+def pendientes_por_corredor(limite=10):
+    """Corredores con más calificaciones pendientes de revisión (índice pendientes_cantidad_idx)."""
+    return list(
+        PendientesCorredor.objects.filter(cantidad__gt=0).select_related('usuario').order_by('-cantidad')[:limite]
+    )
@@ -0,0 +1,377 @@
+"""
+Particiones por mes, retención y archivo del registro de auditoría (Log).
+
+PostgreSQL: desde la migración 0014 "Prototipo_log" es una tabla
+particionada por rango de fecha_hora, con una partición por mes (UTC),
+"Prototipo_log_pAAAA_MM", y una partición DEFAULT para lo que no tenga la
+suya. `asegurar_particiones` crea por adelantado las de los próximos
+LOGS_PARTICIONES_ADELANTE meses. Las consultas con rango de fechas (p. ej.
+`consultar_logs`) solo leen las particiones del rango.
+
+SQLite no tiene particiones: la tabla es la ventana móvil de los últimos
+meses y cada mes es un rango del índice log_fecha_id_idx.
+
+Retención (`archivar`, comando `archivar_logs`): cada mes anterior a los
+últimos LOGS_RETENCION_MESES se copia a LOGS_ARCHIVO_DIR como JSON Lines
+comprimido con gzip ("logs-AAAA-MM.N.jsonl.gz", ordenado por fecha_hora e
+id descendentes) y se anota en "manifiesto.json" (mes, columnas, filas,
+rango de fechas e ids, hash de la última entrada de su cadena, sha256).
+Recién entonces sale de la base: en PostgreSQL se separa y elimina la
+partición completa (sin borrar fila a fila); en SQLite se borra el rango. Si el proceso muere entre ambos pasos,
+la siguiente ejecución borra de la base lo que ya está en el archivo.
+
+`consultar_logs` entrega un rango de fechas leyendo la base y el archivo
+como una sola secuencia ordenada: los reportes no necesitan saber dónde
+quedó cada mes.
+
+Debe haber un solo proceso archivando a la vez.
+"""
+import datetime
+import gzip
+import hashlib
+import heapq
+import json
+import os
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import cache_vistas
+from .models import Log, PuntoControlLog, UsuarioFinal
+
+TABLA = Log._meta.db_table
+PARTICION_DEFAULT = f'{TABLA}_default'
+MANIFIESTO = 'manifiesto.json'
+TAMANO_BLOQUE = 5000
+# Columnas del archivo: todas las del modelo, para que las que se agreguen también se archiven
+CAMPOS = tuple(campo.attname for campo in Log._meta.concrete_fields)
+# Lo que entrega consultar_logs (más el email del usuario)
+COLUMNAS_CONSULTA = ('id', 'fecha_hora', 'accion', 'usuario_id', 'detalle_cambio')
+
+
+# --- MESES (UTC) ---
+
+def mes_de(fecha):
+    """Primer instante (UTC) del mes de `fecha`."""
+    fecha = fecha.astimezone(datetime.timezone.utc)
+    return datetime.datetime(fecha.year, fecha.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def mes_siguiente(mes, meses=1):
+    indice = mes.year * 12 + mes.month - 1 + meses
+    return mes.replace(year=indice // 12, month=indice % 12 + 1)
+
+
+def _bloques(iterable, tamano):
+    iterador = iter(iterable)
+    return iter(lambda: list(islice(iterador, tamano)), [])
+
+
+# --- PARTICIONES (POSTGRESQL) ---
+
+def nombre_particion(mes, tabla=TABLA):
+    return f'{tabla}_p{mes:%Y_%m}'
+
+
+def sql_crear_particion(mes, tabla=TABLA):
+    return (
+        f'CREATE TABLE "{nombre_particion(mes, tabla)}" PARTITION OF "{tabla}" '
+        f"FOR VALUES FROM ('{mes.isoformat()}') TO ('{mes_siguiente(mes).isoformat()}')"
+    )
+
+
+def particionada():
+    """True si la tabla de Log está particionada (PostgreSQL tras la migración 0014)."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [f'"{TABLA}"'])
+        fila = cursor.fetchone()
+    return fila is not None and fila[0] == 'p'
+
+
+def _existe(cursor, tabla):
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [f'"{tabla}"'])
+    return cursor.fetchone()[0]
+
+
+def _crear_particion(cursor, mes):
+    """
+    Crea la partición de `mes`. PostgreSQL no la deja crear si DEFAULT tiene
+    filas de ese rango: en ese caso DEFAULT se separa, sus filas del mes pasan
+    a la partición nueva y se vuelve a conectar.
+    """
+    rango = f"fecha_hora >= '{mes.isoformat()}' AND fecha_hora < '{mes_siguiente(mes).isoformat()}'"
+    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{PARTICION_DEFAULT}" WHERE {rango})')
+    if not cursor.fetchone()[0]:
+        cursor.execute(sql_crear_particion(mes))
+        return
+    columnas = ', '.join(f'"{Log._meta.get_field(campo).column}"' for campo in CAMPOS)
+    cursor.execute(f'ALTER TABLE "{TABLA}" DETACH PARTITION "{PARTICION_DEFAULT}"')
+    cursor.execute(sql_crear_particion(mes))
+    cursor.execute(
+        f'INSERT INTO "{nombre_particion(mes)}" ({columnas}) SELECT {columnas} FROM "{PARTICION_DEFAULT}" WHERE {rango}'
+    )
+    cursor.execute(f'DELETE FROM "{PARTICION_DEFAULT}" WHERE {rango}')
+    cursor.execute(f'ALTER TABLE "{TABLA}" ATTACH PARTITION "{PARTICION_DEFAULT}" DEFAULT')
+
+
+def asegurar_particiones(adelante=None, ahora=None):
+    """Crea las particiones que falten del mes actual y los `adelante` siguientes. Retorna sus nombres."""
+    if not particionada():
+        return []
+    if adelante is None:
+        adelante = getattr(settings, 'LOGS_PARTICIONES_ADELANTE', 2)
+    mes = mes_de(ahora or timezone.now())
+    ultimo = mes_siguiente(mes, adelante)
+    creadas = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        while mes <= ultimo:
+            if not _existe(cursor, nombre_particion(mes)):
+                _crear_particion(cursor, mes)
+                creadas.append(nombre_particion(mes))
+            mes = mes_siguiente(mes)
+    return creadas
+
+
+# --- MANIFIESTO ---
+
+def directorio_archivo():
+    return Path(getattr(settings, 'LOGS_ARCHIVO_DIR', Path(settings.BASE_DIR) / 'archivo_logs'))
+
+
+def leer_manifiesto(directorio=None):
+    ruta = (directorio or directorio_archivo()) / MANIFIESTO
+    try:
+        with open(ruta, encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except FileNotFoundError:
+        return {'version': 1, 'partes': []}
+
+
+def _guardar_manifiesto(directorio, manifiesto):
+    # Se reemplaza de una vez: un lector nunca ve un manifiesto a medio escribir
+    temporal = directorio / f'{MANIFIESTO}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(manifiesto, archivo, ensure_ascii=False, indent=1)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, directorio / MANIFIESTO)
+
+
+# --- ESCRITURA Y LECTURA DEL ARCHIVO ---
+
+def _a_json(valor):
+    if isinstance(valor, datetime.datetime):
+        return valor.isoformat()
+    if isinstance(valor, (bytes, memoryview)):
+        return bytes(valor).hex()
+    return valor
+
+
+def _sha256(ruta):
+    resumen = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(1 << 20), b''):
+            resumen.update(bloque)
+    return resumen.hexdigest()
+
+
+def _escribir_parte(directorio, manifiesto, mes, filas):
+    """Escribe `filas` (tuplas en el orden de CAMPOS, ya ordenadas) como una parte nueva del mes. Retorna su entrada."""
+    etiqueta = f'{mes:%Y-%m}'
+    numero = 1 + sum(1 for parte in manifiesto['partes'] if parte['mes'] == etiqueta)
+    nombre = f'logs-{etiqueta}.{numero}.jsonl.gz'
+    temporal = directorio / f'{nombre}.tmp'
+    i_id, i_fecha, i_hash = CAMPOS.index('id'), CAMPOS.index('fecha_hora'), CAMPOS.index('hash_cadena')
+    cantidad, ids, fechas = 0, [], []
+    ultima = None  # Entrada de mayor id: su hash enlaza la cadena del mes con lo que llegue después
+
+    with open(temporal, 'wb') as crudo:
+        with gzip.GzipFile(fileobj=crudo, mode='wb', mtime=0) as comprimido:
+            for bloque in _bloques(filas, TAMANO_BLOQUE):
+                comprimido.write(''.join(
+                    json.dumps([_a_json(valor) for valor in fila], ensure_ascii=False, separators=(',', ':')) + '\n'
+                    for fila in bloque
+                ).encode('utf-8'))
+                cantidad += len(bloque)
+                ids += (min(f[i_id] for f in bloque), max(f[i_id] for f in bloque))
+                mayor = max(bloque, key=lambda f: f[i_id])
+                if ultima is None or mayor[i_id] > ultima[i_id]:
+                    ultima = mayor
+                fechas += (bloque[-1][i_fecha], bloque[0][i_fecha])
+        crudo.flush()
+        os.fsync(crudo.fileno())
+    os.replace(temporal, directorio / nombre)
+
+    return {
+        'archivo': nombre,
+        'mes': etiqueta,
+        'campos': list(CAMPOS),
+        'filas': cantidad,
+        'desde': min(fechas).isoformat(),
+        'hasta': max(fechas).isoformat(),
+        'id_min': min(ids),
+        'id_max': max(ids),
+        'hash_id_max': ultima[i_hash],
+        'bytes': (directorio / nombre).stat().st_size,
+        'sha256': _sha256(directorio / nombre),
+        'creado': timezone.now().isoformat(),
+    }
+
+
+def leer_parte(parte, directorio=None):
+    """Filas de una parte del archivo como dicts {campo: valor}, en el orden en que se escribieron."""
+    ruta = (directorio or directorio_archivo()) / parte['archivo']
+    campos = parte['campos']
+    with gzip.open(ruta, 'rt', encoding='utf-8') as archivo:
+        for linea in archivo:
+            fila = dict(zip(campos, json.loads(linea)))
+            fila['fecha_hora'] = parse_datetime(fila['fecha_hora'])
+            yield fila
+
+
+def verificar_archivo(directorio=None):
+    """Partes del manifiesto que faltan o cuyo sha256 no coincide: [(parte, motivo)]."""
+    directorio = directorio or directorio_archivo()
+    problemas = []
+    for parte in leer_manifiesto(directorio)['partes']:
+        ruta = directorio / parte['archivo']
+        if not ruta.exists():
+            problemas.append((parte, 'falta el archivo'))
+        elif _sha256(ruta) != parte['sha256']:
+            problemas.append((parte, 'el sha256 no coincide con el manifiesto'))
+    return problemas
+
+
+# --- RETENCIÓN ---
+
+def _rango_mes(mes):
+    return Log.objects.filter(fecha_hora__gte=mes, fecha_hora__lt=mes_siguiente(mes))
+
+
+def _mes_de_parte(parte):
+    return datetime.datetime.strptime(parte['mes'], '%Y-%m').replace(tzinfo=datetime.timezone.utc)
+
+
+def _sacar_de_la_base(parte, directorio):
+    """Borra de la base las filas de `parte` (que ya están en el archivo). Retorna cuántas."""
+    mes = _mes_de_parte(parte)
+    archivadas = _rango_mes(mes).filter(id__gte=parte['id_min'], id__lte=parte['id_max'])
+    with transaction.atomic():
+        # Lo archivado se verifica con el sha256 del manifiesto, ya no con puntos de control
+        PuntoControlLog.objects.filter(mes=parte['mes'], log_id__gte=parte['id_min'], log_id__lte=parte['id_max']).delete()
+        if particionada():
+            particion = nombre_particion(mes)
+            with connection.cursor() as cursor:
+                if _existe(cursor, particion):
+                    cursor.execute(f'LOCK TABLE "{particion}" IN ACCESS EXCLUSIVE MODE')
+                    cursor.execute(
+                        f'SELECT count(*), count(*) FILTER (WHERE id BETWEEN %s AND %s) FROM "{particion}"',
+                        [parte['id_min'], parte['id_max']]
+                    )
+                    total, del_rango = cursor.fetchone()
+                    if total == del_rango == parte['filas']:
+                        # La partición tiene exactamente lo archivado: se elimina entera
+                        cursor.execute(f'ALTER TABLE "{TABLA}" DETACH PARTITION "{particion}"')
+                        cursor.execute(f'DROP TABLE "{particion}"')
+                        return total
+
+        if archivadas.count() == parte['filas']:
+            borradas, _ = archivadas.delete()
+            return borradas
+        # Hay filas del mes que no están en la parte (llegaron tarde) o faltan algunas:
+        # se borran exactamente los ids escritos en el archivo
+        borradas = 0
+        for bloque in _bloques((fila['id'] for fila in leer_parte(parte, directorio)), 900):
+            borradas += _rango_mes(mes).filter(id__in=bloque).delete()[0]
+        return borradas
+
+
+def _reconciliar(directorio, manifiesto):
+    """Termina las partes que se archivaron pero no alcanzaron a salir de la base."""
+    for parte in manifiesto['partes']:
+        if _rango_mes(_mes_de_parte(parte)).filter(id__gte=parte['id_min'], id__lte=parte['id_max']).exists():
+            _sacar_de_la_base(parte, directorio)
+
+
+def archivar(meses=None, ahora=None):
+    """
+    Archiva y saca de la base los meses anteriores a los últimos `meses`
+    completos (LOGS_RETENCION_MESES) más el actual. Retorna las partes nuevas.
+    """
+    if meses is None:
+        meses = getattr(settings, 'LOGS_RETENCION_MESES', 12)
+    corte = mes_siguiente(mes_de(ahora or timezone.now()), -meses)
+    directorio = directorio_archivo()
+    directorio.mkdir(parents=True, exist_ok=True)
+    manifiesto = leer_manifiesto(directorio)
+    _reconciliar(directorio, manifiesto)
+
+    nuevas = []
+    primera = Log.objects.filter(fecha_hora__lt=corte).order_by('fecha_hora').values_list('fecha_hora', flat=True).first()
+    mes = mes_de(primera) if primera else corte
+    while mes < corte:
+        filas = _rango_mes(mes).order_by('-fecha_hora', '-id').values_list(*CAMPOS)
+        if filas.exists():
+            parte = _escribir_parte(directorio, manifiesto, mes, filas.iterator(chunk_size=TAMANO_BLOQUE))
+            # Primero queda anotada en el manifiesto; recién entonces se borra de la base
+            manifiesto['partes'].append(parte)
+            _guardar_manifiesto(directorio, manifiesto)
+            _sacar_de_la_base(parte, directorio)
+            nuevas.append(parte)
+        mes = mes_siguiente(mes)
+
+    if nuevas:
+        cache_vistas.invalidar(cache_vistas.LOGS)
+    asegurar_particiones(ahora=ahora)
+    return nuevas
+
+
+# --- CONSULTA (BASE + ARCHIVO) ---
+
+def _desde_archivo(parte, directorio, desde, hasta):
+    for fila in leer_parte(parte, directorio):
+        fecha = fila['fecha_hora']
+        if hasta is not None and fecha >= hasta:
+            continue
+        if desde is not None and fecha < desde:
+            return  # La parte está ordenada de más nueva a más antigua
+        yield tuple(fila.get(campo) for campo in COLUMNAS_CONSULTA)
+
+
+def consultar_logs(desde=None, hasta=None, tamano_bloque=2000):
+    """
+    Logs con fecha_hora en [desde, hasta) (None: sin límite), de la base y del
+    archivo, ordenados por fecha_hora e id descendentes. Cada elemento es
+    (id, fecha_hora, accion, usuario_id, usuario_email, detalle_cambio).
+    """
+    base = Log.objects.order_by('-fecha_hora', '-id')
+    if desde is not None:
+        base = base.filter(fecha_hora__gte=desde)
+    if hasta is not None:
+        base = base.filter(fecha_hora__lt=hasta)
+    fuentes = [base.values_list(*COLUMNAS_CONSULTA).iterator(chunk_size=tamano_bloque)]
+
+    directorio = directorio_archivo()
+    for parte in leer_manifiesto(directorio)['partes']:
+        if (hasta is None or parse_datetime(parte['desde']) < hasta) and (desde is None or parse_datetime(parte['hasta']) >= desde):
+            fuentes.append(_desde_archivo(parte, directorio, desde, hasta))
+
+    filas = heapq.merge(*fuentes, key=lambda fila: (fila[1], fila[0]), reverse=True)
+    emails = {}
+    anterior = None
+    for bloque in _bloques(filas, tamano_bloque):
+        # Un email por usuario, pedidos por bloque (el archivo solo guarda usuario_id)
+        faltan = {fila[3] for fila in bloque if fila[3] is not None and fila[3] not in emails}
+        if faltan:
+            emails.update(UsuarioFinal.objects.filter(pk__in=faltan).values_list('pk', 'email'))
+        for pk, fecha_hora, accion, usuario_id, detalle in bloque:
+            if pk == anterior:
+                continue  # Archivada pero aún en la base (archivado interrumpido): se entrega una vez
+            anterior = pk
+            yield pk, fecha_hora, accion, usuario_id, emails.get(usuario_id), detalle
@@ -0,0 +1,142 @@
+"""
+Revisión por lote: aprobar o rechazar de una vez todas las calificaciones
+'Pendiente' que cumplen un criterio (ids explícitos, un archivo de carga,
+mercado, ejercicio o corredor).
+
+El costo no crece con la cantidad de filas en número de sentencias:
+
+1. Un SELECT ... FOR UPDATE trae y bloquea las filas afectadas (solo las
+   columnas que necesita el resumen).
+2. Un solo UPDATE con el mismo criterio cambia estado y versión. Si afecta
+   una cantidad distinta de filas (otra transacción agregó o cambió
+   calificaciones entre ambas sentencias) se revierte todo con
+   ConjuntoModificado.
+3. El resumen se ajusta con un delta por combinación (ver resumen.py).
+4. Al aprobar, los vectores aprobados se copian por lotes
+   (factores.registrar_aprobaciones_lote).
+5. Una versión por calificación en el historial, por lotes
+   (versiones.registrar).
+6. Un registro de auditoría por calificación, encolado de una vez
+   (auditoria.registrar_logs).
+7. Una notificación por corredor afectado, en un solo bulk_create
+   (notificaciones.notificar).
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from . import resumen, versiones
+from .notificaciones import notificar, TIPO_REVISION
+from .auditoria import registrar_logs
+from .factores import registrar_aprobaciones_lote
+from .models import Calificacion
+
+ESTADOS_REVISION = ('Aprobada', 'Rechazada')
+MAX_IDS = 5000  # lista explícita; para más, un criterio (p. ej. el archivo de carga)
+# Parámetro -> (lookup, tipo)
+CRITERIOS = {
+    'archivo_carga': ('archivo_carga_id', int),
+    'mercado': ('mercado', str),
+    'años': ('años', int),
+    'usuario_creador': ('usuario_creador_id', int),
+}
+
+
+class CriterioInvalido(ValueError):
+    """La petición no define un conjunto de calificaciones válido."""
+
+
+class ConjuntoModificado(Exception):
+    """Las calificaciones del criterio cambiaron durante la revisión; no se aplicó nada."""
+
+
+def criterio_desde(datos):
+    """
+    Criterio de revisión a partir de un QueryDict (POST): `ids` (varios) y/o
+    los campos de CRITERIOS. Retorna un dict; lanza CriterioInvalido.
+    """
+    criterio = {}
+    ids = [i for valor in datos.getlist('ids') for i in valor.split(',') if i.strip()]
+    if ids:
+        if len(ids) > MAX_IDS:
+            raise CriterioInvalido(f'Se pueden revisar a lo más {MAX_IDS} calificaciones por lista; use un criterio.')
+        try:
+            criterio['ids'] = sorted({int(i) for i in ids})
+        except ValueError:
+            raise CriterioInvalido('La lista de calificaciones no es válida.')
+    for campo, (_, tipo) in CRITERIOS.items():
+        valor = (datos.get(campo) or '').strip()
+        if valor:
+            try:
+                criterio[campo] = tipo(valor)
+            except ValueError:
+                raise CriterioInvalido(f'El valor de {campo} no es válido.')
+    if not criterio:
+        # Nunca "todas las pendientes" por omisión
+        raise CriterioInvalido('Seleccione calificaciones o indique un criterio (por ejemplo, el archivo de carga).')
+    return criterio
+
+
+def _condicion(criterio):
+    condicion = Q(estado=resumen.ESTADO_PENDIENTE)
+    if 'ids' in criterio:
+        condicion &= Q(pk__in=criterio['ids'])
+    for campo, (lookup, _) in CRITERIOS.items():
+        if campo in criterio:
+            condicion &= Q(**{lookup: criterio[campo]})
+    return condicion
+
+
+def _detalle(auditor, estado_nuevo, pk, instrumento):
+    return f'Auditor {auditor.nombre} cambió el estado de {instrumento} ({pk}) a {estado_nuevo} (revisión por lote).'
+
+
+def revisar_lote(auditor, estado_nuevo, criterio):
+    """
+    Cambia a `estado_nuevo` las calificaciones pendientes de `criterio` (ver
+    criterio_desde). Retorna {'revisadas': n, 'corredores': m}.
+    """
+    if estado_nuevo not in ESTADOS_REVISION:
+        raise CriterioInvalido('Estado de revisión no válido.')
+    pendientes = Calificacion.objects.filter(_condicion(criterio))
+
+    with transaction.atomic():
+        filas = list(
+            pendientes.select_for_update().order_by('pk')
+            .values_list('pk', 'instrumento', 'version', *resumen.CAMPOS)
+        )
+        if not filas:
+            return {'revisadas': 0, 'corredores': 0}
+
+        actualizadas = pendientes.update(estado=estado_nuevo, version=F('version') + 1)
+        if actualizadas != len(filas):
+            raise ConjuntoModificado(
+                f'{actualizadas} calificaciones cambiadas en vez de {len(filas)}: el conjunto se modificó durante la revisión.'
+            )
+
+        delta = resumen.Delta()
+        por_corredor = Counter()
+        for _, _, _, *valores in filas:
+            delta.mover(tuple(valores), (estado_nuevo, *valores[1:]))
+            por_corredor[valores[-1]] += 1
+        resumen.aplicar(delta)
+
+        if estado_nuevo == 'Aprobada':
+            registrar_aprobaciones_lote([(pk, version + 1) for pk, _, version, *_ in filas], auditor)
+        versiones.registrar(
+            [versiones.Cambio(pk, version + 1, {'estado': estado_nuevo}) for pk, _, version, *_ in filas],
+            auditor, f'Revisión de Calificación ({estado_nuevo})'
+        )
+
+        registrar_logs(
+            auditor, f'Revisión de Calificación ({estado_nuevo})',
+            [_detalle(auditor, estado_nuevo, pk, instrumento) for pk, instrumento, *_ in filas]
+        )
+        verbo = 'aprobó' if estado_nuevo == 'Aprobada' else 'rechazó'
+        notificar([
+            (usuario_id, f'El auditor {auditor.nombre} {verbo} {cantidad} de sus calificaciones.')
+            for usuario_id, cantidad in sorted(por_corredor.items())
+        ], TIPO_REVISION)
+
+    return {'revisadas': len(filas), 'corredores': len(por_corredor)}
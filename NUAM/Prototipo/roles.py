@@ -0,0 +1,81 @@
+"""
+Resolución del Rol del usuario con caché en memoria del proceso.
+
+`role_required` y las plantillas leen `request.user.rol.nombre`, lo que sin
+caché cuesta una consulta a Rol en cada petición. El Rol se guarda en un LRU
+por id de usuario; la entrada se descarta cuando:
+
+- el usuario ya no apunta al mismo rol (request.user se lee de la base en
+  cada petición, así que un cambio de rol se nota de inmediato en todos
+  los procesos),
+- se guarda o borra el Rol o el usuario en este proceso (ver signals.py),
+- vence ROLES_CACHE_SEGUNDOS (cota para cambios hechos por otros procesos).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import Rol, UsuarioFinal
+
+
+class CacheRoles:
+
+    def __init__(self):
+        self._entradas = OrderedDict()  # usuario_id -> (rol, vence)
+        self._candado = threading.Lock()
+
+    def obtener(self, usuario):
+        """Rol del usuario (o None si no tiene), consultando la base solo si no está en caché."""
+        if usuario.rol_id is None:
+            return None
+        if UsuarioFinal.rol.is_cached(usuario):
+            return usuario.rol
+
+        ahora = time.monotonic()
+        with self._candado:
+            entrada = self._entradas.get(usuario.pk)
+            if entrada and entrada[0].pk == usuario.rol_id and entrada[1] > ahora:
+                self._entradas.move_to_end(usuario.pk)
+                return entrada[0]
+
+        rol = Rol.objects.filter(pk=usuario.rol_id).first()
+        if rol is None:
+            return None
+
+        with self._candado:
+            self._entradas[usuario.pk] = (rol, ahora + getattr(settings, 'ROLES_CACHE_SEGUNDOS', 300))
+            self._entradas.move_to_end(usuario.pk)
+            while len(self._entradas) > getattr(settings, 'ROLES_CACHE_MAXIMO', 10000):
+                self._entradas.popitem(last=False)
+        return rol
+
+    def invalidar_usuario(self, usuario_id):
+        with self._candado:
+            self._entradas.pop(usuario_id, None)
+
+    def invalidar_rol(self, rol_id):
+        with self._candado:
+            for usuario_id in [u for u, (rol, _) in self._entradas.items() if rol.pk == rol_id]:
+                del self._entradas[usuario_id]
+
+    def limpiar(self):
+        with self._candado:
+            self._entradas.clear()
+
+
+cache_roles = CacheRoles()
+
+
+def resolver_rol(usuario):
+    """
+    Retorna el Rol del usuario autenticado y lo deja en la caché de la relación,
+    de modo que `usuario.rol` no vuelve a consultar la base (vistas y plantillas).
+    """
+    if not usuario.is_authenticated:
+        return None
+    rol = cache_roles.obtener(usuario)
+    if rol is not None:
+        UsuarioFinal.rol.field.set_cached_value(usuario, rol)
+    return rol
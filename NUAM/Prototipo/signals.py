@@ -0,0 +1,83 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cache_vistas, resumen
+from .models import Calificacion, Factor, FactoresCalificacion, Log, Rol, UsuarioFinal
+from .roles import cache_roles
+
+
+# --- CACHÉ DE ROLES (ver roles.py) ---
+
+@receiver([post_save, post_delete], sender=Rol)
+def invalidar_rol(sender, instance, **kwargs):
+    cache_roles.invalidar_rol(instance.pk)
+    cache_vistas.invalidar(cache_vistas.USUARIOS)
+
+
+@receiver([post_save, post_delete], sender=UsuarioFinal)
+def invalidar_usuario(sender, instance, update_fields=None, **kwargs):
+    cache_roles.invalidar_usuario(instance.pk)
+    # login() guarda sólo last_login, que ningún panel muestra
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        cache_vistas.invalidar(cache_vistas.USUARIOS)
+
+
+# --- CACHÉ DE FRAGMENTOS (ver cache_vistas.py) ---
+# Sin receptores post_delete para Factor, FactoresCalificacion y Log: harían que
+# sus borrados masivos se ejecuten fila por fila. Los factores se borran con su
+# calificación o al reemplazarlos (que incrementa Calificacion.version); los
+# borrados masivos de Log invalidan explícitamente.
+
+@receiver([post_save, post_delete], sender=Calificacion)
+def invalidar_calificacion(sender, instance, **kwargs):
+    cache_vistas.invalidar(cache_vistas.CALIFICACIONES, cache_vistas.de_calificacion(instance.pk))
+
+
+@receiver(post_save, sender=Factor)
+@receiver(post_save, sender=FactoresCalificacion)
+def invalidar_factores(sender, instance, **kwargs):
+    cache_vistas.invalidar(cache_vistas.de_calificacion(instance.calificacion_id))
+
+
+@receiver(post_save, sender=Log)
+def invalidar_logs(sender, instance, **kwargs):
+    cache_vistas.invalidar(cache_vistas.LOGS)
+
+
+# --- RESUMEN DE CALIFICACIONES (ver resumen.py) ---
+
+@receiver(pre_save, sender=Calificacion)
+def leer_valores_resumen(sender, instance, **kwargs):
+    # Valores con los que la fila está contada hoy; se leen de la base de datos
+    # porque la instancia puede estar desactualizada (refresh_from_db, otra petición)
+    instance._valores_resumen = None
+    if instance.pk is not None and not instance._state.adding:
+        anteriores = Calificacion.objects.filter(pk=instance.pk).values_list(*resumen.CAMPOS).first()
+        instance._valores_resumen = tuple(anteriores) if anteriores else None
+
+
+@receiver(post_save, sender=Calificacion)
+def actualizar_resumen(sender, instance, created, update_fields=None, **kwargs):
+    anteriores = None if created else getattr(instance, '_valores_resumen', None)
+    actuales = resumen.valores(instance)
+    if anteriores is not None and update_fields is not None:
+        # Sólo cambió en la base de datos lo que estaba en update_fields
+        actuales = tuple(
+            actual if campo.removesuffix('_id') in update_fields else anterior
+            for campo, actual, anterior in zip(resumen.CAMPOS, actuales, anteriores)
+        )
+
+    delta = resumen.Delta()
+    if anteriores is None:
+        delta.agregar(actuales)
+    else:
+        delta.mover(anteriores, actuales)
+    resumen.aplicar(delta)
+    instance._valores_resumen = actuales
+
+
+@receiver(post_delete, sender=Calificacion)
+def descontar_resumen(sender, instance, **kwargs):
+    delta = resumen.Delta()
+    delta.agregar(getattr(instance, '_valores_resumen', None) or resumen.valores(instance), -1)
+    resumen.aplicar(delta)
@@ -0,0 +1,176 @@
+"""
+Datos sintéticos para pruebas de carga y benchmarks.
+
+Todo se genera con un random.Random(semilla), así que la misma semilla
+produce los mismos datos. Los usuarios usan el dominio DOMINIO y los logs
+empiezan con MARCA_LOG, para poder borrarlos con `eliminar_datos()` sin
+tocar los datos reales.
+"""
+import csv
+import datetime
+import io
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import cache_vistas, cadena_logs, resumen
+from .calculo_factores import calcular_factores_lote
+from .carga import COLUMNAS_BASE, MERCADOS_VALIDOS, PRIMER_FACTOR, CUANTO_HISTORICO, hash_contenido
+from .factores import crear_factores_lote
+from .models import Calificacion, Log, PuntoControlLog, Rol, UsuarioFinal
+from .utils import NOMBRES_FACTORES
+
+DOMINIO = 'sintetico.nuam.test'
+CONTRASENA = 'benchmark-nuam'
+MARCA_LOG = '[sintético]'
+ROLES = ('Administrador', 'Corredor', 'Auditor')
+
+NEMOTECNICOS = (
+    'BSANTANDER', 'CHILE', 'COPEC', 'FALABELLA', 'SQM-B', 'ENELAM', 'CENCOSUD', 'LTM', 'CMPC',
+    'ANDINA-B', 'VAPORES', 'ITAUCL', 'BCI', 'PARAUCO', 'CCU', 'ENTEL', 'COLBUN', 'AGUAS-A',
+    'BCU0500328', 'BTU0300339', 'BCP0600330', 'UF-FWD-2026', 'USD-FUT-2025',
+)
+EVENTOS = ('Dividendo', 'Dividendo provisorio', 'Dividendo definitivo', 'Disminución de capital', 'Cupón', 'Amortización')
+ESTADOS = ('Pendiente', 'Pendiente', 'Aprobada', 'Aprobada', 'Aprobada', 'Rechazada')
+ACCIONES = ('Inicio de Sesión Exitoso', 'Creación de Calificación', 'Edición de Factores',
+            'Revisión de Calificación (Aprobada)', 'Carga de Archivo', 'Cierre de Sesión')
+
+
+def email_sintetico(rol, numero):
+    return f'{rol.lower()}{numero}@{DOMINIO}'
+
+
+def _montos(rnd):
+    """Vector de montos con 2 a 6 columnas distintas de cero, como en los archivos reales."""
+    montos = [Decimal('0')] * len(NOMBRES_FACTORES)
+    for indice in rnd.sample(range(len(NOMBRES_FACTORES)), rnd.randint(2, 6)):
+        montos[indice] = Decimal(rnd.randint(1, 5_000_000_000)).scaleb(-4)
+    return montos
+
+
+def _fecha(rnd, desde=2018, hasta=2025):
+    return datetime.date(rnd.randint(desde, hasta), rnd.randint(1, 12), rnd.randint(1, 28))
+
+
+# --- GENERACIÓN ---
+
+def crear_roles():
+    return {nombre: Rol.objects.get_or_create(nombre=nombre, defaults={'descripcion': nombre})[0] for nombre in ROLES}
+
+
+def crear_usuarios(por_rol):
+    """Crea (si faltan) `por_rol` usuarios de cada rol. Retorna {nombre_rol: [usuarios]}."""
+    roles = crear_roles()
+    # El hash es caro a propósito: se calcula una vez para todos
+    contrasena = make_password(CONTRASENA)
+    usuarios = {}
+    for nombre, rol in roles.items():
+        emails = [email_sintetico(nombre, i) for i in range(1, por_rol + 1)]
+        existentes = set(UsuarioFinal.objects.filter(email__in=emails).values_list('email', flat=True))
+        UsuarioFinal.objects.bulk_create([
+            UsuarioFinal(email=email, nombre=f'{nombre} {email.split("@")[0]}', rol=rol, password=contrasena)
+            for email in emails if email not in existentes
+        ], batch_size=1000)
+        cache_vistas.invalidar(cache_vistas.USUARIOS)
+        usuarios[nombre] = list(UsuarioFinal.objects.filter(email__in=emails).order_by('pk'))
+    return usuarios
+
+
+def crear_calificaciones(cantidad, corredores, rnd, tamano_lote=1000, al_avanzar=None):
+    """Crea `cantidad` calificaciones de los `corredores`, cada una con su vector de factores."""
+    # Secuencias correlativas: la clave natural (calif_clave_natural_uniq) no se repite aunque se genere dos veces
+    secuencia = (Calificacion.objects.aggregate(maxima=Max('secuencia_evento'))['maxima'] or 0) + 1
+    creadas = 0
+    while creadas < cantidad:
+        tamano = min(tamano_lote, cantidad - creadas)
+        filas = []
+        for _ in range(tamano):
+            montos = _montos(rnd)
+            descripcion = f'{rnd.choice(EVENTOS)} ejercicio {rnd.randint(2018, 2025)}'
+            filas.append((Calificacion(
+                mercado=rnd.choice(MERCADOS_VALIDOS),
+                instrumento=rnd.choice(NEMOTECNICOS),
+                evento_capital=rnd.choice(EVENTOS),
+                descripcion=descripcion,
+                valor_historico=sum(montos).quantize(CUANTO_HISTORICO),
+                secuencia_evento=secuencia,
+                años=rnd.randint(2018, 2025),
+                fecha_pago=_fecha(rnd),
+                estado=rnd.choice(ESTADOS),
+                fecha_creacion=_fecha(rnd, 2023, 2025),
+                origen=rnd.choice(('Manual', 'Carga Masiva')),
+                usuario_creador=rnd.choice(corredores),
+                hash_contenido=hash_contenido(descripcion, montos),
+            ), montos))
+            secuencia += 1
+
+        with transaction.atomic():
+            calificaciones = Calificacion.objects.bulk_create([c for c, _ in filas])
+            factores = calcular_factores_lote([montos for _, montos in filas])
+            crear_factores_lote(list(zip(calificaciones, factores)))
+            # bulk_create no emite señales: el resumen se actualiza aquí
+            delta = resumen.Delta()
+            for calificacion in calificaciones:
+                delta.agregar(resumen.valores(calificacion))
+            resumen.aplicar(delta)
+        creadas += tamano
+        if al_avanzar:
+            al_avanzar(creadas)
+    return creadas
+
+
+def crear_logs(cantidad, usuarios, rnd, tamano_lote=5000, al_avanzar=None):
+    """Crea `cantidad` entradas de Log repartidas en el último año (directo, sin pasar por auditoria.py)."""
+    ahora = timezone.now()
+    creadas = 0
+    while creadas < cantidad:
+        tamano = min(tamano_lote, cantidad - creadas)
+        cadena_logs.insertar([
+            Log(
+                usuario=rnd.choice(usuarios),
+                accion=rnd.choice(ACCIONES),
+                fecha_hora=ahora - datetime.timedelta(seconds=rnd.randint(0, 365 * 24 * 3600)),
+                detalle_cambio=f'{MARCA_LOG} {rnd.choice(ACCIONES)} sobre {rnd.choice(NEMOTECNICOS)} ({rnd.randint(1, 10**6)}).',
+            )
+            for _ in range(tamano)
+        ])
+        cache_vistas.invalidar(cache_vistas.LOGS)
+        creadas += tamano
+        if al_avanzar:
+            al_avanzar(creadas)
+    return creadas
+
+
+def archivo_carga_csv(filas, rnd):
+    """Contenido (bytes) de un archivo de carga masiva válido con `filas` filas."""
+    salida = io.StringIO()
+    escritor = csv.writer(salida, delimiter=';')
+    escritor.writerow([campo for campo, _, _, _ in COLUMNAS_BASE] +
+                      [f'F{PRIMER_FACTOR + i}' for i in range(len(NOMBRES_FACTORES))])
+    for _ in range(filas):
+        fecha = _fecha(rnd)
+        escritor.writerow([
+            fecha.year, rnd.choice(MERCADOS_VALIDOS), rnd.choice(NEMOTECNICOS), fecha.isoformat(),
+            rnd.randint(1, 99999), rnd.choice(EVENTOS),
+        ] + [str(monto) if monto else '' for monto in _montos(rnd)])
+    return salida.getvalue().encode('utf-8')
+
+
+# --- LIMPIEZA ---
+
+def eliminar_datos():
+    """Borra los usuarios sintéticos (y en cascada sus calificaciones) y los logs sintéticos."""
+    sinteticos = Log.objects.filter(detalle_cambio__startswith=MARCA_LOG)
+    meses = [mes.strftime('%Y-%m') for mes in sinteticos.dates('fecha_hora', 'month')]
+    logs, _ = sinteticos.delete()
+    # Borrar entradas rompe la cadena de hashes de esos meses: solo aquí (datos de prueba) se rehace
+    cadena_logs.sellar(meses=meses)
+    PuntoControlLog.objects.filter(mes__in=meses).delete()
+    cache_vistas.invalidar(cache_vistas.LOGS)
+    # El borrado en cascada emite una señal por calificación: el resumen se descuenta una sola vez al final
+    with transaction.atomic(), resumen.en_lote():
+        usuarios, _ = UsuarioFinal.objects.filter(email__endswith=f'@{DOMINIO}').delete()
+    return usuarios, logs
@@ -13,6 +13,7 @@ document.addEventListener('DOMContentLoaded', function() {
     // Variables de estado
     let datosArchivo = [];
     let archivoOriginal = null;
+    let registrosValidos = null; // Según la validación del servidor (archivo completo)
     let procesandoArchivo = false;
     
     // Configuración de formatos permitidos
@@ -206,15 +207,74 @@ document.addEventListener('DOMContentLoaded', function() {
         const extension = archivoOriginal.name.toLowerCase().split('.').pop();
         
         if (extension === 'csv') {
-            procesarCSV(archivoOriginal);
+            // El servidor valida el archivo completo (sin grabar) antes de mostrarlo
+            validarEnServidor(archivoOriginal, () => procesarCSV(archivoOriginal));
         } else if (extension === 'xlsx' || extension === 'xls') {
-            procesarExcel(archivoOriginal);
+            validarEnServidor(archivoOriginal, procesarExcel);
         } else {
             showErrorMessage('Formato de archivo no soportado');
             finalizarProcesamiento();
         }
     }
 
+    // Validar el archivo completo en el servidor (modo de prueba, no graba nada)
+    function validarEnServidor(archivo, alValidar) {
+        mostrarEstadoCarga(true, 'Validando archivo en el servidor...');
+        
+        const formData = new FormData();
+        formData.append('archivo', archivo);
+        
+        fetch(archivoInput.dataset.urlValidar, {
+            method: 'POST',
+            body: formData,
+            headers: {'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value}
+        })
+            .then(respuesta => respuesta.json())
+            .then(informe => {
+                if (informe.error) {
+                    showErrorMessage(informe.error);
+                    finalizarProcesamiento();
+                    return;
+                }
+                
+                registrosValidos = informe.resumen.filas_validas;
+                mostrarInformeValidacion(informe);
+                alValidar(informe);
+            })
+            .catch(() => {
+                showErrorMessage('Error de comunicación con el servidor');
+                finalizarProcesamiento();
+            });
+    }
+
+    // Mostrar el resumen y los primeros errores del informe de validación
+    function mostrarInformeValidacion(informe) {
+        const resumen = informe.resumen;
+        
+        if (informe.valido) {
+            showSuccessMessage(`Validación del servidor: ${resumen.filas} filas correctas (${resumen.duracion_ms} ms)`);
+            return;
+        }
+        
+        const detalle = informe.errores.slice(0, 5).map(([fila, columna, codigo]) =>
+            `Fila ${fila}, ${escaparHTML(columna)}: ${informe.codigos[codigo]}`
+        );
+        if (resumen.errores > detalle.length) {
+            detalle.push(`... y ${resumen.errores - detalle.length} errores más`);
+        }
+        showWarningMessage(
+            `Validación del servidor: ${resumen.filas_con_errores} de ${resumen.filas} filas con errores ` +
+            `(no se grabarán):\n${detalle.join('\n')}`
+        );
+    }
+
+    // Los nombres de columna vienen del archivo: se escapan antes de insertarlos como HTML
+    function escaparHTML(texto) {
+        const div = document.createElement('div');
+        div.textContent = texto;
+        return div.innerHTML;
+    }
+
     // Procesar archivo CSV
     function procesarCSV(archivo) {
         const reader = new FileReader();
@@ -268,6 +328,49 @@ document.addEventListener('DOMContentLoaded', function() {
         reader.readAsText(archivo);
     }
 
+    // Procesar archivo Excel: el servidor lo lee (ver carga.leer_filas_xlsx) y devuelve
+    // una muestra de las primeras filas para la vista previa
+    function procesarExcel(informe) {
+        procesarDatos(informe.muestra);
+    }
+
+    // Validar encabezados
+                if (!validarEncabezados(encabezados)) {
+                    return;
+                }
+                
+                // Procesar datos
+                const datos = [];
+                for (let i = 1; i < lineas.length; i++) {
+                    const linea = lineas[i].trim();
+                    if (linea) {
+                        const valores = linea.split(',').map(v => v.trim().replace(/"/g, ''));
+                        if (valores.length === encabezados.length) {
+                            const fila = {};
+                            encabezados.forEach((encabezado, index) => {
+                                fila[encabezado] = valores[index];
+                            });
+                            datos.push(fila);
+                        }
+                    }
+                }
+                
+                procesarDatos(datos);
+                
+            } catch (error) {
+                showErrorMessage('Error al procesar CSV: ' + error.message);
+                finalizarProcesamiento();
+            }
+        };
+        
+        reader.onerror = function() {
+            showErrorMessage('Error al leer el archivo CSV');
+            finalizarProcesamiento();
+        };
+        
+        reader.readAsText(archivo);
+    }
+
     // Procesar archivo Excel (simulado - requiere librería como SheetJS)
     function procesarExcel(archivo) {
         // Nota: En un entorno real, necesitarías una librería como SheetJS
@@ -558,19 +661,67 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
         
-        if (confirm(`¿Está seguro de grabar ${datosArchivo.length} registros?`)) {
+        if (confirm(`¿Está seguro de grabar ${registrosValidos ?? datosArchivo.length} registros?`)) {
             mostrarEstadoCarga(true, 'Grabando datos...');
             habilitarBotones(false);
             
-            // Simular grabado
-            setTimeout(() => {
-                showSuccessMessage('Datos grabados correctamente');
-                limpiarFormulario();
-                finalizarProcesamiento();
-            }, 2000);
+            // El servidor vuelve a leer y validar el archivo original y graba en lotes
+            const formData = new FormData();
+            formData.append('archivo', archivoOriginal);
+            
+            fetch(archivoInput.dataset.urlProcesar, {
+                method: 'POST',
+                body: formData,
+                headers: {'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value}
+            })
+                .then(respuesta => respuesta.json())
+                .then(respuesta => {
+                    if (respuesta.error) {
+                        showErrorMessage(respuesta.error);
+                        finalizarProcesamiento();
+                    } else {
+                        // La carga quedó en cola: consultar su avance hasta que termine
+                        consultarEstadoCarga(respuesta.url_estado);
+                    }
+                })
+                .catch(() => {
+                    showErrorMessage('Error de comunicación con el servidor');
+                    finalizarProcesamiento();
+                });
         }
     }
 
+    // Consultar periódicamente el estado de una carga en segundo plano
+    function consultarEstadoCarga(urlEstado) {
+        fetch(urlEstado)
+            .then(respuesta => respuesta.json())
+            .then(resultado => {
+                if (resultado.en_curso) {
+                    mostrarEstadoCarga(true, `Grabando datos... ${resultado.filas_procesadas} registros procesados`);
+                    setTimeout(() => consultarEstadoCarga(urlEstado), 1000);
+                    return;
+                }
+                
+                // Una nueva carga del mismo archivo actualiza en vez de duplicar (ver carga.py)
+                const detalle = `${resultado.filas_insertadas} nuevos, ${resultado.filas_actualizadas} actualizados, ` +
+                    `${resultado.filas_sin_cambios} sin cambios`;
+                if (resultado.estado === 'Fallido') {
+                    showErrorMessage(resultado.errores.length ? resultado.errores[0].mensaje : 'La carga falló');
+                } else if (resultado.filas_fallidas > 0) {
+                    showWarningMessage(`${resultado.filas_procesadas} registros procesados (${detalle}), ${resultado.filas_fallidas} con errores`);
+                    limpiarFormulario();
+                } else {
+                    showSuccessMessage(`${resultado.filas_procesadas} registros procesados correctamente (${detalle})`);
+                    limpiarFormulario();
+                }
+                finalizarProcesamiento();
+            })
+            .catch(() => {
+                showErrorMessage('Error de comunicación con el servidor');
+                finalizarProcesamiento();
+            });
+    }
+
     // Cancelar operación
     function cancelarOperacion() {
         if (datosArchivo.length > 0) {
@@ -763,6 +914,7 @@ document.addEventListener('DOMContentLoaded', function() {
     function limpiarFormulario() {
         archivoInput.value = '';
         datosArchivo = [];
+        registrosValidos = null;
         archivoOriginal = null;
         limpiarTabla();
         
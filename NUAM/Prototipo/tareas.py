@@ -0,0 +1,177 @@
+"""
+Ejecutor de cargas masivas en segundo plano.
+
+La cola vive en la propia base de datos: cada ArchivoCarga en estado
+'Pendiente' es un trabajo por hacer. Un trabajador lo reclama con un UPDATE
+condicional (estado='Pendiente' -> 'Procesando'), de modo que el servidor web
+y cualquier número de procesos `procesar_cargas` pueden trabajar a la vez sin
+un broker externo y sin procesar dos veces el mismo archivo.
+"""
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .carga import procesar_archivo, ErrorFormatoArchivo
+from .auditoria import registrar_log
+from .models import ArchivoCarga
+from .notificaciones import notificar, TIPO_CARGA
+
+logger = logging.getLogger(__name__)
+
+ESTADO_PENDIENTE = 'Pendiente'
+ESTADO_PROCESANDO = 'Procesando'
+ESTADO_FALLIDO = 'Fallido'
+ESTADOS_EN_CURSO = (ESTADO_PENDIENTE, ESTADO_PROCESANDO)
+
+_ejecutor = None
+_candado_ejecutor = threading.Lock()
+
+
+# --- RECLAMO DE TRABAJOS ---
+
+def reclamar(pk):
+    """Intenta tomar la carga `pk`. Solo un trabajador puede ganar el UPDATE."""
+    return ArchivoCarga.objects.filter(pk=pk, estado=ESTADO_PENDIENTE).update(
+        estado=ESTADO_PROCESANDO,
+        fecha_inicio=timezone.now()
+    ) == 1
+
+
+def reclamar_siguiente():
+    """Reclama la carga pendiente más antigua. Retorna su pk o None si la cola está vacía."""
+    candidatas = ArchivoCarga.objects.filter(estado=ESTADO_PENDIENTE).order_by('pk').values_list('pk', flat=True)[:10]
+    for pk in candidatas:
+        if reclamar(pk):
+            return pk
+    return None
+
+
+def reencolar_huerfanas(minutos):
+    """Devuelve a 'Pendiente' las cargas cuyo trabajador murió a mitad de camino."""
+    limite = timezone.now() - timedelta(minutes=minutos)
+    return ArchivoCarga.objects.filter(estado=ESTADO_PROCESANDO, fecha_inicio__lt=limite).update(
+        estado=ESTADO_PENDIENTE
+    )
+
+
+# --- EJECUCIÓN ---
+
+def _avisar(archivo_carga, mensaje):
+    """Notifica el resultado de la carga a quien la subió (si su usuario sigue existiendo)."""
+    if archivo_carga.cargado_por_id is not None:
+        notificar([(archivo_carga.cargado_por_id, mensaje)], TIPO_CARGA)
+
+
+def ejecutar_carga(pk):
+    """Procesa una carga ya reclamada, publicando el avance tras cada lote grabado."""
+    archivo_carga = ArchivoCarga.objects.select_related('cargado_por').get(pk=pk)
+
+    def al_avanzar(resultado):
+        ArchivoCarga.objects.filter(pk=pk).update(
+            filas_procesadas=resultado.filas_procesadas,
+            filas_fallidas=resultado.filas_fallidas
+        )
+
+    try:
+        with archivo_carga.archivo.open('rb') as archivo:
+            resultado = procesar_archivo(archivo_carga, archivo, archivo_carga.cargado_por, al_avanzar=al_avanzar)
+    except ErrorFormatoArchivo as e:
+        ArchivoCarga.objects.filter(pk=pk).update(
+            estado=ESTADO_FALLIDO, errores=[{'mensaje': str(e)}], fecha_fin=timezone.now()
+        )
+        _avisar(archivo_carga, f'El archivo {archivo_carga.nombre} no se pudo procesar: {e}')
+        return
+    except Exception as e:
+        logger.exception('Error procesando la carga %s', pk)
+        ArchivoCarga.objects.filter(pk=pk).update(
+            estado=ESTADO_FALLIDO, errores=[{'mensaje': f'Error interno: {e}'}], fecha_fin=timezone.now()
+        )
+        _avisar(archivo_carga, f'El archivo {archivo_carga.nombre} no se pudo procesar por un error interno.')
+        return
+
+    ArchivoCarga.objects.filter(pk=pk).update(fecha_fin=timezone.now())
+    registrar_log(
+        usuario=archivo_carga.cargado_por,
+        accion='Carga de Archivo',
+        detalle_cambio=f'Se procesó el archivo {archivo_carga.nombre} ({pk}): '
+                       f'{resultado.filas_insertadas} filas nuevas, {resultado.filas_actualizadas} actualizadas, '
+                       f'{resultado.filas_sin_cambios} sin cambios y {resultado.filas_fallidas} con errores.'
+    )
+    _avisar(
+        archivo_carga,
+        f'Su archivo {archivo_carga.nombre} terminó de procesarse: {resultado.filas_insertadas} calificaciones nuevas, '
+        f'{resultado.filas_actualizadas} actualizadas y {resultado.filas_fallidas} filas con errores.'
+    )
+
+
+def _trabajar(pk):
+    """Punto de entrada de los hilos del ejecutor en proceso."""
+    close_old_connections()
+    try:
+        if reclamar(pk):
+            ejecutar_carga(pk)
+    finally:
+        # Cada hilo tiene su propia conexión; no la dejamos abierta entre trabajos
+        connection.close()
+
+
+def trabajar_cola(continuo=False, intervalo=2.0):
+    """
+    Bucle de un trabajador externo (comando procesar_cargas).
+    Procesa cargas pendientes hasta vaciar la cola, o indefinidamente si `continuo`.
+    """
+    procesadas = 0
+    while True:
+        close_old_connections()
+        pk = reclamar_siguiente()
+        if pk is not None:
+            ejecutar_carga(pk)
+            procesadas += 1
+        elif continuo:
+            time.sleep(intervalo)
+        else:
+            return procesadas
+
+
+def contexto_fork():
+    """
+    Contexto de multiprocessing para los comandos con --procesos, o None si
+    fork no está disponible: los hijos heredan Django ya configurado, y eso
+    solo es posible con fork. Windows no lo tiene y en macOS no es seguro
+    (bibliotecas del sistema con hilos); ahí los comandos usan un solo proceso.
+    """
+    if sys.platform == 'darwin' or 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context('fork')
+
+
+# --- ENCOLADO DESDE LAS VISTAS ---
+
+def _obtener_ejecutor():
+    global _ejecutor
+    with _candado_ejecutor:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'CARGAS_HILOS', 2),
+                thread_name_prefix='carga'
+            )
+    return _ejecutor
+
+
+def encolar(archivo_carga):
+    """
+    Programa el procesamiento de `archivo_carga` fuera del hilo de la petición.
+    Se envía al ejecutor recién cuando la transacción confirma el registro 'Pendiente'.
+    Con CARGAS_EN_PROCESO = False solo queda en la cola de la base de datos.
+    """
+    if getattr(settings, 'CARGAS_EN_PROCESO', True):
+        pk = archivo_carga.pk
+        transaction.on_commit(lambda: _obtener_ejecutor().submit(_trabajar, pk))
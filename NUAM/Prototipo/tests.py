@@ -1,3 +1,1378 @@
-from django.test import TestCase
+"""
+Pruebas de la aplicación Prototipo.
 
-# Create your tests here.
+Corren con la configuración normal (AUDITORIA_ASINCRONA = True): dentro de
+un TestCase la transacción nunca confirma, así que las entradas de
+auditoría no se encolan y las vistas hacen las mismas consultas que en
+producción. Las pruebas de auditoría ejecutan los on_commit con
+captureOnCommitCallbacks y graban con el escritor a mano.
+"""
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import pathlib
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+from decimal import Decimal
+from unittest import mock, skipIf
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import OperationalError, connection, transaction
+from django.db.models import QuerySet
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    api, auditoria, cadena_logs, calculo_factores, carga, notificaciones, resumen, retencion_logs, sinteticos, tareas,
+    versiones,
+)
+from .auditoria import EscritorAuditoria, registrar_log
+from .busqueda import buscar_calificaciones, buscar_logs
+from .factores import (
+    ConflictoVersion, almacen, crear_factores_lote, empaquetar, guardar_factores, leer_factores, leer_factores_lote,
+    vector_vacio,
+)
+from .instrumentacion import PresupuestoConsultasMixin
+from .models import (
+    ArchivoCarga, Calificacion, Factor, FactoresCalificacion, Log, Notificacion, PendientesCorredor, PuntoControlLog, ResumenCalificacion, Rol,
+    UsuarioFinal, VersionCalificacion,
+)
+from .paginacion import codificar_cursor, paginar
+from .revision import MAX_IDS, ConjuntoModificado, CriterioInvalido, criterio_desde, revisar_lote
+from .roles import cache_roles
+from .serializacion import arreglo_json, compilar_objeto, formateadores_json
+from .utils import NOMBRES_FACTORES
+
+CONTRASENA = 'clave-de-prueba-123'
+
+
+def crear_usuario(rol, email):
+    return UsuarioFinal.objects.create_user(
+        email=email, password=CONTRASENA, rol=Rol.objects.get(nombre=rol), nombre=email.split('@')[0]
+    )
+
+
+def crear_calificacion(usuario, instrumento='BSANTANDER', secuencia_evento=1, valores=None, **campos):
+    """Calificación con su vector de factores y la primera versión del historial, como calificacion_crear."""
+    calificacion = Calificacion.objects.create(
+        usuario_creador=usuario, instrumento=instrumento, secuencia_evento=secuencia_evento, mercado='AC',
+        años=2025, fecha_pago=datetime.date(2025, 5, 15), **campos
+    )
+    valores = valores or vector_vacio()
+    crear_factores_lote([(calificacion, valores)])
+    versiones.registrar(
+        [versiones.Cambio(calificacion.pk, calificacion.version, versiones.campos_de(calificacion), valores)],
+        usuario, 'Creación de Calificación'
+    )
+    return calificacion
+
+
+def datos_factores(valores, version):
+    """POST del formset de factores (calificacion_factores_editar)."""
+    datos = {
+        'version': version,
+        'form-TOTAL_FORMS': len(NOMBRES_FACTORES), 'form-INITIAL_FORMS': len(NOMBRES_FACTORES),
+        'form-MIN_NUM_FORMS': len(NOMBRES_FACTORES), 'form-MAX_NUM_FORMS': 1000,
+    }
+    for i, (nombre, valor) in enumerate(zip(NOMBRES_FACTORES, valores)):
+        datos[f'form-{i}-nombre'] = nombre
+        datos[f'form-{i}-valor'] = str(valor)
+    return datos
+
+
+class PruebaNUAM(TestCase):
+    """
+    Usuarios de cada rol, y cachés en memoria limpias en cada prueba: la
+    caché de roles y la de vistas sobreviven al rollback, y SQLite reutiliza
+    los ids.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.corredor = crear_usuario('Corredor', 'corredor@nuam.test')
+        cls.otro_corredor = crear_usuario('Corredor', 'otro.corredor@nuam.test')
+        cls.auditor = crear_usuario('Auditor', 'auditor@nuam.test')
+        cls.administrador = crear_usuario('Administrador', 'administrador@nuam.test')
+
+    def setUp(self):
+        cache_roles.limpiar()
+        for cache in caches.all():
+            cache.clear()
+
+    def assertResumenIgualAlRecalculo(self):
+        """Los contadores mantenidos cambio a cambio son los que deja resumen.recalcular()."""
+        def contadores():
+            return (
+                set(ResumenCalificacion.objects.filter(cantidad__gt=0).values_list(*resumen.DIMENSIONES, 'cantidad')),
+                set(PendientesCorredor.objects.filter(cantidad__gt=0).values_list('usuario_id', 'cantidad')),
+            )
+        incrementales = contadores()
+        resumen.recalcular()
+        self.assertEqual(incrementales, contadores())
+
+
+# --- AUDITORÍA ASÍNCRONA (auditoria.py) ---
+
+class AuditoriaTest(PruebaNUAM):
+
+    def setUp(self):
+        super().setUp()
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        ajustes = override_settings(AUDITORIA_ASINCRONA=True, AUDITORIA_SPOOL_DIR=self.directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        # Un escritor propio y sin hilo: la prueba decide cuándo se graba
+        self.escritor = EscritorAuditoria()
+        for parche in (
+            mock.patch.object(EscritorAuditoria, '_iniciar_hilo'),
+            mock.patch.object(auditoria, 'escritor', self.escritor),
+        ):
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def _spool(self, pid, detalles):
+        ruta = os.path.join(self.directorio, f'{auditoria.PREFIJO_SPOOL}{pid}.jsonl')
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            for detalle in detalles:
+                archivo.write(
+                    f'{{"usuario_id": {self.corredor.pk}, "accion": "Prueba", '
+                    f'"fecha_hora": "2025-01-15T10:00:00+00:00", "detalle_cambio": "{detalle}"}}\n'
+                )
+        return ruta
+
+    def test_recupera_el_spool_de_un_proceso_muerto(self):
+        muerto = subprocess.Popen([sys.executable, '-c', 'pass'])
+        muerto.wait()
+        huerfano = self._spool(muerto.pid, ['huérfana 1', 'huérfana 2'])
+        vivo = self._spool(os.getppid(), ['de un proceso vivo'])
+
+        self.assertEqual(self.escritor.recuperar(), 2)
+
+        self.assertFalse(os.path.exists(huerfano))
+        self.assertTrue(os.path.exists(vivo))
+        self.assertEqual(
+            set(Log.objects.filter(accion='Prueba').values_list('detalle_cambio', flat=True)),
+            {'huérfana 1', 'huérfana 2'},
+        )
+
+    def test_un_lote_fallido_queda_en_disco_y_se_reintenta(self):
+        self.escritor.registrar_varias(self.corredor.pk, 'Prueba', ['uno', 'dos'])
+        with mock.patch.object(auditoria, '_insertar', side_effect=OperationalError('base caída')):
+            with self.assertLogs('Prototipo.auditoria', 'ERROR'):
+                self.assertEqual(self.escritor.vaciar(), 0)
+
+        self.assertFalse(Log.objects.filter(accion='Prueba').exists())
+        self.assertTrue(self.escritor._hay_fallidos)
+        self.assertEqual(len(os.listdir(self.directorio)), 1)
+
+        self.assertEqual(self.escritor.recuperar(), 2)
+        self.assertEqual(Log.objects.filter(accion='Prueba').count(), 2)
+        self.assertEqual(os.listdir(self.directorio), [])
+
+    def test_se_descarta_si_la_transaccion_se_revierte(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    registrar_log(self.corredor, 'Prueba', 'revertida')
+                    raise OperationalError('falla después de registrar')
+            except OperationalError:
+                pass
+            registrar_log(self.corredor, 'Prueba', 'confirmada')
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.escritor.vaciar(), 1)
+        self.assertEqual(list(Log.objects.filter(accion='Prueba').values_list('detalle_cambio', flat=True)), ['confirmada'])
+
+
+# --- PRESUPUESTOS DE CONSULTAS (instrumentacion.py) ---
+
+@override_settings(INSTRUMENTACION_ACTIVA=True)
+class PresupuestoConsultasTest(PresupuestoConsultasMixin, PruebaNUAM):
+    """
+    Una prueba por vista con @presupuesto_consultas, por sus caminos más
+    caros: con las cachés vacías (roles, fragmentos, contador de
+    notificaciones) y, en las que registran versiones, cuando toca una base.
+    Los presupuestos de views.py son lo que miden estas pruebas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        sinteticos.crear_calificaciones(30, [cls.corredor, cls.otro_corredor], random.Random(1))
+        cls.calificacion = crear_calificacion(cls.corredor, secuencia_evento=1000, estado='Pendiente')
+        Notificacion.objects.bulk_create(
+            Notificacion(usuario=cls.corredor, tipo='Revisión', mensaje=f'Aviso {i}') for i in range(3)
+        )
+        cls.archivo_carga = ArchivoCarga.objects.create(cargado_por=cls.corredor, nombre='carga.csv', estado='Completado')
+
+    def _get(self, usuario, nombre, *args, **datos):
+        self.client.force_login(usuario)
+        return self.client.get(reverse(nombre, args=args), datos)
+
+    def _post(self, usuario, nombre, *args, **datos):
+        self.client.force_login(usuario)
+        return self.client.post(reverse(nombre, args=args), datos)
+
+    def test_panel_auditor(self):
+        response = self._get(self.auditor, 'PanelAuditor')
+        self.assertEqual(response.status_code, 200)
+        self.assertDentroDePresupuesto(response)
+
+    def test_panel_auditor_busqueda(self):
+        response = self._get(self.auditor, 'PanelAuditor', q='BSANTANDER')
+        self.assertEqual(response.status_code, 200)
+        self.assertDentroDePresupuesto(response)
+
+    def test_panel_corredor(self):
+        response = self._get(self.corredor, 'PanelCorredor')
+        self.assertEqual(response.status_code, 200)
+        self.assertDentroDePresupuesto(response)
+
+    def test_panel_administrador(self):
+        response = self._get(self.administrador, 'PanelAdministrador')
+        self.assertEqual(response.status_code, 200)
+        self.assertDentroDePresupuesto(response)
+
+    def test_panel_reportes(self):
+        response = self._get(self.auditor, 'PanelReportes')
+        self.assertEqual(response.status_code, 200)
+        self.assertDentroDePresupuesto(response)
+
+    def test_notificaciones(self):
+        response = self._get(self.corredor, 'Notificaciones')
+        self.assertEqual(response.status_code, 200)
+        self.assertDentroDePresupuesto(response)
+
+    def test_notificaciones_marcar_leidas(self):
+        response = self._post(self.corredor, 'NotificacionesMarcarLeidas')
+        self.assertEqual(response.status_code, 302)
+        self.assertDentroDePresupuesto(response)
+
+    def test_calificacion_factores_editar(self):
+        response = self._get(self.corredor, 'CalificacionFactoresEditar', self.calificacion.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertDentroDePresupuesto(response)
+
+        valores = vector_vacio()
+        valores[0] = Decimal('0.2500')
+        response = self._post(
+            self.corredor, 'CalificacionFactoresEditar', self.calificacion.pk,
+            **datos_factores(valores, self.calificacion.version)
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertDentroDePresupuesto(response)
+
+    def test_calificacion_factores_editar_conflicto(self):
+        response = self._post(
+            self.corredor, 'CalificacionFactoresEditar', self.calificacion.pk,
+            **datos_factores(vector_vacio(), self.calificacion.version + 5)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertDentroDePresupuesto(response)
+
+    def test_calificacion_factores_editar_con_base(self):
+        Calificacion.objects.filter(pk=self.calificacion.pk).update(version=versiones.INTERVALO_BASE - 1)
+        valores = vector_vacio()
+        valores[3] = Decimal('0.1250')
+        response = self._post(
+            self.corredor, 'CalificacionFactoresEditar', self.calificacion.pk,
+            **datos_factores(valores, versiones.INTERVALO_BASE - 1)
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertDentroDePresupuesto(response)
+
+    def test_calificacion_revisar(self):
+        response = self._get(self.auditor, 'CalificacionRevisar', self.calificacion.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertDentroDePresupuesto(response)
+
+        response = self._post(
+            self.auditor, 'CalificacionRevisar', self.calificacion.pk,
+            nuevo_estado='Aprobada', version=self.calificacion.version
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertDentroDePresupuesto(response)
+
+    def test_calificacion_revisar_con_base(self):
+        # La versión que registra la revisión es múltiplo de INTERVALO_BASE: se guarda el estado completo
+        Calificacion.objects.filter(pk=self.calificacion.pk).update(version=versiones.INTERVALO_BASE - 1)
+        response = self._post(
+            self.auditor, 'CalificacionRevisar', self.calificacion.pk,
+            nuevo_estado='Aprobada', version=versiones.INTERVALO_BASE - 1
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertDentroDePresupuesto(response)
+
+    def test_calificacion_revisar_comparacion(self):
+        response = self._get(self.auditor, 'CalificacionRevisar', self.calificacion.pk, desde=self.calificacion.version)
+        self.assertEqual(response.status_code, 200)
+        self.assertDentroDePresupuesto(response)
+
+    def test_calificaciones_revisar_lote(self):
+        pendientes = Calificacion.objects.filter(estado='Pendiente').values_list('pk', flat=True)
+        response = self._post(self.auditor, 'CalificacionesRevisarLote', nuevo_estado='Aprobada', ids=list(pendientes))
+        self.assertEqual(response.status_code, 302)
+        self.assertDentroDePresupuesto(response)
+
+    def test_carga_archivo_validar(self):
+        archivo = SimpleUploadedFile('carga.csv', sinteticos.archivo_carga_csv(20, random.Random(2)), 'text/csv')
+        response = self._post(self.corredor, 'CargaArchivoValidar', archivo=archivo)
+        self.assertEqual(response.status_code, 200)
+        self.assertDentroDePresupuesto(response)
+
+    def test_carga_archivo_estado(self):
+        response = self._get(self.corredor, 'CargaArchivoEstado', self.archivo_carga.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertDentroDePresupuesto(response)
+
+    def test_api_calificaciones(self):
+        response = self._get(self.auditor, 'ApiCalificaciones')
+        self.assertEqual(response.status_code, 200)
+        self.assertDentroDePresupuesto(response)
+
+
+# --- BÚSQUEDA DE TEXTO COMPLETO (busqueda.py) ---
+
+class BusquedaTest(PruebaNUAM):
+
+    def setUp(self):
+        super().setUp()
+        self.propia = crear_calificacion(self.corredor, instrumento='BSANTANDER')
+        self.ajena = crear_calificacion(self.otro_corredor, instrumento='CHILE')
+        fecha = datetime.datetime(2025, 5, 10, 12, tzinfo=datetime.timezone.utc)
+        self.log_propio, self.log_ajeno = cadena_logs.insertar([
+            Log(usuario=self.corredor, accion='Carga de Archivo', detalle_cambio='BSANTANDER', fecha_hora=fecha),
+            Log(usuario=self.otro_corredor, accion='Cierre de Sesión', detalle_cambio='Sin detalle', fecha_hora=fecha),
+        ])
+
+    def test_por_contenido(self):
+        self.assertEqual(list(buscar_calificaciones(Calificacion.objects.all(), 'bsant')), [self.propia])
+        self.assertEqual(list(buscar_logs(Log.objects.all(), 'bsantander')), [self.log_propio])
+
+    def test_por_nombre_del_corredor_o_usuario(self):
+        # Los nombres son la parte local del correo: 'corredor' y 'otro.corredor'
+        self.assertEqual(list(buscar_calificaciones(Calificacion.objects.all(), 'otro.corr')), [self.ajena])
+        self.assertEqual(list(buscar_logs(Log.objects.all(), 'otro.corr')), [self.log_ajeno])
+        self.assertEqual(
+            set(buscar_calificaciones(Calificacion.objects.all(), 'corredor')), {self.propia, self.ajena}
+        )
+
+        self.client.force_login(self.auditor)
+        response = self.client.get(reverse('PanelAuditor'), {'q': 'otro.corredor'})
+        self.assertContains(response, 'CHILE')
+        self.assertNotContains(response, 'BSANTANDER')
+
+
+# --- PAGINACIÓN POR CURSOR (paginacion.py) ---
+
+class PaginacionTest(PruebaNUAM):
+    CURSORES_INVALIDOS = (
+        'no-es-un-cursor', codificar_cursor(['abc']), codificar_cursor(['x', 1]),
+        codificar_cursor([{'a': 1}, 1]), codificar_cursor([None, 1]), codificar_cursor([1, 2, 3]),
+    )
+
+    def setUp(self):
+        super().setUp()
+        fecha = datetime.datetime(2025, 5, 10, 12, tzinfo=datetime.timezone.utc)
+        cadena_logs.insertar([
+            Log(usuario=self.corredor, accion='Prueba', detalle_cambio=f'Entrada {i}', fecha_hora=fecha)
+            for i in range(5)
+        ])
+
+    def test_las_paginas_siguen_el_orden(self):
+        orden = ('-fecha_hora', '-id')
+        todos = list(Log.objects.order_by(*orden).values_list('pk', flat=True))
+        primera, cursor = paginar(Log.objects.all(), orden, tamano=3)
+        segunda, fin = paginar(Log.objects.all(), orden, cursor, tamano=3)
+        self.assertEqual([log.pk for log in primera + segunda], todos)
+        self.assertIsNone(fin)
+
+    def test_un_cursor_invalido_es_la_primera_pagina(self):
+        primera = [log.pk for log in paginar(Log.objects.all(), ('-fecha_hora', '-id'), tamano=3)[0]]
+        for cursor in self.CURSORES_INVALIDOS:
+            with self.subTest(cursor=cursor):
+                for orden in (('-fecha_hora', '-id'), ('-id',)):
+                    paginar(Log.objects.all(), orden, cursor)
+                pagina, _ = paginar(Log.objects.all(), ('-fecha_hora', '-id'), cursor, tamano=3)
+                self.assertEqual([log.pk for log in pagina], primera)
+
+    def test_las_vistas_no_fallan_con_un_cursor_invalido(self):
+        crear_calificacion(self.corredor)
+        for cursor in self.CURSORES_INVALIDOS:
+            with self.subTest(cursor=cursor):
+                for usuario, nombre, parametros in (
+                    (self.auditor, 'PanelAuditor', {'cursor': cursor, 'cursor_logs': cursor}),
+                    (self.auditor, 'PanelAuditor', {'q': 'Entrada', 'cursor': cursor, 'cursor_logs': cursor}),
+                    (self.corredor, 'PanelCorredor', {'cursor': cursor}),
+                    (self.corredor, 'Notificaciones', {'cursor': cursor}),
+                ):
+                    self.client.force_login(usuario)
+                    self.assertEqual(self.client.get(reverse(nombre), parametros).status_code, 200)
+
+
+# --- EDICIÓN DE FACTORES CON VERSIÓN OPTIMISTA (factores.py) ---
+
+@override_settings(FACTORES_ALMACENAMIENTO='eav')
+class GuardarFactoresTest(PruebaNUAM):
+
+    def setUp(self):
+        super().setUp()
+        self.valores = vector_vacio()
+        self.valores[:3] = [Decimal('0.1000'), Decimal('0.2000'), Decimal('0.3000')]
+        self.calificacion = crear_calificacion(self.corredor, valores=self.valores)
+
+    def test_version_vieja_no_pisa_los_factores_y_avisa(self):
+        abierta = self.calificacion.version
+        # Otra edición se guarda mientras el formulario está abierto
+        otros = list(self.valores)
+        otros[0] = Decimal('0.5000')
+        nueva = guardar_factores(self.calificacion, otros, version=abierta)
+
+        mios = list(self.valores)
+        mios[1] = Decimal('0.9000')
+        self.client.force_login(self.corredor)
+        response = self.client.post(
+            reverse('CalificacionFactoresEditar', args=[self.calificacion.pk]), datos_factores(mios, abierta)
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['conflicto'])
+        self.assertContains(response, 'La calificación fue modificada mientras la editaba')
+        self.assertEqual(leer_factores(self.calificacion), otros)
+        self.assertEqual(Calificacion.objects.get(pk=self.calificacion.pk).version, nueva)
+        with self.assertRaises(ConflictoVersion):
+            guardar_factores(self.calificacion, mios, version=abierta)
+
+    def test_sin_version_o_con_una_invalida_es_un_conflicto(self):
+        mios = list(self.valores)
+        mios[2] = Decimal('0.7000')
+        self.client.force_login(self.corredor)
+        for version in ('', 'abc', '-1'):
+            datos = datos_factores(mios, version)
+            if not version:
+                del datos['version']
+            response = self.client.post(reverse('CalificacionFactoresEditar', args=[self.calificacion.pk]), datos)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.context['conflicto'])
+        self.assertEqual(leer_factores(self.calificacion), self.valores)
+        self.assertEqual(Calificacion.objects.get(pk=self.calificacion.pk).version, self.calificacion.version)
+
+    def test_guardar_sin_cambios_no_crea_version(self):
+        Calificacion.objects.filter(pk=self.calificacion.pk).update(hash_contenido='abc')
+        historial = VersionCalificacion.objects.count()
+        self.client.force_login(self.corredor)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(
+                reverse('CalificacionFactoresEditar', args=[self.calificacion.pk]),
+                datos_factores(self.valores, self.calificacion.version)
+            )
+
+        self.assertRedirects(response, reverse('PanelCorredor'), fetch_redirect_response=False)
+        self.assertEqual(
+            Calificacion.objects.values_list('version', 'hash_contenido').get(pk=self.calificacion.pk),
+            (self.calificacion.version, 'abc')
+        )
+        self.assertEqual(VersionCalificacion.objects.count(), historial)
+        self.assertEqual(callbacks, [])  # Ni auditoría ni invalidaciones
+        with override_settings(FACTORES_ALMACENAMIENTO='columnar'):
+            crear_factores_lote([(self.calificacion, self.valores)])
+            self.assertEqual(guardar_factores(self.calificacion, self.valores), self.calificacion.version)
+
+    def test_solo_se_escriben_los_factores_que_cambiaron(self):
+        valores = list(self.valores)
+        valores[0] = Decimal('0.1500')
+        valores[7] = Decimal('0.0001')
+        self.assertEqual(almacen('eav').guardar(self.calificacion.pk, valores), 2)
+        self.assertEqual(almacen('eav').guardar(self.calificacion.pk, valores), 0)
+
+        pks = dict(Factor.objects.filter(calificacion=self.calificacion).values_list('nombre', 'pk'))
+        with CaptureQueriesContext(connection) as consultas:
+            guardar_factores(self.calificacion, valores)
+        self.assertFalse([c for c in consultas if c['sql'].startswith('UPDATE "Prototipo_factor"')])
+        self.assertEqual(dict(Factor.objects.filter(calificacion=self.calificacion).values_list('nombre', 'pk')), pks)
+        self.assertEqual(leer_factores(self.calificacion), valores)
+
+
+# --- ALMACENAMIENTO COLUMNAR DE FACTORES (factores.py, migrar_factores) ---
+
+class AlmacenColumnarTest(PruebaNUAM):
+
+    def setUp(self):
+        super().setUp()
+        rnd = random.Random(3)
+        self.vectores = [
+            [Decimal(rnd.randint(-10 ** 8 + 1, 10 ** 8 - 1)).scaleb(-4) for _ in NOMBRES_FACTORES] for _ in range(3)
+        ]
+        # Los extremos de Factor.valor (8 dígitos, 4 decimales)
+        self.vectores[0][0] = Decimal('-0.0001')
+        self.vectores[0][-1] = Decimal('9999.9999')
+        with override_settings(FACTORES_ALMACENAMIENTO='eav'):
+            self.calificaciones = [
+                crear_calificacion(self.corredor, secuencia_evento=i, valores=valores)
+                for i, valores in enumerate(self.vectores, start=1)
+            ]
+        self.pks = [c.pk for c in self.calificaciones]
+
+    def _migrar(self, desde, hacia, *opciones):
+        call_command('migrar_factores', f'--desde={desde}', f'--hacia={hacia}', '--lote=2', *opciones, stdout=io.StringIO())
+
+    def test_ida_y_vuelta_del_vector_empaquetado(self):
+        columnar = almacen('columnar')
+        columnar.crear_lote(zip(self.pks, self.vectores))
+
+        datos = bytes(FactoresCalificacion.objects.get(pk=self.pks[0]).valores)
+        self.assertEqual(len(datos), 8 * len(NOMBRES_FACTORES))
+        self.assertEqual(datos, empaquetar(self.vectores[0]))
+        self.assertEqual(columnar.leer_lote(self.pks), dict(zip(self.pks, self.vectores)))
+
+        otros = list(reversed(self.vectores[1]))
+        columnar.guardar(self.pks[1], otros)
+        self.assertEqual(columnar.leer_lote([self.pks[1]])[self.pks[1]], otros)
+        # Sin fila, el vector vacío
+        columnar.eliminar_lote([self.pks[2]])
+        self.assertEqual(columnar.leer_lote([self.pks[2]])[self.pks[2]], vector_vacio())
+
+    def test_migrar_de_eav_a_columnar_y_de_vuelta(self):
+        self._migrar('eav', 'columnar', '--eliminar-origen')
+        self.assertFalse(Factor.objects.exists())
+        self.assertEqual(FactoresCalificacion.objects.count(), len(self.pks))
+        with override_settings(FACTORES_ALMACENAMIENTO='columnar'):
+            self.assertEqual(leer_factores_lote(self.pks), dict(zip(self.pks, self.vectores)))
+
+        # Se puede repetir sin duplicar
+        self._migrar('columnar', 'eav')
+        self._migrar('columnar', 'eav')
+        self.assertEqual(Factor.objects.count(), len(self.pks) * len(NOMBRES_FACTORES))
+        with override_settings(FACTORES_ALMACENAMIENTO='eav'):
+            self.assertEqual(leer_factores_lote(self.pks), dict(zip(self.pks, self.vectores)))
+
+        with self.assertRaises(CommandError):
+            self._migrar('eav', 'eav')
+
+
+# --- CARGA MASIVA IDEMPOTENTE (carga.py) ---
+
+class CargaMasivaTest(PruebaNUAM):
+    FILAS = 20
+
+    def setUp(self):
+        super().setUp()
+        self.contenido = sinteticos.archivo_carga_csv(self.FILAS, random.Random(15))
+
+    def _cargar(self, contenido, usuario=None):
+        usuario = usuario or self.corredor
+        archivo_carga = ArchivoCarga.objects.create(cargado_por=usuario, nombre='carga.csv')
+        return carga.procesar_archivo(archivo_carga, io.BytesIO(contenido), usuario)
+
+    def test_la_misma_carga_dos_veces_no_escribe_nada(self):
+        primera = self._cargar(self.contenido)
+        self.assertEqual(primera.filas_fallidas, 0)
+        self.assertEqual(primera.filas_insertadas, self.FILAS)
+        versiones_antes = dict(Calificacion.objects.values_list('pk', 'version'))
+        historial_antes = VersionCalificacion.objects.count()
+
+        segunda = self._cargar(self.contenido)
+
+        self.assertEqual(segunda.filas_sin_cambios, self.FILAS)
+        self.assertEqual((segunda.filas_insertadas, segunda.filas_actualizadas), (0, 0))
+        self.assertEqual(dict(Calificacion.objects.values_list('pk', 'version')), versiones_antes)
+        self.assertEqual(VersionCalificacion.objects.count(), historial_antes)
+
+    def test_una_fila_corregida_es_una_actualizacion_con_su_version(self):
+        self._cargar(self.contenido)
+        lineas = self.contenido.decode('utf-8').splitlines()
+        columnas = lineas[3].split(';')
+        columnas[5] = 'Dividendo corregido'
+        lineas[3] = ';'.join(columnas)
+
+        resultado = self._cargar('\r\n'.join(lineas).encode('utf-8'))
+
+        self.assertEqual(resultado.filas_actualizadas, 1)
+        self.assertEqual(resultado.filas_insertadas, 0)
+        self.assertEqual(resultado.filas_sin_cambios, self.FILAS - 1)
+        corregida = Calificacion.objects.get(descripcion='Dividendo corregido')
+        self.assertEqual(corregida.version, 1)
+        version = VersionCalificacion.objects.get(calificacion=corregida, version=1)
+        self.assertEqual(version.accion, 'Carga Masiva')
+        self.assertEqual(version.campos['descripcion'], 'Dividendo corregido')
+        self.assertEqual(VersionCalificacion.objects.filter(version__gt=0).count(), 1)
+
+    def test_la_misma_clave_de_otro_corredor_es_otra_calificacion(self):
+        self._cargar(self.contenido)
+        resultado = self._cargar(self.contenido, self.otro_corredor)
+
+        self.assertEqual(resultado.filas_insertadas, self.FILAS)
+        self.assertEqual(Calificacion.objects.count(), 2 * self.FILAS)
+        campos = Calificacion.CLAVE_NATURAL[1:]
+        self.assertEqual(
+            set(Calificacion.objects.filter(usuario_creador=self.corredor).values_list(*campos)),
+            set(Calificacion.objects.filter(usuario_creador=self.otro_corredor).values_list(*campos)),
+        )
+
+
+def libro_xls(filas, hoja='Hoja1'):
+    """
+    .xls mínimo sin xlwt: el flujo BIFF8 de un libro de una hoja con celdas
+    de texto (LABEL) y número (NUMBER). xlrd lo lee aunque no venga dentro de
+    un contenedor OLE.
+    """
+    def registro(tipo, datos):
+        return struct.pack('<HH', tipo, len(datos)) + datos
+
+    def bof(tipo):
+        return registro(0x0809, struct.pack('<HHHHII', 0x0600, tipo, 0, 1997, 0, 0x0600))
+
+    def texto(valor, largo='<H'):
+        return struct.pack(largo, len(valor)) + b'\x01' + valor.encode('utf-16-le')
+
+    celdas = b''
+    for fila, valores in enumerate(filas):
+        for columna, valor in enumerate(valores):
+            if isinstance(valor, (int, float)):
+                celdas += registro(0x0203, struct.pack('<HHHd', fila, columna, 0, valor))
+            else:
+                celdas += registro(0x0204, struct.pack('<HHH', fila, columna, 0) + texto(valor))
+    # BOUNDSHEET apunta al BOF de la hoja, que va después de los registros del libro
+    hoja_registro = struct.pack('<BB', 0, 0) + texto(hoja, '<B')
+    inicio_hoja = len(bof(0x0005)) + 4 + 4 + len(hoja_registro) + 4
+    return (
+        bof(0x0005) + registro(0x0085, struct.pack('<I', inicio_hoja) + hoja_registro) + registro(0x000A, b'')
+        + bof(0x0010) + celdas + registro(0x000A, b'')
+    )
+
+
+class LectoresExcelTest(SimpleTestCase):
+    """Un .xlsx o .xls con el contenido de un CSV de carga da las mismas filas validadas."""
+
+    FILAS = 8
+
+    def setUp(self):
+        self.contenido = sinteticos.archivo_carga_csv(self.FILAS, random.Random(14))
+        filas = list(csv.reader(io.StringIO(self.contenido.decode('utf-8')), delimiter=';'))
+        # Encabezado con otro formato y el alias NEMO -> NEMOTECNICO
+        encabezados = [' '.join(encabezado.split('_')).title() for encabezado in filas[0]]
+        encabezados[encabezados.index('Nemotecnico')] = 'nemo'
+        self.celdas = [encabezados] + [[self._celda(valor) for valor in fila] for fila in filas[1:]]
+
+    @staticmethod
+    def _celda(valor):
+        # Excel guarda los números como float y las fechas como fecha
+        if valor.replace('.', '', 1).isdigit():
+            return float(valor)
+        try:
+            return datetime.date.fromisoformat(valor)
+        except ValueError:
+            return valor
+
+    def _validadas(self, archivo, nombre):
+        return [(numero, carga.validar_fila(fila)) for numero, fila in carga.leer_filas(archivo, nombre)]
+
+    def assertMismasFilasQueElCsv(self, validadas):
+        esperadas = self._validadas(io.BytesIO(self.contenido), 'carga.csv')
+        self.assertEqual(len(esperadas), self.FILAS)
+        self.assertTrue(all(datos and not errores for _, (datos, errores) in esperadas))
+        self.assertEqual(validadas, esperadas)
+
+    @skipIf(carga.openpyxl is None, 'openpyxl no está instalado')
+    def test_xlsx(self):
+        libro = carga.openpyxl.Workbook()
+        hoja = libro.active
+        for fila in self.celdas:
+            hoja.append(fila)
+        # Filas vacías al final, como las que deja Excel tras borrar contenido
+        hoja.append([None] * len(self.celdas[0]))
+        hoja.append([''] * len(self.celdas[0]))
+        archivo = io.BytesIO()
+        libro.save(archivo)
+        archivo.seek(0)
+
+        self.assertMismasFilasQueElCsv(self._validadas(archivo, 'carga.xlsx'))
+
+    @skipIf(carga.xlrd is None, 'xlrd no está instalado')
+    def test_xls(self):
+        celdas = [[valor.isoformat() if isinstance(valor, datetime.date) else valor for valor in fila]
+                  for fila in self.celdas]
+        archivo = io.BytesIO(libro_xls(celdas + [[''] * len(celdas[0]), ['', ' ']]))
+
+        self.assertMismasFilasQueElCsv(self._validadas(archivo, 'CARGA.XLS'))
+
+    @skipIf(carga.openpyxl is None or carga.xlrd is None, 'faltan openpyxl o xlrd')
+    def test_archivos_que_no_son_libros_excel(self):
+        for nombre in ('carga.xlsx', 'carga.xls'):
+            with self.subTest(nombre=nombre), self.assertRaises(carga.ErrorFormatoArchivo):
+                list(carga.leer_filas(io.BytesIO(self.contenido), nombre))
+
+
+# --- MOTOR DE CÁLCULO DE FACTORES (calculo_factores.py) ---
+
+class CalculoFactoresTest(SimpleTestCase):
+    """Los dos motores dan, factor a factor, lo mismo que la referencia Decimal."""
+
+    FILAS = 2 * calculo_factores.MIN_FILAS_NUMPY
+
+    def _lote(self, filas, rnd):
+        lote = []
+        for _ in range(filas):
+            # Como en un archivo real: la mayoría de las columnas vacías
+            montos = [Decimal(0)] * len(NOMBRES_FACTORES)
+            for indice in rnd.sample(range(len(montos)), rnd.randint(1, 6)):
+                montos[indice] = Decimal(rnd.randint(1, 10 ** 10)).scaleb(-rnd.randint(0, 4))
+            lote.append(montos)
+        return lote
+
+    def assertIgualALaReferencia(self, lote, factores):
+        # Por texto: también deben coincidir los 4 decimales (Factor.valor)
+        self.assertEqual(
+            [[str(factor) for factor in fila] for fila in factores],
+            [[str(factor) for factor in calculo_factores.calcular_factores(montos)] for montos in lote],
+        )
+
+    def test_motor_python_igual_a_la_referencia(self):
+        lote = self._lote(self.FILAS, random.Random(12))
+        self.assertIgualALaReferencia(lote, calculo_factores.calcular_factores_lote(lote, motor='python'))
+
+    @skipIf(calculo_factores.np is None, 'NumPy no está instalado')
+    def test_motor_numpy_igual_a_la_referencia(self):
+        lote = self._lote(self.FILAS, random.Random(12))
+        self.assertIgualALaReferencia(lote, calculo_factores.calcular_factores_lote(lote, motor='numpy'))
+
+    def test_empates_ceros_y_negativos(self):
+        lote = [
+            # 1/20000 = 0.00005 y 19999/20000 = 0.99995: empates que suben
+            [Decimal(1), Decimal(19999)],
+            [Decimal('0.0003'), Decimal('1.9997')],
+            [Decimal(1), Decimal(31)],
+            [Decimal(0), Decimal(0)],
+        ]
+        motores = ['python'] + ([] if calculo_factores.np is None else ['numpy'])
+        for motor in motores:
+            with self.subTest(motor=motor):
+                factores = calculo_factores.calcular_factores_lote(lote, motor=motor, verificar=True)
+                self.assertIgualALaReferencia(lote, factores)
+                self.assertEqual(factores[0], [Decimal('0.0001'), Decimal('1.0000')])
+                self.assertEqual(factores[1], [Decimal('0.0002'), Decimal('0.9999')])
+                self.assertEqual([str(factor) for factor in factores[3]], ['0.0000', '0.0000'])
+
+        # Con montos negativos los factores salen de [0, 1] y el empate se aleja del cero
+        negativos = [[Decimal(-1), Decimal(20001)], [Decimal(2), Decimal(-1)]]
+        self.assertEqual(calculo_factores.elegir_motor(len(negativos), negativos=True, motor='python'), 'python')
+        if calculo_factores.np is not None:
+            self.assertEqual(calculo_factores.elegir_motor(len(negativos), negativos=True, motor='numpy'), 'python')
+        for motor in motores:
+            with self.subTest(motor=motor, negativos=True):
+                factores = calculo_factores.calcular_factores_lote(negativos, motor=motor, verificar=True)
+                self.assertIgualALaReferencia(negativos, factores)
+                self.assertEqual(factores[0], [Decimal('-0.0001'), Decimal('1.0001')])
+                self.assertEqual(factores[1], [Decimal('2.0000'), Decimal('-1.0000')])
+
+    def test_montos_con_mas_de_4_decimales_se_rechazan(self):
+        with self.assertRaises(ValueError):
+            calculo_factores.calcular_factores_lote([[Decimal('0.00001'), Decimal(1)]])
+
+    def test_verificar_detecta_diferencias_con_la_referencia(self):
+        lote = [[Decimal(1), Decimal(3)], [Decimal(1), Decimal(1)]]
+        calcular = calculo_factores._calcular_python
+
+        def erroneo(filas):
+            return [[factor + 1 for factor in fila] for fila in calcular(filas)]
+
+        with mock.patch.object(calculo_factores, '_calcular_python', erroneo):
+            # Sin verificar, el error pasa sin que nadie lo note
+            self.assertEqual(
+                calculo_factores.calcular_factores_lote(lote, motor='python', verificar=False)[0],
+                [Decimal('0.2501'), Decimal('0.7501')],
+            )
+            with self.assertRaises(calculo_factores.DiferenciaFactores) as contexto:
+                calculo_factores.calcular_factores_lote(lote, motor='python', verificar=True)
+            with override_settings(FACTORES_VERIFICAR=True), self.assertRaises(calculo_factores.DiferenciaFactores):
+                calculo_factores.calcular_factores_lote(lote, motor='python')
+
+        self.assertEqual(contexto.exception.diferencias, [
+            (0, 0, Decimal('0.2500'), Decimal('0.2501')), (0, 1, Decimal('0.7500'), Decimal('0.7501')),
+            (1, 0, Decimal('0.5000'), Decimal('0.5001')), (1, 1, Decimal('0.5000'), Decimal('0.5001')),
+        ])
+
+
+# --- RESUMEN MATERIALIZADO (resumen.py) ---
+
+class ResumenTest(PruebaNUAM):
+
+    def test_los_contadores_incrementales_coinciden_con_recalcular(self):
+        calificacion = crear_calificacion(self.corredor)
+        crear_calificacion(self.otro_corredor, secuencia_evento=2)
+        self.assertResumenIgualAlRecalculo()
+
+        calificacion.estado = 'Aprobada'
+        calificacion.mercado = 'RF'
+        calificacion.save()
+        self.assertResumenIgualAlRecalculo()
+
+        calificacion.delete()
+        self.assertResumenIgualAlRecalculo()
+
+        archivo_carga = ArchivoCarga.objects.create(cargado_por=self.corredor, nombre='carga.csv')
+        contenido = sinteticos.archivo_carga_csv(15, random.Random(16))
+        carga.procesar_archivo(archivo_carga, io.BytesIO(contenido), self.corredor)
+        self.assertResumenIgualAlRecalculo()
+
+        revisar_lote(self.auditor, 'Rechazada', {'archivo_carga': archivo_carga.pk})
+        self.assertResumenIgualAlRecalculo()
+        self.assertEqual(resumen.obtener_resumen()['total'], 16)
+
+
+# --- REVISIÓN POR LOTE (revision.py) ---
+
+class RevisionLoteTest(PruebaNUAM):
+
+    def setUp(self):
+        super().setUp()
+        self.calificaciones = [crear_calificacion(self.corredor, secuencia_evento=i) for i in range(1, 4)]
+        self.calificaciones.append(crear_calificacion(self.otro_corredor))
+        self.criterio = {'ids': [c.pk for c in self.calificaciones]}
+
+    def test_revisa_todo_el_criterio_y_el_resumen_coincide(self):
+        resultado = revisar_lote(self.auditor, 'Aprobada', self.criterio)
+
+        self.assertEqual(resultado, {'revisadas': 4, 'corredores': 2})
+        self.assertEqual(set(Calificacion.objects.values_list('estado', 'version')), {('Aprobada', 1)})
+        self.assertEqual(VersionCalificacion.objects.filter(version=1).count(), 4)
+        self.assertEqual(Notificacion.objects.count(), 2)
+        self.assertEqual(dict(resumen.obtener_resumen()['por_estado']), {'Aprobada': 4})
+        self.assertResumenIgualAlRecalculo()
+
+    def test_un_conjunto_modificado_revierte_todo(self):
+        actualizar = QuerySet.update
+
+        def con_otra_transaccion(queryset, **campos):
+            # Como si otra transacción hubiera agregado una pendiente entre el SELECT y el UPDATE
+            return actualizar(queryset, **campos) + 1
+
+        with mock.patch.object(QuerySet, 'update', con_otra_transaccion):
+            with self.assertRaises(ConjuntoModificado):
+                revisar_lote(self.auditor, 'Rechazada', self.criterio)
+
+        self.assertEqual(set(Calificacion.objects.values_list('estado', 'version')), {('Pendiente', 0)})
+        self.assertFalse(VersionCalificacion.objects.filter(version__gt=0).exists())
+        self.assertFalse(Notificacion.objects.exists())
+        self.assertEqual(dict(resumen.obtener_resumen()['por_estado']), {'Pendiente': 4})
+        self.assertResumenIgualAlRecalculo()
+
+    def test_limite_de_ids(self):
+        ids = ','.join(str(i) for i in range(1, MAX_IDS + 1))
+        self.assertEqual(len(criterio_desde(QueryDict(f'ids={ids}'))['ids']), MAX_IDS)
+        with self.assertRaises(CriterioInvalido):
+            criterio_desde(QueryDict(f'ids={ids},{MAX_IDS + 1}'))
+
+    def test_sin_criterio_no_revisa_nada(self):
+        with self.assertRaises(CriterioInvalido):
+            criterio_desde(QueryDict('ids=&mercado=+'))
+
+        self.client.force_login(self.auditor)
+        response = self.client.post(reverse('CalificacionesRevisarLote'), {'nuevo_estado': 'Aprobada'})
+        self.assertRedirects(response, reverse('PanelAuditor'), fetch_redirect_response=False)
+        self.assertFalse(Calificacion.objects.exclude(estado='Pendiente').exists())
+
+
+# --- NOTIFICACIONES (notificaciones.py) ---
+
+class NotificacionesTest(PruebaNUAM):
+
+    def test_un_evento_a_varios_usuarios_es_un_solo_insert(self):
+        avisos = [(self.corredor, 'Primera'), (self.otro_corredor, 'Segunda'), (self.corredor.pk, 'Tercera')]
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks(execute=True):
+            notificaciones.notificar(avisos, notificaciones.TIPO_REVISION)
+
+        self.assertEqual(len([c for c in consultas if c['sql'].startswith('INSERT')]), 1)
+        self.assertEqual(
+            sorted(Notificacion.objects.values_list('usuario_id', 'mensaje', 'tipo')),
+            sorted([
+                (self.corredor.pk, 'Primera', notificaciones.TIPO_REVISION),
+                (self.otro_corredor.pk, 'Segunda', notificaciones.TIPO_REVISION),
+                (self.corredor.pk, 'Tercera', notificaciones.TIPO_REVISION),
+            ])
+        )
+        self.assertEqual(notificaciones.notificar([], notificaciones.TIPO_REVISION), [])
+
+    def _cache_compartida(self):
+        """El contador en una caché de archivos, compartida entre procesos."""
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        compartida = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directorio}
+        ajustes = override_settings(
+            CACHES={**settings.CACHES, 'notificaciones': compartida}, NOTIFICACIONES_CACHE_ALIAS='notificaciones'
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_contador_de_no_leidas(self):
+        self._cache_compartida()
+        notificaciones.notificar([(self.corredor, 'Primera')], notificaciones.TIPO_CARGA)
+        self.assertEqual(notificaciones.no_leidas(self.corredor), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(notificaciones.no_leidas(self.corredor), 1)
+
+        # El incremento se aplica al confirmar, sin volver a contar
+        with self.captureOnCommitCallbacks(execute=True):
+            notificaciones.notificar(
+                [(self.corredor, 'Segunda'), (self.corredor, 'Tercera'), (self.otro_corredor, 'Otra')],
+                notificaciones.TIPO_CARGA
+            )
+        with self.assertNumQueries(0):
+            self.assertEqual(notificaciones.no_leidas(self.corredor), 3)
+        self.assertEqual(notificaciones.no_leidas(self.otro_corredor), 1)
+
+        # Marcar como leídas borra la entrada: la siguiente lectura vuelve a contar
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(notificaciones.marcar_todas_leidas(self.corredor), 3)
+        with self.assertNumQueries(1):
+            self.assertEqual(notificaciones.no_leidas(self.corredor), 0)
+        self.assertEqual(notificaciones.no_leidas(self.otro_corredor), 1)
+
+    def test_con_cache_local_al_proceso_se_cuenta_en_la_base(self):
+        self.assertIsInstance(caches[settings.NOTIFICACIONES_CACHE_ALIAS], LocMemCache)
+        with self.captureOnCommitCallbacks(execute=True):
+            notificaciones.notificar([(self.corredor, 'Primera')], notificaciones.TIPO_CARGA)
+        with self.assertNumQueries(1):
+            self.assertEqual(notificaciones.no_leidas(self.corredor), 1)
+        # Otro proceso notifica: no hay un contador de este proceso que quede atrasado
+        Notificacion.objects.create(usuario=self.corredor, tipo=notificaciones.TIPO_CARGA, mensaje='Segunda')
+        with self.assertNumQueries(1):
+            self.assertEqual(notificaciones.no_leidas(self.corredor), 2)
+        with self.captureOnCommitCallbacks(execute=True) as hooks:
+            self.assertEqual(notificaciones.marcar_todas_leidas(self.corredor), 2)
+        self.assertEqual(hooks, [])
+        self.assertEqual(notificaciones.no_leidas(self.corredor), 0)
+
+
+# --- CADENA DE HASHES DEL REGISTRO DE AUDITORÍA (cadena_logs.py) ---
+
+class CadenaLogsTest(PruebaNUAM):
+
+    def setUp(self):
+        super().setUp()
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        ajustes = override_settings(LOGS_ARCHIVO_DIR=directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.fecha = datetime.datetime(2025, 5, 10, 12, tzinfo=datetime.timezone.utc)
+        self.logs = cadena_logs.insertar([self._log(i) for i in range(6)])
+        self.mes = cadena_logs.etiqueta_mes(self.fecha)
+
+    def _log(self, i):
+        return Log(usuario=self.corredor, accion='Prueba', detalle_cambio=f'Entrada {i}',
+                   fecha_hora=self.fecha + datetime.timedelta(minutes=i))
+
+    def _verificar(self, **opciones):
+        salida = {'stdout': io.StringIO(), 'stderr': io.StringIO()}
+        call_command('verificar_logs', procesos=1, **opciones, **salida)
+        return salida['stdout'].getvalue()
+
+    def _verificar_rota(self, id_log, motivo, **opciones):
+        stderr = io.StringIO()
+        with self.assertRaisesMessage(CommandError, f'Cadena rota: mes {self.mes}, entrada {id_log}'):
+            call_command('verificar_logs', procesos=1, stdout=io.StringIO(), stderr=stderr, **opciones)
+        self.assertIn(motivo, stderr.getvalue())
+
+    def test_cadena_integra(self):
+        self.assertIn('La cadena de logs está íntegra.', self._verificar())
+
+    def test_una_entrada_editada_rompe_la_cadena(self):
+        Log.objects.filter(pk=self.logs[2].pk).update(detalle_cambio='Entrada alterada')
+        self._verificar_rota(self.logs[2].pk, 'el hash no corresponde')
+
+    def test_una_entrada_borrada_rompe_la_cadena(self):
+        Log.objects.filter(pk=self.logs[2].pk).delete()
+        self._verificar_rota(self.logs[3].pk, 'el hash no corresponde')
+
+    def test_la_ultima_entrada_borrada_rompe_el_final(self):
+        # No rompe ningún enlace: lo detecta el final de la cadena (CadenaLog)
+        Log.objects.filter(pk=self.logs[-1].pk).delete()
+        self._verificar_rota(self.logs[-1].pk, 'falta la última entrada de la cadena')
+
+    def test_una_cadena_rehecha_no_coincide_con_los_puntos_de_control(self):
+        self._verificar(intervalo=2)
+        self.assertEqual(PuntoControlLog.objects.filter(mes=self.mes).count(), 3)
+
+        Log.objects.filter(pk=self.logs[1].pk).update(detalle_cambio='Entrada alterada')
+        # Todos los enlaces y el final vuelven a calzar: solo los puntos de control lo delatan
+        cadena_logs.sellar(meses=[self.mes])
+        self._verificar_rota(self.logs[1].pk, 'no coincide con el punto de control')
+
+    def test_reintenta_si_otro_proceso_avanza_la_cadena(self):
+        avanzar = cadena_logs._avanzar
+        intentos = []
+
+        def ocupada_la_primera_vez(por_mes, finales):
+            intentos.append([log.pk for grupo in por_mes.values() for log in grupo])
+            if len(intentos) == 1:
+                # Otro proceso avanzó el final entre la lectura y el UPDATE
+                raise cadena_logs.CadenaOcupada(self.mes)
+            avanzar(por_mes, finales)
+
+        with mock.patch.object(cadena_logs, '_avanzar', ocupada_la_primera_vez):
+            nuevos = cadena_logs.insertar([self._log(20), self._log(21)])
+
+        self.assertEqual(len(intentos), 2)
+        self.assertEqual(intentos[1], [log.pk for log in nuevos])
+        # El primer bulk_create se revirtió completo
+        self.assertEqual(Log.objects.count(), len(self.logs) + 2)
+        self.assertIn('La cadena de logs está íntegra.', self._verificar())
+
+    def test_sin_lograr_avanzar_no_graba_nada(self):
+        with mock.patch.object(cadena_logs, '_avanzar', side_effect=cadena_logs.CadenaOcupada(self.mes)) as avanzar:
+            with self.assertRaises(cadena_logs.CadenaOcupada):
+                cadena_logs.insertar([self._log(20)])
+        self.assertEqual(avanzar.call_count, cadena_logs.INTENTOS)
+        self.assertEqual(Log.objects.count(), len(self.logs))
+
+    def test_sin_fork_verifica_en_un_solo_proceso(self):
+        stderr = io.StringIO()
+        with mock.patch('Prototipo.management.commands.verificar_logs.contexto_fork', return_value=None):
+            call_command('verificar_logs', procesos=4, tamano_tramo=2, stdout=io.StringIO(), stderr=stderr)
+        self.assertIn('no permite fork', stderr.getvalue())
+
+
+# --- RETENCIÓN Y ARCHIVO DEL REGISTRO DE AUDITORÍA (retencion_logs.py) ---
+
+class RetencionLogsTest(PruebaNUAM):
+    AHORA = datetime.datetime(2025, 5, 20, 12, tzinfo=datetime.timezone.utc)
+
+    def setUp(self):
+        super().setUp()
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        ajustes = override_settings(LOGS_ARCHIVO_DIR=pathlib.Path(self.directorio))
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        # Marzo se archiva con un mes de retención; abril y mayo quedan en la base
+        fechas = [datetime.datetime(2025, mes, dia, 9, tzinfo=datetime.timezone.utc)
+                  for mes, dia in ((3, 2), (3, 15), (3, 31), (4, 1), (4, 20), (5, 5))]
+        self.logs = cadena_logs.insertar([
+            Log(usuario=usuario, accion='Prueba', detalle_cambio=f'Entrada {i}', fecha_hora=fecha)
+            for i, (usuario, fecha) in enumerate(zip([self.corredor, self.auditor, None] * 2, fechas))
+        ])
+        self.marzo = self.logs[:3]
+
+    def _esperadas(self, logs):
+        return [
+            (log.pk, log.fecha_hora, log.accion, log.usuario_id, log.usuario and log.usuario.email, log.detalle_cambio)
+            for log in sorted(logs, key=lambda log: (log.fecha_hora, log.pk), reverse=True)
+        ]
+
+    def _archivar(self):
+        return retencion_logs.archivar(meses=1, ahora=self.AHORA)
+
+    def test_archiva_el_mes_y_lo_consulta_junto_a_la_base(self):
+        call_command('verificar_logs', procesos=1, intervalo=1, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertTrue(PuntoControlLog.objects.filter(mes='2025-03').exists())
+
+        partes = self._archivar()
+
+        self.assertEqual(len(partes), 1)
+        parte = partes[0]
+        self.assertEqual(
+            (parte['archivo'], parte['mes'], parte['filas'], parte['id_min'], parte['id_max'], parte['hash_id_max']),
+            ('logs-2025-03.1.jsonl.gz', '2025-03', 3, self.marzo[0].pk, self.marzo[-1].pk, self.marzo[-1].hash_cadena)
+        )
+        self.assertEqual(retencion_logs.leer_manifiesto()['partes'], partes)
+        self.assertEqual(retencion_logs.verificar_archivo(), [])
+        # Sale de la base con sus puntos de control; abril y mayo quedan
+        self.assertEqual(set(Log.objects.values_list('pk', flat=True)), {log.pk for log in self.logs[3:]})
+        self.assertFalse(PuntoControlLog.objects.filter(mes='2025-03').exists())
+        self.assertTrue(PuntoControlLog.objects.filter(mes='2025-04').exists())
+
+        # Base y archivo como una sola secuencia, también por rango de fechas
+        self.assertEqual(list(retencion_logs.consultar_logs(tamano_bloque=2)), self._esperadas(self.logs))
+        desde = datetime.datetime(2025, 3, 10, tzinfo=datetime.timezone.utc)
+        hasta = datetime.datetime(2025, 4, 10, tzinfo=datetime.timezone.utc)
+        self.assertEqual(list(retencion_logs.consultar_logs(desde, hasta)), self._esperadas(self.logs[1:4]))
+
+        # Una segunda ejecución no tiene nada que archivar
+        self.assertEqual(self._archivar(), [])
+        self.assertEqual(len(retencion_logs.leer_manifiesto()['partes']), 1)
+
+    def test_verificar_archivo_detecta_partes_alteradas_o_faltantes(self):
+        parte, = self._archivar()
+        ruta = pathlib.Path(self.directorio) / parte['archivo']
+        with gzip.open(ruta, 'ab') as archivo:
+            archivo.write(b'[]\n')
+        self.assertEqual(retencion_logs.verificar_archivo(), [(parte, 'el sha256 no coincide con el manifiesto')])
+        ruta.unlink()
+        self.assertEqual(retencion_logs.verificar_archivo(), [(parte, 'falta el archivo')])
+
+    def test_un_archivado_interrumpido_se_termina_en_la_siguiente_ejecucion(self):
+        with mock.patch.object(retencion_logs, '_sacar_de_la_base', side_effect=OperationalError):
+            with self.assertRaises(OperationalError):
+                self._archivar()
+        # Quedó en el manifiesto y en la base: la consulta lo entrega una sola vez
+        self.assertEqual(len(retencion_logs.leer_manifiesto()['partes']), 1)
+        self.assertEqual(Log.objects.count(), len(self.logs))
+        self.assertEqual(list(retencion_logs.consultar_logs()), self._esperadas(self.logs))
+
+        self.assertEqual(self._archivar(), [])
+
+        self.assertEqual(Log.objects.count(), len(self.logs) - len(self.marzo))
+        self.assertEqual(len(retencion_logs.leer_manifiesto()['partes']), 1)
+        self.assertEqual(list(retencion_logs.consultar_logs()), self._esperadas(self.logs))
+
+
+# --- HISTORIAL DE VERSIONES (versiones.py) ---
+
+class VersionesTest(PruebaNUAM):
+    VERSIONES = versiones.INTERVALO_BASE + 5
+
+    def setUp(self):
+        super().setUp()
+        rnd = random.Random(23)
+        self.calificacion = crear_calificacion(self.corredor, descripcion='v0')
+        self.estados = {0: ('v0', vector_vacio())}
+        anteriores = vector_vacio()
+        for version in range(1, self.VERSIONES + 1):
+            vector = list(anteriores)
+            vector[rnd.randrange(len(vector))] = Decimal(rnd.randint(0, 10 ** 8)).scaleb(-4)
+            descripcion = f'v{version}' if version % 3 else self.estados[version - 1][0]
+            campos = {'descripcion': descripcion} if version % 3 else {}
+            Calificacion.objects.filter(pk=self.calificacion.pk).update(descripcion=descripcion, version=version)
+            versiones.registrar([versiones.Cambio(self.calificacion.pk, version, campos, vector, anteriores)], self.corredor)
+            self.estados[version] = (descripcion, vector)
+            anteriores = vector
+
+    def assertVersion(self, version):
+        estado = versiones.estado_version(self.calificacion, version)
+        self.assertEqual((estado['campos']['descripcion'], estado['factores']), self.estados[version])
+
+    def test_reconstruye_versiones_a_ambos_lados_de_una_base(self):
+        bases = list(VersionCalificacion.objects.filter(calificacion=self.calificacion, base=True).values_list('version', flat=True))
+        self.assertEqual(bases, [0, versiones.INTERVALO_BASE])
+        for version in range(self.VERSIONES + 1):
+            self.assertVersion(version)
+
+        # Una sola lectura, desde la última base: no se recorre el historial completo
+        with self.assertNumQueries(1):
+            versiones.estado_version(self.calificacion, self.VERSIONES)
+        diferencia = versiones.diferencias(self.calificacion, versiones.INTERVALO_BASE - 2, versiones.INTERVALO_BASE + 2)
+        self.assertEqual(diferencia['antes']['factores'], self.estados[versiones.INTERVALO_BASE - 2][1])
+        self.assertEqual(diferencia['despues']['factores'], self.estados[versiones.INTERVALO_BASE + 2][1])
+
+    def test_un_hueco_en_el_historial(self):
+        VersionCalificacion.objects.filter(calificacion=self.calificacion, version=5).delete()
+
+        self.assertVersion(4)
+        for version in (5, 6, versiones.INTERVALO_BASE - 1):
+            with self.assertRaises(versiones.VersionNoDisponible) as error:
+                versiones.estado_version(self.calificacion, version)
+            self.assertEqual(error.exception.version, version)
+        # Desde la base siguiente se vuelve a poder
+        self.assertVersion(versiones.INTERVALO_BASE)
+        self.assertVersion(self.VERSIONES)
+
+    def test_empaquetar_y_aplicar_delta(self):
+        rnd = random.Random(230)
+        anteriores = [Decimal(rnd.randint(0, 10 ** 8)).scaleb(-4) for _ in NOMBRES_FACTORES]
+        nuevos = list(anteriores)
+        for i in (0, 7, len(nuevos) - 1):
+            nuevos[i] += Decimal('0.0001')
+
+        datos = versiones.empaquetar_delta(nuevos, anteriores)
+        self.assertEqual(len(datos), 4 + 3 * 8)
+        self.assertEqual(versiones.factores_cambiados(datos), 3)
+        self.assertEqual(versiones.aplicar_delta(list(anteriores), datos), nuevos)
+
+        completo = versiones.empaquetar_delta(nuevos)
+        self.assertEqual(versiones.factores_cambiados(completo), len(NOMBRES_FACTORES))
+        self.assertEqual(versiones.aplicar_delta(vector_vacio(), completo), nuevos)
+        self.assertEqual(versiones.empaquetar_delta(nuevos, nuevos), versiones.SIN_CAMBIOS)
+        self.assertEqual(versiones.aplicar_delta(list(nuevos), versiones.SIN_CAMBIOS), nuevos)
+
+
+# --- SERIALIZACIÓN POR VOLUMEN (serializacion.py) ---
+
+class SerializacionTest(PruebaNUAM):
+
+    def test_json_de_tuplas_igual_al_de_django(self):
+        crear_calificacion(self.corredor, descripcion='Con "comillas" y ñ')
+        campos = ('id', 'instrumento', 'fecha_pago', 'valor_historico', 'usuario_creador', 'archivo_carga', 'fecha_creacion')
+        formatear = compilar_objeto(campos, formateadores_json(Calificacion, campos))
+        texto = arreglo_json(Calificacion.objects.values_list(*campos), formatear)
+        esperado = json.loads(json.dumps(list(Calificacion.objects.values(*campos)), cls=DjangoJSONEncoder))
+        self.assertEqual(json.loads(texto), esperado)
+
+
+# --- API DE CALIFICACIONES (api.py) ---
+
+class ApiCalificacionesTest(PruebaNUAM):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.propias = [crear_calificacion(cls.corredor, secuencia_evento=i) for i in range(1, 4)]
+        cls.ajenas = [crear_calificacion(cls.otro_corredor, secuencia_evento=i) for i in range(1, 3)]
+
+    def _get(self, usuario=None, cabeceras=None, **parametros):
+        self.client.force_login(usuario or self.auditor)
+        return self.client.get(reverse('ApiCalificaciones'), parametros, headers=cabeceras)
+
+    def test_etag_y_304(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self._get(cabeceras={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        # Toda escritura incrementa la versión: el ETag anterior deja de valer
+        Calificacion.objects.filter(pk=self.propias[0].pk).update(version=5)
+        response = self._get(cabeceras={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_propio_de_la_respuesta_comprimida(self):
+        plana = self._get()
+        comprimida = self._get(cabeceras={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(comprimida['Content-Encoding'], 'gzip')
+        self.assertEqual(comprimida['ETag'], plana['ETag'][:-1] + '-gz"')
+        self.assertEqual(json.loads(gzip.decompress(comprimida.content)), plana.json())
+        self.assertIn('Accept-Encoding', comprimida['Vary'])
+        # If-None-Match vale para la página en cualquiera de sus codificaciones
+        response = self._get(cabeceras={'If-None-Match': comprimida['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], plana['ETag'])
+
+    def test_el_corredor_solo_ve_las_suyas(self):
+        ids = [fila['id'] for fila in self._get(self.corredor).json()['resultados']]
+        self.assertEqual(ids, [c.pk for c in self.propias])
+        ids = [fila['id'] for fila in self._get(self.auditor).json()['resultados']]
+        self.assertEqual(ids, [c.pk for c in self.propias + self.ajenas])
+        # La misma página pedida por otro alcance tiene otro ETag
+        self.assertNotEqual(self._get(self.corredor)['ETag'], self._get(self.otro_corredor)['ETag'])
+
+    def test_seleccion_de_campos(self):
+        resultados = self._get(campos='factores,instrumento', mercado='AC').json()['resultados']
+        self.assertEqual(list(resultados[0]), ['instrumento', api.FACTORES])
+        self.assertEqual(list(resultados[0][api.FACTORES]), list(NOMBRES_FACTORES))
+
+        self.assertNotIn(api.FACTORES, self._get(campos='id,estado').json()['resultados'][0])
+        self.assertEqual(self._get(campos='id,clave').status_code, 400)
+
+    def test_cursor(self):
+        primera = self._get(tamano=2).json()
+        self.assertEqual([fila['id'] for fila in primera['resultados']], [c.pk for c in self.propias[:2]])
+        segunda = self.client.get(primera['siguiente']).json()
+        self.assertEqual([fila['id'] for fila in segunda['resultados']], [self.propias[2].pk, self.ajenas[0].pk])
+
+    def test_un_cursor_invalido_es_un_error(self):
+        for cursor in ('no-es-un-cursor', codificar_cursor(['texto']), codificar_cursor([1, 2])):
+            response = self._get(cursor=cursor)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'El cursor no es válido.'})
+
+
+# --- COLA DE CARGAS EN SEGUNDO PLANO (tareas.py) ---
+
+class TareasTest(PruebaNUAM):
+
+    def setUp(self):
+        super().setUp()
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        # Dentro del TestCase no hay conexiones viejas que cerrar: cerrarla abortaría la transacción de la prueba
+        parche = mock.patch.object(tareas, 'close_old_connections')
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def _encolar(self, contenido, nombre='carga.csv'):
+        archivo_carga = ArchivoCarga(cargado_por=self.corredor, nombre=nombre)
+        archivo_carga.archivo.save(nombre, ContentFile(contenido))
+        return archivo_carga
+
+    def test_procesa_la_cola_y_deja_el_resultado(self):
+        contenido = sinteticos.archivo_carga_csv(12, random.Random(2))
+        primera = self._encolar(contenido)
+        segunda = self._encolar(contenido.replace(b'\r\n', b'\r\nX;;;;;\r\n', 1), 'con_error.csv')
+        estados, avances = [], []
+        ejecutar = tareas.ejecutar_carga
+
+        def ejecutar_y_anotar(pk):
+            estados.append(ArchivoCarga.objects.get(pk=pk).estado)
+            ejecutar(pk)
+
+        def por_lotes_de_cinco(archivo_carga, archivo, usuario, al_avanzar):
+            # El avance que publica ejecutar_carga, leído de la base tras cada lote
+            def anotar(resultado):
+                al_avanzar(resultado)
+                avances.append(ArchivoCarga.objects.values_list('filas_procesadas', flat=True).get(pk=archivo_carga.pk))
+            return carga.procesar_archivo(archivo_carga, archivo, usuario, tamano_lote=5, al_avanzar=anotar)
+
+        with mock.patch.object(tareas, 'ejecutar_carga', ejecutar_y_anotar), \
+                mock.patch.object(tareas, 'procesar_archivo', por_lotes_de_cinco):
+            self.assertEqual(tareas.trabajar_cola(continuo=False), 2)
+        self.assertEqual(estados, [tareas.ESTADO_PROCESANDO] * 2)
+        self.assertEqual(avances, [5, 10, 12] * 2)
+
+        primera.refresh_from_db()
+        self.assertEqual(primera.estado, 'Procesado')
+        self.assertEqual((primera.filas_procesadas, primera.filas_insertadas, primera.filas_fallidas), (12, 12, 0))
+        self.assertIsNotNone(primera.fecha_inicio)
+        self.assertIsNotNone(primera.fecha_fin)
+
+        segunda.refresh_from_db()
+        self.assertEqual(segunda.estado, 'Con Errores')
+        self.assertEqual((segunda.filas_fallidas, segunda.filas_sin_cambios), (1, 12))
+        self.assertEqual(segunda.errores[0]['fila'], 2)
+
+        self.assertEqual(Notificacion.objects.filter(usuario=self.corredor, tipo=notificaciones.TIPO_CARGA).count(), 2)
+        self.assertEqual(tareas.trabajar_cola(continuo=False), 0)
+
+    def test_un_archivo_sin_formato_queda_fallido(self):
+        archivo_carga = self._encolar(b'ESTO;NO;ES;UNA;CARGA\r\n1;2;3;4;5\r\n')
+        self.assertEqual(tareas.trabajar_cola(continuo=False), 1)
+
+        archivo_carga.refresh_from_db()
+        self.assertEqual(archivo_carga.estado, tareas.ESTADO_FALLIDO)
+        self.assertIn('Columnas faltantes', archivo_carga.errores[0]['mensaje'])
+        self.assertFalse(Calificacion.objects.exists())
+
+    def test_una_carga_se_reclama_una_sola_vez(self):
+        archivo_carga = self._encolar(sinteticos.archivo_carga_csv(1, random.Random(3)))
+        self.assertEqual(tareas.reclamar_siguiente(), archivo_carga.pk)
+        self.assertFalse(tareas.reclamar(archivo_carga.pk))
+        self.assertIsNone(tareas.reclamar_siguiente())
+
+    def test_reencola_las_huerfanas(self):
+        ahora = timezone.now()
+        huerfana = self._encolar(b'')
+        reciente = self._encolar(b'')
+        ArchivoCarga.objects.filter(pk=huerfana.pk).update(
+            estado=tareas.ESTADO_PROCESANDO, fecha_inicio=ahora - datetime.timedelta(minutes=45)
+        )
+        ArchivoCarga.objects.filter(pk=reciente.pk).update(
+            estado=tareas.ESTADO_PROCESANDO, fecha_inicio=ahora - datetime.timedelta(minutes=5)
+        )
+
+        self.assertEqual(tareas.reencolar_huerfanas(30), 1)
+        self.assertEqual(ArchivoCarga.objects.get(pk=huerfana.pk).estado, tareas.ESTADO_PENDIENTE)
+        self.assertEqual(ArchivoCarga.objects.get(pk=reciente.pk).estado, tareas.ESTADO_PROCESANDO)
@@ -3,13 +3,18 @@ from .views import( home, inicioSesion, cargaArchivo, bienvenida, clasificacione
     panel_administrador,panel_auditor,panel_corredor,
     usuario_crear,usuario_editar, usuario_eliminar, visualizarTributaria, modificarClasificaciones,
     calificacion_crear, calificacion_factores_editar,
-    calificacion_revisar, panel_reportes, generar_reporte_calificaciones_csv, generar_reporte_logs_csv, reportes, formato_archivo)
+    calificacion_revisar, calificaciones_revisar_lote, panel_reportes, generar_reporte_calificaciones_csv, generar_reporte_logs_csv, reportes, formato_archivo,
+    carga_archivo_procesar, carga_archivo_validar, carga_archivo_estado, metricas,
+    notificaciones, notificaciones_marcar_leidas, api_calificaciones)
 
 
 urlpatterns = [
     path('Clasificacion/', home, name='Clasificacion'),
     path('InicioSesion/', inicioSesion, name='InicioSesion'),
     path('CargaArchivo/', cargaArchivo, name='CargaArchivo'),
+    path('CargaArchivo/procesar/', carga_archivo_procesar, name='CargaArchivoProcesar'),
+    path('CargaArchivo/validar/', carga_archivo_validar, name='CargaArchivoValidar'),
+    path('CargaArchivo/estado/<int:pk>/', carga_archivo_estado, name='CargaArchivoEstado'),
     path('Bienvenida/', bienvenida, name='Bienvenida'),
     path('ClasificacionesTributarias/', clasificacionesTributarias, name='ClasificacionesTributarias'),
     path('Reportes/', reportes, name='Reportes'),
@@ -36,10 +41,21 @@ urlpatterns = [
     
     #Auditor
     path('PanelAuditor/revisar/<int:pk>/', calificacion_revisar, name='CalificacionRevisar'),
+    path('PanelAuditor/revisar/lote/', calificaciones_revisar_lote, name='CalificacionesRevisarLote'),
     path('PanelAuditor/Reportes/', panel_reportes, name='PanelReportes'),
     path('PanelAuditor/Reportes/CalificacionesCSV/', generar_reporte_calificaciones_csv, name='ReporteCalificacionesCSV'),
     path('PanelAuditor/Reportes/LogsCSV/', generar_reporte_logs_csv, name='ReporteLogsCSV'),
     
+    # Notificaciones (ver notificaciones.py)
+    path('Notificaciones/', notificaciones, name='Notificaciones'),
+    path('Notificaciones/leidas/', notificaciones_marcar_leidas, name='NotificacionesMarcarLeidas'),
+
+    # API JSON de lectura (ver api.py)
+    path('api/calificaciones/', api_calificaciones, name='ApiCalificaciones'),
+
+    # Métricas de consultas por vista (ver instrumentacion.py)
+    path('PanelAdministrador/Metricas/', metricas, name='Metricas'),
+
     # Formato de Archivo
     path('FormatoArchivo/', formato_archivo, name='FormatoArchivo'),
 ]
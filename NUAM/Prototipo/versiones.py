@@ -0,0 +1,248 @@
+"""
+Historial de versiones de las calificaciones (VersionCalificacion).
+
+Cada cambio de una Calificacion (creación, edición de factores, revisión,
+carga masiva) incrementa Calificacion.version y se registra aquí con
+`registrar`, en la misma transacción que lo graba:
+
+- Una versión guarda solo lo que cambió respecto de la anterior: los campos
+  de CAMPOS con su valor nuevo y, de los factores, una máscara de 32 bits
+  (un bit por factor de NOMBRES_FACTORES) seguida de los valores cambiados,
+  en punto fijo como en factores.py. Un cambio de estado ocupa 4 bytes de
+  factores; editar un factor, 12.
+- Cada INTERVALO_BASE versiones, y cuando falta la versión anterior (la
+  calificación es anterior al historial), se guarda una base con el estado
+  completo. Reconstruir cualquier versión lee en una sola consulta la última
+  base y las versiones que siguen: a lo más INTERVALO_BASE filas, sin
+  importar el largo del historial.
+- La versión vigente no se reconstruye: es la fila de Calificacion y su
+  vector de factores (`estado_actual`).
+- `diferencias` compara dos versiones, o una con la vigente; la usa la
+  pantalla de revisión del auditor.
+"""
+import struct
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db.models import Max
+
+from .factores import DECIMALES, comparar_factores, empaquetar, leer_factores_lote, vector_vacio
+from .models import Calificacion, VersionCalificacion
+from .utils import NOMBRES_FACTORES
+
+INTERVALO_BASE = 16
+TAMANO_LOTE = 2000
+# Campos de Calificacion que cambian después de creada (la clave natural no cambia)
+CAMPOS = ('estado', 'descripcion', 'valor_historico', 'evento_capital', 'origen', 'archivo_carga')
+_MASCARA = struct.Struct('<I')
+# Un bit por factor: con más de 32 factores hay que ampliar la máscara (y migrar el historial)
+assert len(NOMBRES_FACTORES) <= _MASCARA.size * 8, 'La máscara de factores es de 32 bits.'
+SIN_CAMBIOS = _MASCARA.pack(0)
+_COMPLETO = _MASCARA.pack((1 << len(NOMBRES_FACTORES)) - 1)
+
+# `campos`: valores nuevos de los campos que cambiaron. `factores`: vector nuevo, o None si
+# no cambió; `anteriores`: el vector previo, si se conoce (sin él se guarda el vector completo)
+Cambio = namedtuple('Cambio', 'calificacion_id version campos factores anteriores', defaults=(None, None, None))
+
+
+class VersionNoDisponible(LookupError):
+    """La versión pedida es anterior al historial de la calificación."""
+
+    def __init__(self, calificacion_id, version):
+        super().__init__(f'La versión {version} de la calificación {calificacion_id} no está en el historial.')
+        self.calificacion_id = calificacion_id
+        self.version = version
+
+
+def _pk(calificacion):
+    return getattr(calificacion, 'pk', calificacion)
+
+
+# --- EMPAQUETADO ---
+
+def empaquetar_delta(nuevos, anteriores=None):
+    """Factores de `nuevos` distintos de `anteriores` -> máscara + valores. Sin `anteriores`, todos."""
+    if anteriores is None:
+        return _COMPLETO + empaquetar(nuevos)
+    mascara, enteros = 0, []
+    for i, valor in enumerate(nuevos):
+        if valor != anteriores[i]:
+            mascara |= 1 << i
+            enteros.append(int(Decimal(valor).scaleb(DECIMALES).to_integral_value()))
+    return _MASCARA.pack(mascara) + struct.pack(f'<{len(enteros)}q', *enteros)
+
+
+def aplicar_delta(vector, datos):
+    """Escribe en `vector` los factores empaquetados en `datos`. Retorna el mismo vector."""
+    datos = bytes(datos)
+    mascara, = _MASCARA.unpack_from(datos)
+    enteros = iter(struct.unpack_from(f'<{mascara.bit_count()}q', datos, _MASCARA.size))
+    for i in range(len(NOMBRES_FACTORES)):
+        if mascara >> i & 1:
+            vector[i] = Decimal(next(enteros)).scaleb(-DECIMALES)
+    return vector
+
+
+def factores_cambiados(datos):
+    return _MASCARA.unpack_from(bytes(datos))[0].bit_count()
+
+
+def campos_de(calificacion):
+    """Valores de CAMPOS de una instancia (las claves foráneas, como pk)."""
+    return {nombre: Calificacion._meta.get_field(nombre).value_from_object(calificacion) for nombre in CAMPOS}
+
+
+def _leer_campos(campos):
+    # El JSON guarda los Decimal como texto
+    return {nombre: Calificacion._meta.get_field(nombre).to_python(valor) for nombre, valor in campos.items()}
+
+
+# --- ESCRITURA ---
+
+def registrar(cambios, usuario=None, accion=''):
+    """
+    Registra un Cambio por calificación, ya grabado en Calificacion y en los
+    factores. Se llama dentro de la transacción que hizo los cambios. Las
+    bases que hagan falta toman de la base de datos lo que el Cambio no trae.
+    """
+    cambios = list(cambios)
+    creadas = []
+    for inicio in range(0, len(cambios), TAMANO_LOTE):
+        creadas += VersionCalificacion.objects.bulk_create(_versiones(cambios[inicio:inicio + TAMANO_LOTE], usuario, accion))
+    return creadas
+
+
+def _versiones(lote, usuario, accion):
+    ultimas = dict(
+        VersionCalificacion.objects.filter(calificacion_id__in=[c.calificacion_id for c in lote])
+        .values('calificacion_id').annotate(ultima=Max('version')).values_list('calificacion_id', 'ultima')
+    )
+    bases = [
+        c for c in lote
+        if c.version % INTERVALO_BASE == 0 or ultimas.get(c.calificacion_id) != c.version - 1
+    ]
+    # Estado completo de las bases: lo que ya está grabado incluye el cambio
+    sin_campos = [c.calificacion_id for c in bases if not set(CAMPOS) <= set(c.campos or ())]
+    campos = {
+        pk: dict(zip(CAMPOS, valores))
+        for pk, *valores in Calificacion.objects.filter(pk__in=sin_campos).values_list('pk', *CAMPOS)
+    } if sin_campos else {}
+    sin_factores = [c.calificacion_id for c in bases if c.factores is None]
+    vectores = leer_factores_lote(sin_factores) if sin_factores else {}
+
+    es_base = {c.calificacion_id for c in bases}
+    versiones = []
+    for cambio in lote:
+        pk = cambio.calificacion_id
+        if pk in es_base:
+            estado = {**campos.get(pk, {}), **(cambio.campos or {})}
+            factores = empaquetar_delta(vectores[pk] if cambio.factores is None else cambio.factores)
+        else:
+            estado = dict(cambio.campos or {})
+            factores = SIN_CAMBIOS if cambio.factores is None else empaquetar_delta(cambio.factores, cambio.anteriores)
+        versiones.append(VersionCalificacion(
+            calificacion_id=pk, version=cambio.version, base=pk in es_base,
+            campos=estado, factores=factores, usuario=usuario, accion=accion[:50],
+        ))
+    return versiones
+
+
+# --- LECTURA ---
+
+def _filas(pk, desde, hasta):
+    """Versiones de `pk` desde la última base <= `desde` hasta `hasta`, en orden (una consulta)."""
+    base = (
+        VersionCalificacion.objects.filter(calificacion_id=pk, base=True, version__lte=desde)
+        .order_by('-version').values('version')[:1]
+    )
+    return (
+        VersionCalificacion.objects.filter(calificacion_id=pk, version__gte=base, version__lte=hasta)
+        .order_by('version').values_list('version', 'base', 'campos', 'factores', 'fecha', 'usuario__nombre', 'accion')
+    )
+
+
+def _reproducir(pk, filas, pedidas):
+    """Aplica `filas` en orden y retorna {version: estado} de las versiones `pedidas`."""
+    estados = {}
+    campos = vector = siguiente = None
+    for version, base, cambios, factores, fecha, usuario, accion in filas:
+        if base:
+            campos, vector = {}, vector_vacio()
+        elif version != siguiente:
+            campos = vector = None  # Hueco en el historial: las versiones que siguen no se pueden armar
+        if vector is not None:
+            campos.update(cambios)
+            aplicar_delta(vector, factores)
+            if version in pedidas:
+                estados[version] = {
+                    'version': version, 'fecha': fecha, 'usuario': usuario, 'accion': accion,
+                    'campos': _leer_campos(campos), 'factores': list(vector),
+                }
+        siguiente = version + 1
+    for version in pedidas:
+        if version not in estados:
+            raise VersionNoDisponible(pk, version)
+    return estados
+
+
+def estado_version(calificacion, version):
+    """
+    Estado de la calificación en `version`: {'version', 'fecha', 'usuario',
+    'accion', 'campos', 'factores'}. Lanza VersionNoDisponible.
+    """
+    pk = _pk(calificacion)
+    return _reproducir(pk, _filas(pk, version, version), {version})[version]
+
+
+def estado_actual(calificacion):
+    """Estado vigente, directo de Calificacion y del vector de factores (sin recorrer el historial)."""
+    if not isinstance(calificacion, Calificacion):
+        calificacion = Calificacion.objects.only('version', *CAMPOS).get(pk=calificacion)
+    return {
+        'version': calificacion.version, 'fecha': None, 'usuario': None, 'accion': '',
+        'campos': campos_de(calificacion), 'factores': leer_factores_lote([calificacion.pk])[calificacion.pk],
+    }
+
+
+def historial(calificacion, limite=20):
+    """Últimas `limite` versiones, de la más nueva a la más antigua (una consulta)."""
+    filas = (
+        VersionCalificacion.objects.filter(calificacion_id=_pk(calificacion)).order_by('-version')
+        .values_list('version', 'base', 'campos', 'factores', 'fecha', 'usuario__nombre', 'accion')[:limite]
+    )
+    return [
+        {
+            'version': version, 'base': base, 'fecha': fecha, 'usuario': usuario, 'accion': accion,
+            # En una base no se sabe qué cambió: no hay versión anterior con que comparar
+            'campos': None if base else sorted(campos), 'factores': None if base else factores_cambiados(factores),
+        }
+        for version, base, campos, factores, fecha, usuario, accion in filas
+    ]
+
+
+def diferencias(calificacion, desde, hasta=None):
+    """
+    Diferencias entre las versiones `desde` y `hasta` (por omisión, la
+    vigente): {'antes', 'despues' (estados), 'campos' [(nombre, antes,
+    después)] de los que cambiaron, 'factores' (ver factores.comparar_factores),
+    'cambios'}. Lanza VersionNoDisponible.
+    """
+    pk = _pk(calificacion)
+    if hasta is None:
+        antes, despues = estado_version(pk, desde), estado_actual(calificacion)
+    elif hasta - desde <= INTERVALO_BASE:
+        # Cerca una de otra: ambas salen de la misma lectura
+        estados = _reproducir(pk, _filas(pk, desde, hasta), {desde, hasta})
+        antes, despues = estados[desde], estados[hasta]
+    else:
+        antes, despues = estado_version(pk, desde), estado_version(pk, hasta)
+
+    campos = [
+        (nombre, antes['campos'].get(nombre), despues['campos'].get(nombre))
+        for nombre in CAMPOS if antes['campos'].get(nombre) != despues['campos'].get(nombre)
+    ]
+    factores = comparar_factores(despues['factores'], antes['factores'])
+    return {
+        'antes': antes, 'despues': despues, 'campos': campos, 'factores': factores,
+        'cambios': len(campos) + sum(1 for *_, diferencia in factores if diferencia is not None),
+    }
@@ -1,17 +1,40 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
-from .forms import LoginForm , AdministradorUsuarioForm , CalificacionForm, get_calificacion_creation_formset, FactorFormSet, FactorForm, modelformset_factory
-from .models import Rol, Log, Calificacion, Factor
-from django.db.models import Q
+from .forms import LoginForm , AdministradorUsuarioForm , CalificacionForm, get_calificacion_creation_formset, get_factores_formset, valores_formset
+from .models import Rol, Log, Calificacion, Factor, ArchivoCarga, Notificacion
+from django.db.models import F, Q
 from .decorators import role_required 
 from Prototipo.models import UsuarioFinal 
 from django.contrib.auth.hashers import check_password ,make_password
 from django.db import transaction
 from decimal import Decimal, InvalidOperation
 from django.contrib import messages
-import csv
+from django.views.decorators.http import require_GET, require_POST
+from django.urls import reverse
+from .tareas import encolar, ESTADOS_EN_CURSO
+from .factores import leer_factores, leer_factores_lote, guardar_factores, crear_factores_lote, vector_vacio, ConflictoVersion
+from .factores import factores_con_nombre, registrar_aprobacion, aprobacion_anterior, comparar_factores
+from .utils import NOMBRES_FACTORES
+from .paginacion import paginar, url_pagina
+from .busqueda import buscar_calificaciones, buscar_logs, ORDEN_RELEVANCIA
+from .auditoria import registrar_log
+from . import cache_vistas, versiones
+from .carga import validar_archivo, extension_archivo, ErrorFormatoArchivo, EXTENSIONES
+from .instrumentacion import presupuesto_consultas, metricas_vistas
+from .resumen import obtener_resumen, pendientes_por_corredor, registrar_cambio
+from .revision import revisar_lote, criterio_desde, CriterioInvalido, ConjuntoModificado
+from .notificaciones import notificar, marcar_todas_leidas, TIPO_REVISION
+from .retencion_logs import consultar_logs
+from .serializacion import EscritorCSV, fecha_hora, nulo, una_linea
+from .api import Pagina, ConsultaInvalida, consulta_desde, acepta_gzip, coincide, etag_http
+from .roles import resolver_rol
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+import datetime
 
 
 
@@ -85,7 +108,7 @@ def inicioSesion(request):
                 
                 # *** GENERAR LOG ***
                 rol_nombre = usuario.rol.nombre if usuario.rol else 'Sin Rol'
-                Log.objects.create(
+                registrar_log(
                     usuario=usuario,
                     accion='Inicio de Sesión Exitoso',
                     detalle_cambio=f'Usuario {usuario.nombre} ({rol_nombre}) ha iniciado sesión.'
@@ -117,7 +140,7 @@ def inicioSesion(request):
 
 @login_required 
 def cerrarSesion(request):
-    Log.objects.create(
+    registrar_log(
         usuario=request.user, 
         accion='Cierre de Sesión Exitoso',
         detalle_cambio=f'El usuario {request.user.nombre} ha cerrado sesión.'
@@ -134,53 +157,116 @@ def panel_administrador(request):
     context = {'usuarios': usuarios}
     return render(request, 'Prototipo/panel_administrador.html', context)
 
+def _resumen_html(request, rol):
+    """Contadores materializados (ver resumen.py): no dependen del tamaño de Calificacion."""
+    return cache_vistas.fragmento(
+        request, 'resumen', (rol,), (cache_vistas.CALIFICACIONES, cache_vistas.USUARIOS),
+        lambda: cache_vistas.renderizar('Prototipo/_resumen_calificaciones.html', {
+            'resumen': obtener_resumen(),
+            'pendientes_corredores': pendientes_por_corredor(),
+        })
+    )
+
+@presupuesto_consultas(8)
 @role_required(allowed_roles=['Auditor'])
 def panel_auditor(request):
-    # 1. Obtener todas las calificaciones
-    calificaciones = Calificacion.objects.select_related('usuario_creador').order_by('-fecha_creacion')
-    
-    # 2. Obtener el historial de logs (ejemplo: los últimos 100)
-    logs = Log.objects.all().select_related('usuario').order_by('-fecha_hora')[:100]
-
-    # 3. Lógica de Filtros (Opcional pero recomendable)
+    # Cada bloque se guarda en caché por rol y parámetros (ver cache_vistas.py):
+    # con caché vigente la vista no consulta calificaciones ni logs
     busqueda_texto = request.GET.get('q')
-    if busqueda_texto:
-        calificaciones = calificaciones.filter(
-            Q(emisor__icontains=busqueda_texto) | Q(estado__icontains=busqueda_texto) | Q(usuario_creador__nombre__icontains=busqueda_texto)
-        )
-        # Opcional: Filtrar logs también
-        logs = logs.filter(
-            Q(accion__icontains=busqueda_texto) | Q(usuario__nombre__icontains=busqueda_texto) | Q(detalle_cambio__icontains=busqueda_texto)
-        )
+    partes = ('Auditor', sorted(request.GET.lists()))
+
+    def listado_calificaciones():
+        # 1. Base de las calificaciones; búsqueda de texto completo ordenada por relevancia (ver busqueda.py)
+        calificaciones = Calificacion.objects.select_related('usuario_creador')
+        orden = ('-fecha_creacion', '-id')
+        if busqueda_texto:
+            calificaciones = buscar_calificaciones(calificaciones, busqueda_texto)
+            orden = ORDEN_RELEVANCIA
+        # 2. Paginación por cursor (índice calif_fecha_id_idx)
+        calificaciones, cursor = paginar(calificaciones, orden, request.GET.get('cursor'))
+        return cache_vistas.renderizar('Prototipo/_panel_auditor_calificaciones.html', {
+            'calificaciones': calificaciones,
+            'siguiente_calificaciones': url_pagina(request, cursor=cursor) if cursor else None,
+            'primera_pagina': url_pagina(request, cursor=None, cursor_logs=None),
+        })
+
+    def historial_logs():
+        logs = Log.objects.select_related('usuario')
+        orden = ('-fecha_hora', '-id')
+        if busqueda_texto:
+            logs = buscar_logs(logs, busqueda_texto)
+            orden = ORDEN_RELEVANCIA
+        # Índice log_fecha_id_idx
+        logs, cursor = paginar(logs, orden, request.GET.get('cursor_logs'))
+        return cache_vistas.renderizar('Prototipo/_panel_auditor_logs.html', {
+            'logs': logs,
+            'siguiente_logs': url_pagina(request, cursor_logs=cursor) if cursor else None,
+        })
 
-    
     context = {
-        'calificaciones': calificaciones,
-        'logs': logs,
+        'resumen_html': _resumen_html(request, 'Auditor'),
+        'calificaciones_html': cache_vistas.fragmento(
+            request, 'panel_auditor_calificaciones', partes,
+            (cache_vistas.CALIFICACIONES, cache_vistas.USUARIOS), listado_calificaciones
+        ),
+        'logs_html': cache_vistas.fragmento(
+            request, 'panel_auditor_logs', partes, (cache_vistas.LOGS, cache_vistas.USUARIOS), historial_logs
+        ),
         'busqueda_texto_activo': busqueda_texto or '',
         'titulo': 'Panel de Auditoría y Revisión'
     }
     return render(request, 'Prototipo/panel_auditor.html', context)
 
+@presupuesto_consultas(5)
 @role_required(allowed_roles=['Corredor'])
 def panel_corredor(request):
-    calificaciones = Calificacion.objects.filter(usuario_creador=request.user).order_by('-fecha')
+    calificaciones = Calificacion.objects.filter(usuario_creador=request.user)
 
     # Lógica de filtros (similar a panel_administrador, si se desean)
     busqueda_texto = request.GET.get('q')
+    orden = ('-fecha_creacion', '-id')
     if busqueda_texto:
-        calificaciones = calificaciones.filter(
-            Q(emisor__icontains=busqueda_texto) | Q(estado__icontains=busqueda_texto)
-        )
+        calificaciones = buscar_calificaciones(calificaciones, busqueda_texto)
+        orden = ORDEN_RELEVANCIA
+
+    # Paginación por cursor (índice calif_usuario_fecha_id_idx)
+    calificaciones, cursor = paginar(calificaciones, orden, request.GET.get('cursor'))
     
     context = {
         'calificaciones': calificaciones,
+        'siguiente_calificaciones': url_pagina(request, cursor=cursor) if cursor else None,
+        'primera_pagina': url_pagina(request, cursor=None),
         'busqueda_texto_activo': busqueda_texto or '',
         'titulo': 'Gestión de Calificaciones Propias'
     }
     return render(request, 'Prototipo/panel_corredor.html', context)
 
 
+#----------------- Notificaciones (ver notificaciones.py) -----------------
+@presupuesto_consultas(5)
+@role_required(allowed_roles=['Corredor', 'Auditor', 'Administrador'])
+def notificaciones(request):
+    """Notificaciones del usuario, las más recientes primero (índice notif_usuario_id_idx)."""
+    lista, cursor = paginar(Notificacion.objects.filter(usuario=request.user), ('-id',), request.GET.get('cursor'))
+    context = {
+        'notificaciones': lista,
+        'siguiente_notificaciones': url_pagina(request, cursor=cursor) if cursor else None,
+        'primera_pagina': url_pagina(request, cursor=None),
+        'titulo': 'Mis Notificaciones',
+    }
+    return render(request, 'Prototipo/notificaciones.html', context)
+
+@presupuesto_consultas(4)
+@role_required(allowed_roles=['Corredor', 'Auditor', 'Administrador'])
+@require_POST
+def notificaciones_marcar_leidas(request):
+    """Marca todas las notificaciones del usuario como leídas con un solo UPDATE."""
+    cantidad = marcar_todas_leidas(request.user)
+    if cantidad:
+        messages.success(request, f"{cantidad} notificaciones marcadas como leídas.")
+    return redirect('Notificaciones')
+
+
 #----------------- Funcionalidad de Administrador: Gestión de Usuarios -----------------
 @role_required(allowed_roles=['Administrador'])
 def usuario_crear(request):
@@ -190,7 +276,7 @@ def usuario_crear(request):
             nuevo_usuario = form.save()
             
             # Log de Creación
-            Log.objects.create(
+            registrar_log(
                 usuario=request.user, # Usamos request.user (el Admin logueado)
                 accion='Creación de Usuario',
                 detalle_cambio=f'Admin creó al usuario: {nuevo_usuario.nombre} ({nuevo_usuario.email}).'
@@ -203,30 +289,39 @@ def usuario_crear(request):
     return render(request, 'Prototipo/usuario_form.html', context)
 
 # Listar todos los usuarios
+@presupuesto_consultas(7)
 @role_required(allowed_roles=['Administrador'])
 def panel_administrador(request):
-    # 1. Base del QuerySet
-    usuarios = UsuarioFinal.objects.all()
-    # 2. Lógica de Filtros
-    # --- Filtro por Rol ---
     filtro_rol = request.GET.get('rol')
-    if filtro_rol and filtro_rol != 'Todos':
-        usuarios = usuarios.filter(rol__nombre=filtro_rol) 
+    busqueda_texto = request.GET.get('q')
 
-    # --- Filtro por Nombre/Email (Búsqueda de Texto) ---
-    busqueda_texto = request.GET.get('q') 
-    if busqueda_texto:
-        usuarios = usuarios.filter(
-            Q(nombre__icontains=busqueda_texto) | Q(email__icontains=busqueda_texto)
-        )
-    # 3. Ordenamiento (Se aplica al final)
-    usuarios = usuarios.order_by('rol__nombre', 'nombre') 
-    # 4. Contexto
+    def tabla_usuarios():
+        # 1. Base del QuerySet (select_related: la plantilla muestra usuario.rol.nombre)
+        usuarios = UsuarioFinal.objects.select_related('rol')
+        # 2. Lógica de Filtros
+        # --- Filtro por Rol ---
+        if filtro_rol and filtro_rol != 'Todos':
+            usuarios = usuarios.filter(rol__nombre=filtro_rol)
+
+        # --- Filtro por Nombre/Email (Búsqueda de Texto) ---
+        if busqueda_texto:
+            usuarios = usuarios.filter(
+                Q(nombre__icontains=busqueda_texto) | Q(email__icontains=busqueda_texto)
+            )
+        # 3. Ordenamiento (Se aplica al final)
+        usuarios = usuarios.order_by('rol__nombre', 'nombre')
+        return cache_vistas.renderizar('Prototipo/_panel_administrador_usuarios.html', {'usuarios': usuarios})
+
+    # 4. Contexto (la tabla y el resumen se guardan en caché, ver cache_vistas.py)
     context = {
-        'usuarios': usuarios,
+        'usuarios_html': cache_vistas.fragmento(
+            request, 'panel_administrador_usuarios', ('Administrador', filtro_rol, busqueda_texto),
+            (cache_vistas.USUARIOS,), tabla_usuarios
+        ),
         'roles_disponibles': ['Administrador', 'Corredor', 'Auditor'],
         'filtro_rol_activo': filtro_rol,
-        'busqueda_texto_activo': busqueda_texto or '', 
+        'busqueda_texto_activo': busqueda_texto or '',
+        'resumen_html': _resumen_html(request, 'Administrador'),
     }
     return render(request, 'Prototipo/panel_administrador.html', context)
 
@@ -241,7 +336,7 @@ def usuario_editar(request, id_usuario):
         if form.is_valid():
             form.save()
             
-            Log.objects.create(
+            registrar_log(
                 usuario=request.user, # Usamos request.user
                 accion='Edición de Usuario',
                 detalle_cambio=f'Admin editó al usuario: {usuario.nombre} ({id_usuario}).'
@@ -267,7 +362,7 @@ def usuario_eliminar(request, id_usuario):
         usuario.delete()
         
         # Log de Eliminación
-        Log.objects.create(
+        registrar_log(
             usuario=request.user, # Usamos request.user
             accion='Eliminación de Usuario',
             detalle_cambio=f'Admin eliminó al usuario: {usuario_nombre} ({id_usuario}).'
@@ -278,6 +373,16 @@ def usuario_eliminar(request, id_usuario):
 
 
 #----------------- Funcionalidad de Corredor: Gestión de calificacion -----------------
+def _clave_duplicada(form, usuario):
+    """El formulario no incluye al corredor, así que la restricción calif_clave_natural_uniq se valida aquí."""
+    clave = {campo: form.cleaned_data[campo] for campo in Calificacion.CLAVE_NATURAL if campo != 'usuario_creador'}
+    if Calificacion.objects.filter(usuario_creador=usuario, **clave).exists():
+        form.add_error(None, 'Ya tiene una calificación del mismo instrumento, mercado, ejercicio, fecha de pago y '
+                             'secuencia de evento. Modifique la existente o use otra secuencia.')
+        return True
+    return False
+
+
 @role_required(allowed_roles=['Corredor']) # Asumiendo que solo los corredores pueden crear
 def calificacion_crear(request):
     """Maneja la creación de una nueva Calificación y sus 29 Factores asociados."""
@@ -288,7 +393,7 @@ def calificacion_crear(request):
 
     if request.method == 'POST':
         # Validar ambos formularios (Calificacion y Factores)
-        if CalificacionFormLocal.is_valid() and FactorFormSetLocal.is_valid():
+        if CalificacionFormLocal.is_valid() and FactorFormSetLocal.is_valid() and not _clave_duplicada(CalificacionFormLocal, request.user):
             try:
                 # Usamos una transacción para asegurar que ambos (Calificacion y Factores) se guarden
                 with transaction.atomic():
@@ -303,17 +408,18 @@ def calificacion_crear(request):
                     # Guardamos la instancia de Calificación en la BD
                     calificacion.save()
 
-                    # 2. Asignar la Calificación (FK) a todos los Factores del formset
-                    factores = FactorFormSetLocal.save(commit=False)
-                    for factor in factores:
-                        factor.calificacion = calificacion
-                        factor.save()
+                    # 2. Grabar el vector de factores del formset (y la primera versión del historial)
+                    valores = valores_formset(FactorFormSetLocal)
+                    crear_factores_lote([(calificacion, valores)])
+                    versiones.registrar([versiones.Cambio(
+                        calificacion.pk, calificacion.version, versiones.campos_de(calificacion), valores
+                    )], request.user, 'Creación de Calificación')
                     
                     # 3. Registrar en el Log
-                    Log.objects.create(
+                    registrar_log(
                         usuario=request.user,
                         accion='Creación de Calificación',
-                        detalle_cambio=f'Corredor creó la calificación: {calificacion.emisor} ({calificacion.pk}).'
+                        detalle_cambio=f'Corredor creó la calificación: {calificacion.instrumento} ({calificacion.pk}).'
                     )
 
                     messages.success(request, "¡Calificación tributaria ingresada exitosamente!")
@@ -326,6 +432,8 @@ def calificacion_crear(request):
         else:
             # Si el formulario o el formset no es válido
             messages.error(request, "Por favor, revise los errores en el formulario.")
+            for error in CalificacionFormLocal.non_field_errors():
+                messages.error(request, error)
             
     # Para solicitudes GET o POST con errores
     context = {
@@ -335,34 +443,59 @@ def calificacion_crear(request):
     }
     return render(request, 'Prototipo/ingresoTributaria.html', context)
 
+# El historial de versiones suma el vector previo, la última versión registrada, la
+# inserción y, cuando toca una base, el estado completo (ver versiones.py)
+@presupuesto_consultas(16)
 @role_required(allowed_roles=['Corredor'])
 def calificacion_factores_editar(request, pk):
     # 1. Asegurar que la Calificación existe y pertenece al usuario
     calificacion = get_object_or_404(Calificacion, pk=pk, usuario_creador=request.user)
-    
-    # 2. Obtener los 29 Factores relacionados
-    factores_qs = Factor.objects.filter(calificacion=calificacion).order_by('nombre')
-    
-    # 3. Crear el Formset con la lista de Factores
-    formset = FactorFormSet(request.POST or None, queryset=factores_qs)
+    conflicto = False
 
     if request.method == 'POST':
+        # En el POST los valores vienen del formulario: no hace falta leer el vector actual
+        formset = get_factores_formset(vector_vacio(), data=request.POST)
         if formset.is_valid():
-            formset.save()
-            
-            # Log de Edición
-            Log.objects.create(
-                usuario=request.user,
-                accion='Edición de Factores',
-                detalle_cambio=f'Corredor editó los factores de la calificación: {calificacion.emisor} ({calificacion.pk}).'
-            )
-            
-            return redirect('PanelCorredor')
-    
+            valores = valores_formset(formset)
+            version = request.POST.get('version', '')
+            try:
+                # Sin la versión del formulario no se sabe sobre qué se editó: se trata como conflicto
+                if not version.isdecimal():
+                    raise ConflictoVersion(calificacion.pk, version)
+                with transaction.atomic():
+                    # El vector previo deja en el historial solo los factores que cambiaron
+                    anteriores = leer_factores(calificacion)
+                    nueva_version = guardar_factores(calificacion, valores, version=int(version))
+                    if nueva_version != int(version):
+                        versiones.registrar(
+                            [versiones.Cambio(calificacion.pk, nueva_version, factores=valores, anteriores=anteriores)],
+                            request.user, 'Edición de Factores'
+                        )
+            except ConflictoVersion:
+                # Otra edición se guardó primero: se muestran los valores vigentes y no se pisa nada
+                conflicto = True
+                calificacion.refresh_from_db(fields=['version'])
+            else:
+                if nueva_version == int(version):
+                    messages.info(request, "No hubo cambios en los factores.")
+                    return redirect('PanelCorredor')
+                # Log de Edición
+                registrar_log(
+                    usuario=request.user,
+                    accion='Edición de Factores',
+                    detalle_cambio=f'Corredor editó los factores de la calificación: {calificacion.instrumento} ({calificacion.pk}).'
+                )
+                return redirect('PanelCorredor')
+
+    if request.method != 'POST' or conflicto:
+        # 2. Obtener el vector de factores y crear el Formset
+        formset = get_factores_formset(leer_factores(calificacion))
+
     context = {
         'calificacion': calificacion, 
         'formset': formset,
-        'titulo': f'Editar Factores: {calificacion.emisor}'
+        'conflicto': conflicto,
+        'titulo': f'Editar Factores: {calificacion.instrumento}'
     }
     return render(request, 'Prototipo/calificacion_factores_form.html', context)
 
@@ -374,6 +507,9 @@ def calificacion_factores_editar(request, pk):
 
 # ... (código después de calificacion_factores_editar)
 
+# Aprobar registra además la versión: la última registrada, la inserción y, cuando
+# toca una base, el estado completo y el vector (ver versiones.py)
+@presupuesto_consultas(20)
 @role_required(allowed_roles=['Auditor'])
 def calificacion_revisar(request, pk):
     """
@@ -383,39 +519,44 @@ def calificacion_revisar(request, pk):
     # Usamos get_object_or_404 para la Calificacion
     calificacion = get_object_or_404(Calificacion.objects.select_related('usuario_creador'), pk=pk)
     
-    # Obtener los 29 Factores relacionados
-    factores_qs = Factor.objects.filter(calificacion=calificacion).order_by('nombre')
-    
     # 1. Preparar el Formulario de Estado/Aprobación (si lo necesitaras en el futuro)
     # Por ahora, solo usamos el modelo de calificación.
     
-    # 2. Crear un Formset DE SOLO LECTURA para los factores
-    # Reutilizaremos el FormSet, pero haremos que los campos no sean editables
-    FactorReadOnlyFormSet = modelformset_factory(
-        Factor,
-        form=FactorForm, 
-        extra=0, 
-        can_delete=False
-    )
-    
-    # Instanciamos con los datos del QS.
-    formset = FactorReadOnlyFormSet(queryset=factores_qs)
-
-    # Marcamos el formset como solo lectura
-    for form in formset:
-        for field in form.fields.values():
-            field.widget.attrs['readonly'] = True
-            field.widget.attrs['disabled'] = True # Deshabilita el campo para que no se envíe en el POST
-
     # Lógica de Aprobación/Rechazo (POST)
     if request.method == 'POST':
         estado_nuevo = request.POST.get('nuevo_estado')
         
         if estado_nuevo in ['Aprobada', 'Rechazada']:
+            # Versión que el auditor tenía en pantalla: si los factores cambiaron después, no se aprueba a ciegas
+            try:
+                version_revisada = int(request.POST.get('version', calificacion.version))
+            except ValueError:
+                version_revisada = calificacion.version
+            # UPDATE puntual: un save() completo pisaría la versión y los campos editados mientras tanto.
+            # La condición sobre el estado evita contar dos veces la misma revisión en el resumen.
+            with transaction.atomic():
+                cambiada = Calificacion.objects.filter(
+                    pk=calificacion.pk, estado=calificacion.estado, version=version_revisada
+                ).update(estado=estado_nuevo, version=F('version') + 1)
+                if cambiada:
+                    registrar_cambio(calificacion, estado=estado_nuevo)
+                    versiones.registrar(
+                        [versiones.Cambio(calificacion.pk, version_revisada + 1, {'estado': estado_nuevo})],
+                        request.user, f'Revisión de Calificación ({estado_nuevo})'
+                    )
+                    if estado_nuevo == 'Aprobada':
+                        # Copia de lo aprobado, para comparar las revisiones siguientes
+                        registrar_aprobacion(calificacion, version_revisada + 1, request.user)
+                    notificar([(
+                        calificacion.usuario_creador_id,
+                        f"El auditor {request.user.nombre} marcó su calificación {calificacion.instrumento} ({calificacion.pk}) como '{estado_nuevo}'."
+                    )], TIPO_REVISION)
+            if not cambiada:
+                messages.warning(request, "La calificación cambió mientras la revisaba. Revísela nuevamente.")
+                return redirect('CalificacionRevisar', pk=calificacion.pk)
             calificacion.estado = estado_nuevo
-            calificacion.save()
             
-            Log.objects.create(
+            registrar_log(
                 usuario=request.user,
                 accion=f'Revisión de Calificación ({estado_nuevo})',
                 detalle_cambio=f'Auditor {request.user.nombre} cambió el estado de {calificacion.instrumento} ({calificacion.pk}) a {estado_nuevo}.'
@@ -425,17 +566,92 @@ def calificacion_revisar(request, pk):
         else:
             messages.error(request, "Estado de revisión no válido.")
 
+    # 2. Factores de solo lectura (sólo si se van a mostrar: el POST exitoso redirige).
+    # Se muestran directo desde el vector, sin formset, con el historial de versiones.
+    # Con ?comparar=1, junto a la última versión aprobada; con ?desde=N, junto a la
+    # versión N (ver versiones.py). El HTML se guarda en caché por calificación y versión
+    comparar = request.GET.get('comparar') == '1'
+    try:
+        desde = int(request.GET['desde'])
+    except (KeyError, ValueError):
+        desde = None
+
+    def factores_solo_lectura():
+        anterior = aprobacion_anterior(calificacion, calificacion.version)
+        contexto = {
+            'anterior': anterior, 'desde': desde, 'version_actual': calificacion.version,
+            'historial': versiones.historial(calificacion),
+        }
+        if desde is not None or (comparar and anterior):
+            contexto['comparacion'] = _comparacion_revision(calificacion, desde, anterior)
+        if not contexto.get('comparacion'):
+            contexto['factores'] = factores_con_nombre(leer_factores(calificacion))
+        return cache_vistas.renderizar('Prototipo/_factores_solo_lectura.html', contexto)
 
-    
     context = {
-        'calificacion': calificacion, 
-        'formset': formset,
+        'calificacion': calificacion,
+        'factores_html': cache_vistas.fragmento(
+            request, 'factores', (calificacion.pk, calificacion.version, comparar, desde),
+            (cache_vistas.de_calificacion(calificacion.pk),), factores_solo_lectura
+        ),
         'titulo': f'Revisión de Calificación: {calificacion.instrumento}',
         'readonly': True # Indicador para el template
     }
     return render(request, 'Prototipo/calificacion_revisar.html', context)
 
 
+
+def _comparacion_revision(calificacion, desde, aprobada):
+    """
+    Diferencias de la versión vigente con la versión `desde` o, sin ella, con
+    la última aprobada. None si `desde` no está en el historial.
+    """
+    try:
+        comparacion = versiones.diferencias(calificacion, aprobada['version'] if desde is None else desde)
+    except versiones.VersionNoDisponible:
+        if desde is not None:
+            return None
+        # Aprobada antes de que existiera el historial: se compara con la copia de la aprobación
+        filas = comparar_factores(leer_factores(calificacion), aprobada['valores'])
+        comparacion = {
+            'antes': {'version': aprobada['version'], 'fecha': aprobada['fecha'], 'usuario': aprobada['auditor']},
+            'campos': [], 'factores': filas, 'cambios': sum(1 for *_, diferencia in filas if diferencia is not None),
+        }
+    comparacion['aprobada'] = aprobada is not None and comparacion['antes']['version'] == aprobada['version']
+    return comparacion
+
+
+# El costo no depende de cada fila sino de las combinaciones del resumen (dos UPDATE por
+# combinación movida) y de los lotes de 2000 aprobaciones y versiones (lectura + inserción en
+# PostgreSQL; SQLite parte cada inserción en lotes más chicos por su límite de parámetros)
+@presupuesto_consultas(120)
+@role_required(allowed_roles=['Auditor'])
+@require_POST
+def calificaciones_revisar_lote(request):
+    """
+    Aprueba o rechaza de una vez las calificaciones pendientes seleccionadas en
+    el panel (`ids`) o las de un criterio, p. ej. todo un archivo de carga
+    (`archivo_carga`). Ver revision.py.
+    """
+    estado_nuevo = request.POST.get('nuevo_estado')
+    try:
+        resultado = revisar_lote(request.user, estado_nuevo, criterio_desde(request.POST))
+    except CriterioInvalido as error:
+        messages.error(request, str(error))
+    except ConjuntoModificado:
+        messages.warning(request, "Las calificaciones cambiaron durante la revisión y no se aplicó ningún cambio. Intente nuevamente.")
+    else:
+        if resultado['revisadas']:
+            messages.success(
+                request,
+                f"{resultado['revisadas']} calificaciones marcadas como '{estado_nuevo}' "
+                f"({resultado['corredores']} corredores notificados)."
+            )
+        else:
+            messages.info(request, "No hay calificaciones pendientes que cumplan el criterio.")
+    return redirect('PanelAuditor')
+
+@presupuesto_consultas(4)
 @role_required(allowed_roles=['Auditor'])
 def panel_reportes(request):
     """
@@ -447,20 +663,32 @@ def panel_reportes(request):
     return render(request, 'Prototipo/panel_reportes.html', context)
 
 
-@role_required(allowed_roles=['Auditor'])
-def generar_reporte_calificaciones_csv(request):
-    """
-    Genera un reporte de todas las Calificaciones en formato CSV.
-    """
-    # 1. Configurar la respuesta HTTP para CSV
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="reporte_calificaciones.csv"'
+# --- Reportes CSV en streaming ---
+# Las filas se leen con values_list + iterator (cursor del lado del servidor en PostgreSQL)
+# y se envían por bloques a medida que se generan: la memoria no depende del tamaño de la tabla.
+# El formato de las columnas se compila una vez por reporte (ver serializacion.py).
+TAMANO_BLOQUE_REPORTE = 2000
+
 
-    # 2. Crear el escritor CSV
-    writer = csv.writer(response)
+def _bloques(iterable, tamano):
+    bloque = []
+    for elemento in iterable:
+        bloque.append(elemento)
+        if len(bloque) >= tamano:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
 
-    # 3. Encabezados del CSV
-    writer.writerow([
+
+def _respuesta_csv(filas, nombre_archivo):
+    response = StreamingHttpResponse(filas, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+    return response
+
+
+def _filas_reporte_calificaciones(con_factores):
+    encabezados = [
         'ID Calificacion', 
         'Instrumento', 
         'Mercado', 
@@ -470,89 +698,227 @@ def generar_reporte_calificaciones_csv(request):
         'Fecha Creacion', 
         'Usuario Creador', 
         'Email Creador'
+    ]
+    if con_factores:
+        encabezados += NOMBRES_FACTORES
+    # Ninguna columna necesita formato: csv.writer escribe str(valor), y el de una fecha es AAAA-MM-DD
+    escritor = EscritorCSV([None] * len(encabezados))
+    yield escritor.encabezado(encabezados)
+
+    filas = Calificacion.objects.order_by('-fecha_creacion', '-id').values_list(
+        'pk', 'instrumento', 'mercado', 'valor_historico', 'años', 'estado',
+        'fecha_creacion', 'usuario_creador__nombre', 'usuario_creador__email'
+    ).iterator(chunk_size=TAMANO_BLOQUE_REPORTE)
+
+    for bloque in _bloques(filas, TAMANO_BLOQUE_REPORTE):
+        # Los factores del bloque se leen en una sola consulta
+        if con_factores:
+            vectores = leer_factores_lote([fila[0] for fila in bloque])
+            bloque = [(*fila, *vectores[fila[0]]) for fila in bloque]
+        yield escritor.bloque(bloque)
+
+
+def _filas_reporte_logs(desde, hasta):
+    escritor = EscritorCSV([
+        None,
+        fecha_hora,
+        None,
+        # Manejar el caso donde el usuario es NULL (por models.SET_NULL)
+        nulo(str, 'N/A'),
+        lambda email: email or 'Sistema',
+        # Limpiar saltos de línea en el detalle para evitar problemas en el CSV
+        una_linea,
+    ])
+    yield escritor.encabezado([
+        'ID Log', 
+        'Fecha y Hora', 
+        'Accion', 
+        'Usuario ID', 
+        'Usuario Email', 
+        'Detalle del Cambio'
     ])
 
-    # 4. Obtener los datos y escribirlos
-    calificaciones = Calificacion.objects.select_related('usuario_creador').all().order_by('-fecha_creacion')
-    
-    for calificacion in calificaciones:
-        writer.writerow([
-            calificacion.pk,
-            calificacion.instrumento,
-            calificacion.mercado,
-            calificacion.valor_historico,
-            calificacion.años,
-            calificacion.estado,
-            calificacion.fecha_creacion.strftime('%Y-%m-%d %H:%M:%S'),
-            calificacion.usuario_creador.nombre,
-            calificacion.usuario_creador.email,
-        ])
-
-    # Opcional: Agregar el Log de la acción
-    Log.objects.create(
+    # Base y meses archivados en una sola secuencia (ver retencion_logs.py)
+    filas = consultar_logs(desde, hasta, tamano_bloque=TAMANO_BLOQUE_REPORTE)
+
+    for bloque in _bloques(filas, TAMANO_BLOQUE_REPORTE):
+        yield escritor.bloque(bloque)
+
+
+def _dia_reporte(valor, dias=0):
+    """Inicio del día `valor` (AAAA-MM-DD) más `dias`, en la zona horaria activa; None si no viene o no es válido."""
+    fecha = parse_date(valor or '') if valor else None
+    if fecha is None:
+        return None
+    return timezone.make_aware(datetime.datetime.combine(fecha + datetime.timedelta(days=dias), datetime.time.min))
+
+
+@role_required(allowed_roles=['Auditor'])
+def generar_reporte_calificaciones_csv(request):
+    """
+    Genera un reporte de todas las Calificaciones en formato CSV.
+    Con ?factores=1 agrega una columna por cada factor de la calificación.
+    """
+    con_factores = request.GET.get('factores') == '1'
+
+    registrar_log(
         usuario=request.user,
         accion='Generación de Reporte',
-        detalle_cambio=f'Auditor generó el Reporte CSV de Calificaciones.'
+        detalle_cambio=f'Auditor generó el Reporte CSV de Calificaciones{" con factores" if con_factores else ""}.'
     )
-    
-    return response
+
+    return _respuesta_csv(_filas_reporte_calificaciones(con_factores), 'reporte_calificaciones.csv')
 
 
 @role_required(allowed_roles=['Auditor'])
 def generar_reporte_logs_csv(request):
     """
-    Genera un reporte de todos los Logs de actividad en formato CSV.
+    Genera un reporte de los Logs de actividad en formato CSV, incluidos los
+    meses ya archivados. Con ?desde=AAAA-MM-DD y/o ?hasta=AAAA-MM-DD (inclusive)
+    solo lee ese rango: en PostgreSQL, solo las particiones de esos meses.
     """
-    # 1. Configurar la respuesta HTTP para CSV
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="reporte_logs_actividad.csv"'
-
-    # 2. Crear el escritor CSV
-    writer = csv.writer(response)
-
-    # 3. Encabezados del CSV
-    writer.writerow([
-        'ID Log', 
-        'Fecha y Hora', 
-        'Accion', 
-        'Usuario ID', 
-        'Usuario Email', 
-        'Detalle del Cambio'
-    ])
-
-    # 4. Obtener los datos y escribirlos
-    # Usamos select_related para obtener el usuario que realizó la acción
-    logs = Log.objects.select_related('usuario').all().order_by('-fecha_hora')
-    
-    for log in logs:
-        # Manejar el caso donde el usuario es NULL (por models.SET_NULL)
-        usuario_id = log.usuario.pk if log.usuario else 'N/A'
-        usuario_email = log.usuario.email if log.usuario else 'Sistema'
-        
-        writer.writerow([
-            log.pk,
-            log.fecha_hora.strftime('%Y-%m-%d %H:%M:%S'),
-            log.accion,
-            usuario_id,
-            usuario_email,
-            # Limpiar saltos de línea en el detalle para evitar problemas en el CSV
-            log.detalle_cambio.replace('\n', ' ').replace('\r', ' ') 
-        ])
-
-    # 5. Registrar la acción en el log del sistema
-    Log.objects.create(
+    try:
+        desde = _dia_reporte(request.GET.get('desde'))
+        hasta = _dia_reporte(request.GET.get('hasta'), dias=1)
+    except ValueError:
+        desde = hasta = None
+    rango = ''
+    if desde or hasta:
+        rango = f" ({request.GET.get('desde') or 'inicio'} a {request.GET.get('hasta') or 'hoy'})"
+
+    registrar_log(
         usuario=request.user,
         accion='Generación de Reporte',
-        detalle_cambio=f'Auditor generó el Reporte CSV de Logs de Actividad.'
+        detalle_cambio=f'Auditor generó el Reporte CSV de Logs de Actividad{rango}.'
     )
-    
-    return response
 
+    return _respuesta_csv(_filas_reporte_logs(desde, hasta), 'reporte_logs_actividad.csv')
 
 
+#----------------- Carga Masiva de Archivos -----------------
+@role_required(allowed_roles=['Corredor'])
+@require_POST
+def carga_archivo_procesar(request):
+    """
+    Recibe el archivo de carga masiva y lo deja en la cola de procesamiento.
+    La respuesta es inmediata; el avance se consulta en carga_archivo_estado.
+    """
+    archivo = request.FILES.get('archivo')
+    if archivo is None:
+        return JsonResponse({'error': 'Debe adjuntar un archivo.'}, status=400)
+    if extension_archivo(archivo.name) not in EXTENSIONES:
+        return JsonResponse({'error': 'Formato de archivo no soportado. Use CSV, .xlsx o .xls.'}, status=400)
+
+    with transaction.atomic():
+        archivo_carga = ArchivoCarga.objects.create(
+            cargado_por=request.user,
+            nombre=archivo.name[:100],
+            archivo=archivo,
+            estado='Pendiente'
+        )
+        registrar_log(
+            usuario=request.user,
+            accion='Carga de Archivo',
+            detalle_cambio=f'Corredor subió el archivo {archivo_carga.nombre} ({archivo_carga.pk}) para su procesamiento.'
+        )
+        encolar(archivo_carga)
 
+    return JsonResponse({
+        'archivo_carga': archivo_carga.pk,
+        'estado': archivo_carga.estado,
+        'url_estado': reverse('CargaArchivoEstado', args=[archivo_carga.pk]),
+    }, status=202)
+
+
+@presupuesto_consultas(3)
+@role_required(allowed_roles=['Corredor'])
+@require_POST
+def carga_archivo_validar(request):
+    """
+    Modo de prueba de la carga masiva: valida el archivo completo en el servidor
+    (formato, tipos, largos, fechas, obligatorios y suma de factores) y
+    responde con el informe de errores, sin grabar nada (ver carga.validar_archivo).
+    """
+    archivo = request.FILES.get('archivo')
+    if archivo is None:
+        return JsonResponse({'error': 'Debe adjuntar un archivo.'}, status=400)
+    if extension_archivo(archivo.name) not in EXTENSIONES:
+        return JsonResponse({'error': 'Formato de archivo no soportado. Use CSV, .xlsx o .xls.'}, status=400)
+
+    try:
+        resultado = validar_archivo(archivo)
+    except ErrorFormatoArchivo as error:
+        return JsonResponse({'valido': False, 'error': str(error)}, status=400)
+    return JsonResponse(resultado.como_dict())
+
+
+@presupuesto_consultas(4)
+@role_required(allowed_roles=['Corredor'])
+def carga_archivo_estado(request, pk):
+    """Estado y contadores de una carga, consultado periódicamente por cargaArchivo.js."""
+    archivo_carga = get_object_or_404(ArchivoCarga, pk=pk, cargado_por=request.user)
+    en_curso = archivo_carga.estado in ESTADOS_EN_CURSO
+
+    return JsonResponse({
+        'archivo_carga': archivo_carga.pk,
+        'estado': archivo_carga.estado,
+        'en_curso': en_curso,
+        'filas_procesadas': archivo_carga.filas_procesadas,
+        'filas_fallidas': archivo_carga.filas_fallidas,
+        'filas_insertadas': archivo_carga.filas_insertadas,
+        'filas_actualizadas': archivo_carga.filas_actualizadas,
+        'filas_sin_cambios': archivo_carga.filas_sin_cambios,
+        'errores': [] if en_curso else archivo_carga.errores,
+    })
+
+
+#----------------- API de lectura (ver api.py) -----------------
+@presupuesto_consultas(6)
+@role_required(allowed_roles=['Corredor', 'Auditor', 'Administrador'])
+@require_GET
+def api_calificaciones(request):
+    """
+    Calificaciones con sus factores en JSON, para sistemas externos: filtros,
+    campos a elección, cursor, gzip y ETag. El corredor solo ve las suyas.
+    Un sondeo con el ETag vigente en If-None-Match recibe 304 tras una consulta.
+    """
+    try:
+        filtros, campos, tamano = consulta_desde(request.GET)
+    except ConsultaInvalida as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    calificaciones = Calificacion.objects.all()
+    alcance = 'todas'
+    rol = getattr(request, 'rol', None) or resolver_rol(request.user)
+    if rol.nombre == 'Corredor':
+        calificaciones = calificaciones.filter(usuario_creador=request.user)
+        alcance = request.user.pk
+
+    pagina = Pagina(calificaciones, filtros, campos, tamano, request.GET.get('cursor'), alcance).buscar()
+    gzip = acepta_gzip(request)
+    if coincide(request, pagina.etag):
+        respuesta = HttpResponseNotModified()
+    else:
+        siguiente = request.build_absolute_uri(url_pagina(request, cursor=pagina.siguiente)) if pagina.siguiente else None
+        cuerpo = pagina.cuerpo(siguiente)
+        respuesta = HttpResponse(compress_string(cuerpo) if gzip else cuerpo, content_type='application/json')
+        if gzip:
+            respuesta['Content-Encoding'] = 'gzip'
+    respuesta['ETag'] = etag_http(pagina.etag, gzip)
+    # El cliente puede guardar la respuesta, pero debe revalidarla en cada sondeo
+    respuesta['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(respuesta, ('Accept-Encoding', 'Cookie'))
+    return respuesta
 
 
 def formato_archivo(request):
     """Vista para mostrar el formato del archivo de carga"""
     return render(request, 'Prototipo/formato_archivo.html')
+
+
+@role_required(allowed_roles=['Administrador'])
+def metricas(request):
+    """Consultas SQL y tiempos acumulados por vista en este proceso (ver instrumentacion.py)."""
+    if request.GET.get('reiniciar'):
+        metricas_vistas.reiniciar()
+    return JsonResponse({'vistas': metricas_vistas.resumen()})